@@ -8,24 +8,92 @@
 
 import logging
 import os
+import sys
+from collections import Counter
+from contextlib import nullcontext
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
 
 import click
 import numpy as np
 import pandas as pd
-import sentry_sdk
 from nowcasting_datamodel.connection import DatabaseConnection
 from nowcasting_datamodel.models.base import Base_Forecast
-from nowcasting_datamodel.models.gsp import GSPYield, GSPYieldSQL, LocationSQL
-from pvlive_api import PVLive
+from nowcasting_datamodel.models.gsp import GSPYieldSQL, LocationSQL
 from sqlalchemy.orm import Session
 
 import pvliveconsumer
+from pvliveconsumer.archive import write_archive
 from pvliveconsumer.backup import make_gsp_yields_from_national
-from pvliveconsumer.gsps import filter_gsps_which_have_new_data, get_gsps
+from pvliveconsumer.breaker import (
+    get_circuit_breaker_file,
+    get_retries,
+    is_open,
+    load_circuit_breaker,
+    make_circuit_breaker,
+    record_failure,
+    record_success,
+    save_circuit_breaker,
+)
+from pvliveconsumer.changes import filter_unchanged_gsp_yields, get_existing_gsp_yields
+from pvliveconsumer.checkpoint import (
+    complete_journal,
+    get_checkpoint_file,
+    is_same_window,
+    load_journal,
+    max_journal_ages,
+    record_committed,
+    start_journal,
+)
+from pvliveconsumer.deadgsps import is_dead, load_dead_gsps, record_pull, save_dead_gsps
+from pvliveconsumer.gsps import (
+    filter_gsps_which_have_new_data,
+    get_gsps,
+    get_publication_lags,
+    has_new_data,
+    order_gsps_by_priority,
+    shard_gsps,
+)
+from pvliveconsumer.ingest import (
+    columns_from_dataframe,
+    concat_columns,
+    fetch_gsp_yield_columns,
+    fetch_latest_datetimes,
+)
+from pvliveconsumer.memory import log_memory_report, start_memory_tracking, stop_memory_tracking
+from pvliveconsumer.metrics import (
+    circuit_breaker_open,
+    export_metrics,
+    n_failed_gsps,
+    national_commit_latency_seconds,
+    observe_freshness,
+    rows_written,
+    stage_timer,
+    wasted_requests,
+)
 from pvliveconsumer.nightime import make_night_time_zeros
+from pvliveconsumer.profiling import profile as profile_run
+from pvliveconsumer.report import (
+    get_n_retries,
+    record_backup,
+    record_changes,
+    record_circuit_breaker,
+    record_counts,
+    record_failed_gsps,
+    record_fetch,
+    record_fetch_error,
+    record_n_wasted_requests,
+    record_night_time_zeros,
+    record_probe,
+    record_save_error,
+    record_status,
+    start_report,
+    write_report,
+)
 from pvliveconsumer.time import check_uk_london_hour
+from pvliveconsumer.tracing import init_sentry, span, transaction
+from pvliveconsumer.transform import make_gsp_yields_sql, transform_gsp_yields
 
 logging.basicConfig(
     level=getattr(logging, os.getenv("LOGLEVEL", "DEBUG")),
@@ -33,16 +101,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-sentry_sdk.init(
-    dsn=os.getenv("SENTRY_DSN"), environment=os.getenv("ENVIRONMENT", "local"), traces_sample_rate=1
-)
-
-sentry_sdk.set_tag("app_name", "GSP_consumer")
-sentry_sdk.set_tag("version", pvliveconsumer.__version__)
+init_sentry()
 
 pvlive_domain_url = os.getenv("PVLIVE_DOMAIN_URL", "api.pvlive.uk")
-# ignore these gsp ids from PVLive as they are no longer used
+# these gsp ids are no longer used by PVLive. They start off as dead in the dead gsp cache,
+# and are not pulled in backfills
 ignore_gsp_ids = [5, 17, 53, 75, 139, 140, 143, 157, 163, 225, 310]
+# exit code when some gsps failed, but everything else was saved
+partial_success_exit_code = 3
 
 
 @click.command()
@@ -53,6 +119,14 @@ ignore_gsp_ids = [5, 17, 53, 75, 139, 140, 143, 157, 163, 225, 310]
     help="The Database URL where forecasts will be saved",
     type=click.STRING,
 )
+@click.option(
+    "--db-read-url",
+    default=None,
+    envvar="DB_READ_URL",
+    help="Optional Database URL of a read replica. The GSPs and their latest data are read "
+    "from it, and everything else uses the main database",
+    type=click.STRING,
+)
 @click.option(
     "--regime",
     default="in-day",
@@ -82,12 +156,147 @@ ignore_gsp_ids = [5, 17, 53, 75, 139, 140, 143, 157, 163, 225, 310]
     "This is to solve clock change issues when running with cron in UTC.",
     type=click.INT,
 )
+@click.option(
+    "--batch-size",
+    default=50,
+    envvar="BATCH_SIZE",
+    help="Number of gsps to pull before saving to the database",
+    type=click.INT,
+)
+@click.option(
+    "--checkpoint-file",
+    default=None,
+    envvar="CHECKPOINT_FILE",
+    help="Checkpoint journal of the GSPs saved so far. "
+    "Defaults to a file for the regime in the temporary directory",
+    type=click.STRING,
+)
+@click.option(
+    "--resume",
+    default=False,
+    envvar="RESUME",
+    help="Resume the last run from the checkpoint journal, if it did not finish",
+    type=click.BOOL,
+    is_flag=True,
+)
+@click.option(
+    "--shard-index",
+    default=0,
+    envvar="SHARD_INDEX",
+    help="Index of this consumer, when the GSPs are split between several consumers",
+    type=click.INT,
+)
+@click.option(
+    "--shard-count",
+    default=1,
+    envvar="SHARD_COUNT",
+    help="Number of consumers the GSPs are split between",
+    type=click.INT,
+)
+@click.option(
+    "--shard-takeover-minutes",
+    default=None,
+    envvar="SHARD_TAKEOVER_MINUTES",
+    help="Optional, also pull GSPs from other shards that have had no new data for this long",
+    type=click.INT,
+)
+@click.option(
+    "--time-budget",
+    default=None,
+    envvar="TIME_BUDGET",
+    help="Optional time budget for the run in seconds. "
+    "After this, no more GSPs are pulled and what has been pulled is saved",
+    type=click.FLOAT,
+)
+@click.option(
+    "--profile",
+    default=None,
+    envvar="PROFILE",
+    help="Optional file to write a profile of the run to, as folded stacks for a flamegraph. "
+    "The hottest functions are also logged",
+    type=click.STRING,
+)
+@click.option(
+    "--memory-profile",
+    default=False,
+    envvar="MEMORY_PROFILE",
+    help="Track the peak memory and the top allocations of each stage of the run, "
+    "and log them at the end",
+    type=click.BOOL,
+    is_flag=True,
+)
+@click.option(
+    "--report-file",
+    default=None,
+    envvar="RUN_REPORT_FILE",
+    help="Optional json file to write a summary report of the run to. "
+    "The report is always logged on one line at the end of the run",
+    type=click.STRING,
+)
+@click.option(
+    "--probe",
+    default=True,
+    envvar="PROBE",
+    help="For in-day runs, first ask PVLive for its latest national value, "
+    "and skip pulling the GSPs if it is not newer than the data we already have",
+    type=click.BOOL,
+)
+@click.option(
+    "--archive-dir",
+    default=None,
+    envvar="ARCHIVE_DIR",
+    help="Optional folder to archive the raw PVLive data in, as parquet partitioned by "
+    "regime and date. The archive can be replayed into the database with "
+    "'python -m pvliveconsumer.replay'",
+    type=click.STRING,
+)
+@click.option(
+    "--location-snapshot-file",
+    default=None,
+    envvar="LOCATION_SNAPSHOT_FILE",
+    help="Optional json snapshot of the GSP locations, used instead of loading them from the "
+    "database each run. It is checked against the database, and rebuilt if they have changed",
+    type=click.STRING,
+)
+@click.option(
+    "--dead-gsp-file",
+    default=None,
+    envvar="DEAD_GSP_FILE",
+    help="Optional json cache of the GSPs that PVLive has had no data for. These are only "
+    "probed now and again, rather than pulled every run",
+    type=click.STRING,
+)
+@click.option(
+    "--circuit-breaker-file",
+    default=None,
+    envvar="CIRCUIT_BREAKER_FILE",
+    help="Json file of the circuit breaker state, so that if PVLive was down "
+    "in the last run, only one request is tried before using the backup. "
+    "Defaults to a file in the temporary directory",
+    type=click.STRING,
+)
 def app(
     db_url: str,
     regime: str = "in-day",
     n_gsps: int = 342,
     include_national: bool = True,
     uk_london_time_hour: Optional[int] = None,
+    batch_size: int = 50,
+    checkpoint_file: Optional[str] = None,
+    resume: bool = False,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    shard_takeover_minutes: Optional[int] = None,
+    time_budget: Optional[float] = None,
+    profile: Optional[str] = None,
+    memory_profile: bool = False,
+    report_file: Optional[str] = None,
+    probe: bool = True,
+    archive_dir: Optional[str] = None,
+    location_snapshot_file: Optional[str] = None,
+    db_read_url: Optional[str] = None,
+    dead_gsp_file: Optional[str] = None,
+    circuit_breaker_file: Optional[str] = None,
 ):
     """
     Run GSP consumer app, this collect GSP live data and save it to a database.
@@ -98,8 +307,31 @@ def app(
     :param include_national: optional if to get national data or not
     :param uk_london_time_hour: Optionl to only run code if UK time hour matches code this value.
         This is to solve clock change issues when running with cron in UTC.
+    :param batch_size: number of gsps to pull before saving to the database
+    :param checkpoint_file: checkpoint journal of the GSPs saved so far
+    :param resume: resume the last run from the checkpoint journal, if it did not finish
+    :param shard_index: index of this consumer, when the GSPs are split between several consumers
+    :param shard_count: number of consumers the GSPs are split between
+    :param shard_takeover_minutes: optional, also pull GSPs from other shards
+        that have had no new data for this many minutes
+    :param time_budget: optional time budget for the run in seconds.
+        After this, no more GSPs are pulled and what has been pulled is saved
+    :param profile: optional file to write a profile of the run to
+    :param memory_profile: track the peak memory and the top allocations of each stage
+    :param report_file: optional json file to write a summary report of the run to
+    :param probe: for in-day runs, skip pulling the GSPs if PVLive has no new data
+    :param archive_dir: optional folder to archive the raw PVLive data in, as parquet
+    :param location_snapshot_file: optional json snapshot of the GSP locations
+    :param db_read_url: optional Database url of a read replica
+    :param dead_gsp_file: optional json cache of the GSPs that PVLive has had no data for
+    :param circuit_breaker_file: json file of the circuit breaker state,
+        defaults to a file in the temporary directory
     """
 
+    run_started = monotonic()
+    deadline = None if time_budget is None else run_started + time_budget
+    start_report(regime=regime)
+
     logger.info(f"Running GSP Consumer app ({pvliveconsumer.__version__}) for regime {regime}")
 
     if uk_london_time_hour is not None:
@@ -110,31 +342,217 @@ def app(
     include_national = bool(include_national)
     total_n_gsps = n_gsps + 1 if include_national else n_gsps
 
+    if memory_profile:
+        start_memory_tracking()
+
+    if circuit_breaker_file is None:
+        circuit_breaker_file = get_circuit_breaker_file()
+    circuit_breaker = load_circuit_breaker(circuit_breaker_file=circuit_breaker_file)
+    status = "failed"
+    failed_gsp_ids = []
+
     connection = DatabaseConnection(url=db_url, base=Base_Forecast, echo=True)
-    with connection.get_session() as session:
-        # 1. Read list of GSP systems (from local file)
-        # and get their refresh times (refresh times can also be stored locally)
-        logger.debug("Read list of GSP from database")
-        gsps = get_gsps(
-            session=session, n_gsps=n_gsps, regime=regime, include_national=include_national
+    read_connection = None
+    if db_read_url is not None:
+        read_connection = DatabaseConnection(url=db_read_url, base=Base_Forecast, echo=True)
+    try:
+        with (
+            profile_run(output_file=profile),
+            transaction(name="pvlive-consumer", op=regime),
+            connection.get_session() as session,
+            read_connection.get_session() if read_connection else nullcontext() as read_session,
+        ):
+            # 1. Read list of GSP systems (from local file)
+            # and get their refresh times (refresh times can also be stored locally)
+            logger.debug("Read list of GSP from database")
+            with stage_timer("get_gsps"):
+                gsps = get_gsps(
+                    session=session,
+                    n_gsps=n_gsps,
+                    regime=regime,
+                    include_national=include_national,
+                    snapshot_file=location_snapshot_file,
+                    read_session=read_session,
+                )
+            assert (
+                len(gsps) == total_n_gsps
+            ), f"There are {len(gsps)} GSPS, there should be {total_n_gsps}"
+
+            # only keep the gsps for this shard
+            takeover_after = None
+            if shard_takeover_minutes is not None:
+                takeover_after = timedelta(minutes=shard_takeover_minutes)
+            gsps = shard_gsps(
+                gsps=gsps,
+                shard_index=shard_index,
+                shard_count=shard_count,
+                takeover_after=takeover_after,
+            )
+
+            # 2. Find most recent entered data (for each GSP) in OCF database,
+            # and filter depending on refresh rate
+            logger.debug(
+                "Find most recent entered data (for each GSP) in OCF database,"
+                "and filter GSP depending on refresh rate"
+            )
+            with stage_timer("filter_gsps_which_have_new_data"):
+                publication_lags = get_publication_lags(
+                    session=session if read_session is None else read_session,
+                    gsps=gsps,
+                    regime=regime,
+                )
+                gsps = filter_gsps_which_have_new_data(
+                    gsps=gsps, publication_lags=publication_lags
+                )
+            assert (
+                len(gsps) <= total_n_gsps
+            ), f"There are {len(gsps)} GSPS, there should be <= {total_n_gsps}"
+
+            # pull the stalest and largest gsps first
+            gsps = order_gsps_by_priority(gsps=gsps)
+
+            # check PVLive has published anything new, before pulling each gsp
+            if probe and regime == "in-day" and len(gsps) > 0:
+                dead_gsps = load_dead_gsps(dead_gsp_file=dead_gsp_file, seed_gsp_ids=ignore_gsp_ids)
+                if not probe_for_new_data(
+                    gsps=gsps, dead_gsps=dead_gsps, circuit_breaker=circuit_breaker
+                ):
+                    status = "success"
+                    return
+
+            # 3. Pull data
+            if checkpoint_file is None:
+                checkpoint_file = get_checkpoint_file(regime=regime, shard_index=shard_index)
+            failed_gsp_ids = pull_data_and_save(
+                gsps=gsps,
+                session=session,
+                regime=regime,
+                batch_size=batch_size,
+                checkpoint_file=checkpoint_file,
+                resume=resume,
+                deadline=deadline,
+                run_started=run_started,
+                archive_dir=archive_dir,
+                dead_gsp_file=dead_gsp_file,
+                circuit_breaker=circuit_breaker,
+            )
+
+            # partial success if some gsps failed, or were not pulled as PVLive is down
+            if len(failed_gsp_ids) > 0 or is_open(circuit_breaker):
+                status = "partial"
+            else:
+                status = "success"
+    finally:
+        save_circuit_breaker(
+            circuit_breaker_file=circuit_breaker_file, circuit_breaker=circuit_breaker
+        )
+        circuit_breaker_open.set(int(is_open(circuit_breaker)))
+        n_failed_gsps.set(len(failed_gsp_ids))
+        record_circuit_breaker(state=circuit_breaker["state"])
+        record_failed_gsps(gsp_ids=failed_gsp_ids)
+        record_status(status=status)
+        if memory_profile:
+            log_memory_report()
+            stop_memory_tracking()
+        write_report(report_file=report_file)
+        export_metrics(regime=regime)
+
+    if status == "partial":
+        logger.error(
+            f"Run only partly succeeded, GSPs {failed_gsp_ids} failed and the circuit breaker "
+            f"is {circuit_breaker['state']}"
         )
-        assert (
-            len(gsps) == total_n_gsps
-        ), f"There are {len(gsps)} GSPS, there should be {total_n_gsps}"
-
-        # 2. Find most recent entered data (for each GSP) in OCF database,
-        # and filter depending on refresh rate
-        logger.debug(
-            "Find most recent entered data (for each GSP) in OCF database,"
-            "and filter GSP depending on refresh rate"
+        sys.exit(partial_success_exit_code)
+
+
+def probe_for_new_data(
+    gsps: List[LocationSQL],
+    dead_gsps: Optional[Dict[int, dict]] = None,
+    circuit_breaker: Optional[dict] = None,
+) -> bool:
+    """
+    Ask PVLive for its latest national value, to see if there is any new data for the gsps
+
+    Dead gsps are not checked, as PVLive has no data for them.
+    If the probe fails, we assume there is new data, so the gsps are still pulled,
+    unless the failure opens the circuit breaker.
+
+    :param gsps: list of gsps, with 'last_gsp_yield' attached
+    :param dead_gsps: optional dead gsp cache, from 'load_dead_gsps'
+    :param circuit_breaker: optional circuit breaker state, updated with the result of the probe
+    :return: if any gsp could have new data
+    """
+    if circuit_breaker is None:
+        circuit_breaker = make_circuit_breaker()
+
+    if dead_gsps is not None:
+        datetime_utc = datetime.now(timezone.utc)
+        gsps = [
+            gsp
+            for gsp in gsps
+            if not is_dead(dead_gsps=dead_gsps, gsp_id=gsp.gsp_id, datetime_utc=datetime_utc)
+        ]
+
+    with stage_timer("probe"):
+        try:
+            latest_datetime_utc, latest_updated_utc = fetch_latest_datetimes(
+                domain_url=pvlive_domain_url, retries=get_retries(circuit_breaker)
+            )
+        except Exception as e:
+            logger.warning(f"Could not probe PVLive for new data, so will pull all GSPs: {e}")
+            record_failure(circuit_breaker)
+            return True
+    record_success(circuit_breaker)
+
+    new_data = has_new_data(
+        gsps=gsps, latest_datetime_utc=latest_datetime_utc, latest_updated_utc=latest_updated_utc
+    )
+    record_probe(latest_datetime_utc=latest_datetime_utc, skipped=not new_data)
+    if not new_data:
+        logger.info(
+            f"PVLive latest data is for {latest_datetime_utc}, updated at {latest_updated_utc}, "
+            f"which we already have for all {len(gsps)} GSPs, so will not pull any data"
+        )
+
+    return new_data
+
+
+def record_wasted_requests(gsps: List[LocationSQL], n_written: Dict[int, int], regime: str):
+    """
+    Record the gsps that were pulled from PVLive, but had no new or revised gsp yields
+
+    :param gsps: the gsps that were pulled
+    :param n_written: the number of gsp yields written for each gsp id
+    :param regime: if its "in-day" or "day-after"
+    """
+    n_wasted = len([gsp for gsp in gsps if n_written.get(gsp.gsp_id, 0) == 0])
+    wasted_requests.labels(regime=regime).inc(n_wasted)
+    record_n_wasted_requests(n_wasted_requests=n_wasted)
+    if n_wasted > 0:
+        logger.debug(f"{n_wasted} out of {len(gsps)} GSPs pulled had no new data")
+
+
+def get_start_and_end(datetime_utc: datetime, regime: str) -> Tuple[datetime, datetime]:
+    """
+    Get the window of data to pull
+
+    :param datetime_utc: datetime now
+    :param regime: if its "in-day" or "day-after"
+    :return: start and end datetimes
+    """
+    if regime == "in-day":
+        backfill_hours = int(os.getenv("BACKFILL_HOURS", 2))
+        start = datetime_utc - timedelta(hours=backfill_hours)
+        end = datetime_utc + timedelta(minutes=30)
+    else:
+        start = datetime_utc.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(
+            hours=24
         )
-        gsps = filter_gsps_which_have_new_data(gsps=gsps)
-        assert (
-            len(gsps) <= total_n_gsps
-        ), f"There are {len(gsps)} GSPS, there should be <= {total_n_gsps}"
+        end = datetime_utc.replace(
+            hour=0, minute=0, second=1, microsecond=0
+        )  # so we include the last value
 
-        # 3. Pull data
-        pull_data_and_save(gsps=gsps, session=session, regime=regime)
+    return start, end
 
 
 def pull_data_and_save(
@@ -142,145 +560,567 @@ def pull_data_and_save(
     session: Session,
     datetime_utc: Optional[None] = None,
     regime: str = "in-day",
+    batch_size: int = 50,
+    checkpoint_file: Optional[str] = None,
+    resume: bool = False,
+    deadline: Optional[float] = None,
+    run_started: Optional[float] = None,
+    archive_dir: Optional[str] = None,
+    dead_gsp_file: Optional[str] = None,
+    circuit_breaker: Optional[dict] = None,
 ):
     """
     Pull the gsp yield data and save to database
 
+    The gsps are pulled in batches. Each batch is transformed in one go and saved to the
+    database, and then recorded in the checkpoint journal. National is in the first batch on its
+    own, so that it is saved as soon as possible.
+    If the circuit breaker opens, as PVLive is down, no more gsps are pulled and the gsp yields
+    are made from national straight away.
+    A gsp that fails to be pulled or saved does not stop the others being saved. It is tried
+    once more at the end of the run, if there is time left.
+
     :param gsps: list of gsps to save
     :param session: database sessions
-    :param provider: provider name
     :param datetime_utc: datetime now, this is optional
+    :param regime: if its "in-day" or "day-after"
+    :param batch_size: number of gsps to pull before saving to the database
+    :param checkpoint_file: optional checkpoint journal, so that a failed run can be resumed
+    :param resume: resume the last run from the checkpoint journal, if it did not finish
+    :param deadline: optional 'time.monotonic' deadline. After this no more gsps are pulled,
+        but the gsps already pulled are saved
+    :param run_started: optional 'time.monotonic' time the run started,
+        used to measure how long it takes for national to be saved
+    :param archive_dir: optional folder to archive the raw PVLive data in, as parquet
+    :param dead_gsp_file: optional json cache of the GSPs that PVLive has had no data for
+    :param circuit_breaker: optional circuit breaker state, from 'load_circuit_breaker'
+    :return: the gsp ids that failed, even after being tried again
     """
 
-    pvlive = PVLive(domain_url=pvlive_domain_url)
+    if run_started is None:
+        run_started = monotonic()
 
     if datetime_utc is None:
         datetime_utc = datetime.utcnow().replace(tzinfo=timezone.utc)  # add timezone
 
-    if regime == "in-day":
-        backfill_hours = int(os.getenv("BACKFILL_HOURS", 2))
-        start = datetime_utc - timedelta(hours=backfill_hours)
-        end = datetime_utc + timedelta(minutes=30)
-    else:
-        start = datetime_utc.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(
-            hours=24
+    start, end = get_start_and_end(datetime_utc=datetime_utc, regime=regime)
+
+    gsps_to_pull = gsps
+    if checkpoint_file is not None:
+        journal = None
+        if resume:
+            journal = load_journal(
+                checkpoint_file=checkpoint_file, regime=regime, max_age=max_journal_ages[regime]
+            )
+        if journal is not None and not is_same_window(journal=journal, start=start, end=end):
+            logger.info(
+                f"The last run was from {journal['start']} to {journal['end']}, "
+                f"and the window has moved on, so will not resume it"
+            )
+            journal = None
+        if journal is not None:
+            gsps_to_pull = [gsp for gsp in gsps if gsp.gsp_id not in journal["gsp_ids"]]
+            logger.info(
+                f"Resuming the last run from {start} to {end}, "
+                f"{len(journal['gsp_ids'])} GSPs were already saved"
+            )
+        else:
+            start_journal(checkpoint_file=checkpoint_file, regime=regime, start=start, end=end)
+
+    logger.info(f"Pulling data for {len(gsps_to_pull)} GSP for {datetime_utc}")
+
+    dead_gsps = load_dead_gsps(
+        dead_gsp_file=dead_gsp_file, seed_gsp_ids=ignore_gsp_ids, datetime_utc=datetime_utc
+    )
+
+    if circuit_breaker is None:
+        circuit_breaker = make_circuit_breaker()
+
+    saved_gsp_ids = []
+    deferred_gsps = []
+    for batch_gsps in make_batches(gsps=gsps_to_pull, batch_size=batch_size):
+        if is_open(circuit_breaker):
+            logger.warning(
+                f"Circuit breaker is open, so only pulled {len(saved_gsp_ids)} "
+                f"out of {len(gsps_to_pull)} GSPs, the rest are made from national"
+            )
+            break
+
+        if deadline is not None and monotonic() > deadline:
+            logger.warning(
+                f"Time budget has run out, so only pulled {len(saved_gsp_ids)} "
+                f"out of {len(gsps_to_pull)} GSPs"
+            )
+            break
+
+        batch_saved_gsp_ids, failed_gsps = pull_and_save_batch(
+            gsps=batch_gsps,
+            session=session,
+            start=start,
+            end=end,
+            regime=regime,
+            datetime_utc=datetime_utc,
+            dead_gsps=dead_gsps,
+            circuit_breaker=circuit_breaker,
+            deadline=deadline,
+            archive_dir=archive_dir,
         )
-        end = datetime_utc.replace(
-            hour=0, minute=0, second=1, microsecond=0
-        )  # so we include the last value
+        save_dead_gsps(dead_gsp_file=dead_gsp_file, dead_gsps=dead_gsps)
+        saved_gsp_ids += batch_saved_gsp_ids
+        deferred_gsps += failed_gsps
+        if checkpoint_file is not None:
+            record_committed(checkpoint_file=checkpoint_file, gsp_ids=batch_saved_gsp_ids)
 
-    logger.info(f"Pulling data for {len(gsps)} GSP for {datetime_utc}")
+        if batch_saved_gsp_ids == [0]:
+            national_commit_latency = monotonic() - run_started
+            national_commit_latency_seconds.set(national_commit_latency)
+            logger.info(f"National committed {national_commit_latency:.2f} seconds after start")
 
-    all_gsps_yields_sql = []
-    for gsp in gsps:
-        if gsp.gsp_id in ignore_gsp_ids:
-            continue
+    # try the gsps that failed once more, if there is time left
+    out_of_time = deadline is not None and monotonic() > deadline
+    if len(deferred_gsps) > 0 and not is_open(circuit_breaker) and not out_of_time:
+        logger.info(f"Retrying {len(deferred_gsps)} GSPs that failed")
+        retried_gsp_ids, _ = pull_and_save_batch(
+            gsps=deferred_gsps,
+            session=session,
+            start=start,
+            end=end,
+            regime=regime,
+            datetime_utc=datetime_utc,
+            dead_gsps=dead_gsps,
+            circuit_breaker=circuit_breaker,
+            deadline=deadline,
+            archive_dir=archive_dir,
+        )
+        save_dead_gsps(dead_gsp_file=dead_gsp_file, dead_gsps=dead_gsps)
+        saved_gsp_ids += retried_gsp_ids
+        if checkpoint_file is not None:
+            record_committed(checkpoint_file=checkpoint_file, gsp_ids=retried_gsp_ids)
+
+    failed_gsp_ids = [gsp.gsp_id for gsp in deferred_gsps if gsp.gsp_id not in saved_gsp_ids]
+    if len(failed_gsp_ids) > 0:
+        logger.error(f"Could not pull and save GSPs {failed_gsp_ids}")
+
+    # 5. check gsps data is avaialble.
+    # This uses the main database, not a read replica, as it must see the values just saved
+    with stage_timer("backup"):
+        extra_gsp_yields = make_gsp_yields_from_national(
+            session=session, start=start, end=end, regime=regime, locations=gsps
+        )
+    record_backup(n_gsp_yields=len(extra_gsp_yields))
+
+    # 6. Save to database - perhaps check no duplicate data. (for each GSP)
+    save_to_database(session=session, gsp_yields=extra_gsp_yields)
+
+    # keep the journal if not all the gsps were saved, so the run can be resumed
+    if checkpoint_file is not None and len(saved_gsp_ids) == len(gsps_to_pull):
+        complete_journal(checkpoint_file=checkpoint_file)
+
+    return failed_gsp_ids
 
-        gsp_yield_df: pd.DataFrame = pvlive.between(
+
+def pull_and_save_batch(
+    gsps: List[LocationSQL],
+    session: Session,
+    start: datetime,
+    end: datetime,
+    regime: str,
+    datetime_utc: datetime,
+    dead_gsps: Dict[int, dict],
+    circuit_breaker: dict,
+    deadline: Optional[float] = None,
+    archive_dir: Optional[str] = None,
+) -> Tuple[List[int], List[LocationSQL]]:
+    """
+    Pull a batch of gsps from PVLive, and save them to the database
+
+    :param gsps: list of gsps to pull
+    :param session: database session
+    :param start: start datetime
+    :param end: end datetime
+    :param regime: if its "in-day" or "day-after"
+    :param datetime_utc: the datetime now
+    :param dead_gsps: dead gsp cache, from 'load_dead_gsps'
+    :param circuit_breaker: circuit breaker state, from 'load_circuit_breaker'
+    :param deadline: optional 'time.monotonic' deadline, after this no more gsps are pulled
+    :param archive_dir: optional folder to archive the raw PVLive data in, as parquet
+    :return: the gsp ids that were saved, or skipped as they are dead,
+        and the gsps that could not be pulled or saved
+    """
+    # dont pull gsps that PVLive has had no data for, unless they are due to be probed
+    dead_gsp_ids = [
+        gsp.gsp_id
+        for gsp in gsps
+        if is_dead(dead_gsps=dead_gsps, gsp_id=gsp.gsp_id, datetime_utc=datetime_utc)
+    ]
+    fetch_gsps = [gsp for gsp in gsps if gsp.gsp_id not in dead_gsp_ids]
+    if len(dead_gsp_ids) > 0:
+        logger.debug(f"Skipping GSPs {dead_gsp_ids} as PVLive has had no data for them")
+
+    with stage_timer("fetch"):
+        all_gsp_yield_columns, pulled_gsps, fetch_failed_gsps = pull_gsp_yield_columns(
+            gsps=fetch_gsps,
             start=start,
             end=end,
-            entity_type="gsp",
-            entity_id=gsp.gsp_id,
-            dataframe=True,
-            extra_fields="installedcapacity_mwp,capacity_mwp,updated_gmt",
+            regime=regime,
+            deadline=deadline,
+            dead_gsps=dead_gsps,
+            datetime_utc=datetime_utc,
+            circuit_breaker=circuit_breaker,
         )
 
-        logger.debug(f"Processing GSP ID {gsp.gsp_id} ({gsp.label}), out of {len(gsps)}")
+    # 4. Save to database - perhaps check no duplicate data. (for each GSP)
+    n_written, save_failed_gsps = save_gsp_yield_columns(
+        gsp_yield_columns=all_gsp_yield_columns,
+        gsps=pulled_gsps,
+        session=session,
+        start=start,
+        end=end,
+        regime=regime,
+        archive_dir=archive_dir,
+    )
+    saved_gsps = [gsp for gsp in pulled_gsps if gsp not in save_failed_gsps]
+    record_wasted_requests(gsps=saved_gsps, n_written=n_written, regime=regime)
 
-        logger.debug(f"Got {len(gsp_yield_df)} gsp yield for gsp id {gsp.gsp_id} before filtering")
+    saved_gsp_ids = dead_gsp_ids + [gsp.gsp_id for gsp in saved_gsps]
+    return saved_gsp_ids, fetch_failed_gsps + save_failed_gsps
 
-        if len(gsp_yield_df) == 0:
-            logger.warning(
-                f"Did not find any data for {gsp.gsp_id} for {start} to {end}. "
-                f"Will try adding some nighttime zeros"
+
+def save_gsp_yield_columns(
+    gsp_yield_columns: List[Dict[str, np.ndarray]],
+    gsps: List[LocationSQL],
+    session: Session,
+    start: datetime,
+    end: datetime,
+    regime: str,
+    archive_dir: Optional[str] = None,
+) -> Tuple[Dict[int, int], List[LocationSQL]]:
+    """
+    Transform and save the data for all gsps in one go, or for each gsp on its own if that fails
+
+    This means one gsp with bad data does not stop the others being saved.
+
+    :param gsp_yield_columns: list of numpy columns, from 'pull_gsp_yield_columns'
+    :param gsps: list of gsps
+    :param session: database session
+    :param start: start datetime
+    :param end: end datetime
+    :param regime: if its "in-day" or "day-after"
+    :param archive_dir: optional folder to archive the raw PVLive data in, as parquet
+    :return: the number of gsp yields written for each gsp id, and the gsps that failed
+    """
+    try:
+        n_written = transform_and_save(
+            gsp_yield_columns=gsp_yield_columns,
+            gsps=gsps,
+            session=session,
+            start=start,
+            end=end,
+            regime=regime,
+            archive_dir=archive_dir,
+        )
+        return n_written, []
+    except Exception as e:
+        session.rollback()
+        logger.warning(f"Could not save {len(gsps)} GSPs in one go, so will save each one: {e}")
+
+    # the raw data has already been archived, so it is not archived again
+    columns_by_gsp_id = {int(columns["gsp_id"][0]): columns for columns in gsp_yield_columns}
+    n_written = {}
+    failed_gsps = []
+    for gsp in gsps:
+        if gsp.gsp_id not in columns_by_gsp_id:
+            continue
+
+        try:
+            n_written.update(
+                transform_gsp_yield_df_and_save(
+                    gsp_yield_df=concat_columns([columns_by_gsp_id[gsp.gsp_id]]),
+                    gsps=[gsp],
+                    session=session,
+                    start=start,
+                    end=end,
+                    regime=regime,
+                )
             )
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"Could not save the data for GSP {gsp.gsp_id}: {e}")
+            record_save_error(gsp_id=gsp.gsp_id, error=e)
+            failed_gsps.append(gsp)
 
-            gsp_yield_df = make_night_time_zeros(start, end, gsp, gsp_yield_df, regime)
+    return n_written, failed_gsps
 
-        if len(gsp_yield_df) == 0:
-            logger.warning(f"Did not find any data for {gsp.gsp_id} for {start} to {end}")
-        else:
-            # filter by datetime
-            gsp_yield_df = gsp_yield_df[gsp_yield_df["datetime_gmt"] >= start]
-            gsp_yield_df = gsp_yield_df[gsp_yield_df["datetime_gmt"] < end]
-
-            # filter by last
-            if gsp.last_gsp_yield is not None:
-                last_gsp_datetime = gsp.last_gsp_yield.datetime_utc.replace(tzinfo=timezone.utc)
-                gsp_yield_df = gsp_yield_df[gsp_yield_df["datetime_gmt"] > last_gsp_datetime]
-
-                if len(gsp_yield_df) == 0:
-                    logger.debug(
-                        f"No new data available after {last_gsp_datetime}. "
-                        f"Last data point was {last_gsp_datetime}"
-                    )
-                    continue
-            else:
-                logger.debug(f"This is the first lot gsp yield data for GSP {(gsp.gsp_id)}")
-
-            # capacity is zero, set nans to 0
-            if gsp_yield_df["capacity_mwp"].sum() == 0:
-                gsp_yield_df["generation_mw"] = 0
-
-            # drop nan value in generation_mw column if not all are nans
-            # this gets rid of last value if it is nan
-            if not gsp_yield_df["generation_mw"].isnull().all():
-                gsp_yield_df = gsp_yield_df.dropna(subset=["generation_mw"])
-
-            # need columns datetime_utc, solar_generation_kw
-            gsp_yield_df["solar_generation_kw"] = 1000 * gsp_yield_df["generation_mw"]
-            gsp_yield_df["datetime_utc"] = gsp_yield_df["datetime_gmt"]
-            gsp_yield_df["pvlive_updated_utc"] = pd.to_datetime(gsp_yield_df["updated_gmt"])
-            gsp_yield_df = gsp_yield_df[
-                [
-                    "solar_generation_kw",
-                    "datetime_utc",
-                    "installedcapacity_mwp",
-                    "capacity_mwp",
-                    "pvlive_updated_utc",
-                ]
-            ]
-            gsp_yield_df["regime"] = regime
-
-            # change to list of pydantic objects
-            gsp_yields = [GSPYield(**row) for row in gsp_yield_df.to_dict(orient="records")]
-
-            # change to sqlalamcy objects and add gsp systems
-            gsp_yields_sql = [gsp_yield.to_orm() for gsp_yield in gsp_yields]
-            for gsp_yield_sql in gsp_yields_sql:
-                gsp_yield_sql.location = gsp
-
-            # update installed capacity
-            if len(gsp_yield_df) > 0:
-                current_installed_capacity = gsp_yield_sql.location.installed_capacity_mw
-                new_installed_capacity = float(gsp_yield_df["installedcapacity_mwp"].iloc[0])
-                if current_installed_capacity != new_installed_capacity:
-                    # dont update if new_installed_capacity is nan
-                    if np.isnan(new_installed_capacity):
-                        logger.debug("New installed capacity is nan, will not update the capacity")
-                    else:
-                        logger.debug(
-                            f"Going to update the capacity from "
-                            f"{current_installed_capacity} to {new_installed_capacity}"
-                        )
-                        gsp_yield_sql.location.installed_capacity_mw = new_installed_capacity
-
-            logger.debug(f"Found {len(gsp_yields_sql)} gsp yield for GSPs {gsp.gsp_id}")
-
-            all_gsps_yields_sql = all_gsps_yields_sql + gsp_yields_sql
-
-            if len(all_gsps_yields_sql) > 100:
-                # 4. Save to database - perhaps check no duplicate data. (for each GSP)
-                save_to_database(session=session, gsp_yields=all_gsps_yields_sql)
-                all_gsps_yields_sql = []
-
-    # 5. check gsps data is avaialble
-    extra_gsp_yields = make_gsp_yields_from_national(
-        session=session, start=start, end=end, regime=regime, locations=gsps
+
+def make_batches(gsps: List[LocationSQL], batch_size: int) -> List[List[LocationSQL]]:
+    """
+    Split the gsps into batches, with national in a batch on its own at the start
+
+    National is needed first by the downstream forecasts,
+    so it is pulled and saved before any of the other gsps.
+
+    :param gsps: list of gsps
+    :param batch_size: the number of gsps in each batch
+    :return: list of batches of gsps
+    """
+    national_gsps = [gsp for gsp in gsps if gsp.gsp_id == 0]
+    regional_gsps = [gsp for gsp in gsps if gsp.gsp_id != 0]
+
+    batches = [national_gsps] if len(national_gsps) > 0 else []
+    for i in range(0, len(regional_gsps), batch_size):
+        batches.append(regional_gsps[i : i + batch_size])
+
+    return batches
+
+
+def pull_gsp_yield_columns(
+    gsps: List[LocationSQL],
+    start: datetime,
+    end: datetime,
+    regime: str,
+    deadline: Optional[float] = None,
+    dead_gsps: Optional[Dict[int, dict]] = None,
+    datetime_utc: Optional[datetime] = None,
+    circuit_breaker: Optional[dict] = None,
+) -> Tuple[List[Dict[str, np.ndarray]], List[LocationSQL], List[LocationSQL]]:
+    """
+    Pull the gsp yield data from PVLive, adding night time zeros if there is no data
+
+    Gsps that could not be fetched or processed are logged and returned separately. If fetching
+    opens the circuit breaker, no more gsps are pulled.
+
+    :param gsps: list of gsps to pull
+    :param start: start datetime
+    :param end: end datetime
+    :param regime: if its "in-day" or "day-after"
+    :param deadline: optional 'time.monotonic' deadline, after this no more gsps are pulled
+    :param dead_gsps: optional dead gsp cache, updated with if each gsp had data in the daytime
+    :param datetime_utc: the datetime now, used for the dead gsp cache
+    :param circuit_breaker: optional circuit breaker state, updated with the result of each fetch
+    :return: list of numpy columns, one for each gsp with data, the gsps that were pulled,
+        and the gsps that could not be fetched or processed
+    """
+    if datetime_utc is None:
+        datetime_utc = datetime.now(timezone.utc)
+
+    if circuit_breaker is None:
+        circuit_breaker = make_circuit_breaker()
+
+    all_gsp_yield_columns = []
+    pulled_gsps = []
+    failed_gsps = []
+    for gsp in gsps:
+        if deadline is not None and monotonic() > deadline:
+            break
+
+        if is_open(circuit_breaker):
+            break
+
+        fetch_started = monotonic()
+        retries_before = get_n_retries()
+        try:
+            with span(op="pvlive.fetch", description=f"GSP {gsp.gsp_id}"):
+                gsp_yield_columns = fetch_gsp_yield_columns(
+                    domain_url=pvlive_domain_url,
+                    gsp_id=gsp.gsp_id,
+                    start=start,
+                    end=end,
+                    retries=get_retries(circuit_breaker),
+                )
+        except Exception as e:
+            logger.warning(f"Could not fetch the data for GSP {gsp.gsp_id} from PVLive: {e}")
+            record_fetch_error(gsp_id=gsp.gsp_id, error=e)
+            record_failure(circuit_breaker)
+            failed_gsps.append(gsp)
+            continue
+        record_success(circuit_breaker)
+
+        n_gsp_yields = len(gsp_yield_columns["gsp_id"])
+        record_fetch(
+            gsp_id=gsp.gsp_id,
+            fetch_seconds=monotonic() - fetch_started,
+            n_received=n_gsp_yields,
+            retries=get_n_retries() - retries_before,
+        )
+
+        logger.debug(f"Processing GSP ID {gsp.gsp_id} ({gsp.label}), out of {len(gsps)}")
+
+        # PVLive did answer, so an error here does not count towards the circuit breaker
+        try:
+            gsp_yield_columns = process_gsp_yield_columns(
+                gsp_yield_columns=gsp_yield_columns,
+                gsp=gsp,
+                start=start,
+                end=end,
+                regime=regime,
+                dead_gsps=dead_gsps,
+                datetime_utc=datetime_utc,
+            )
+        except Exception as e:
+            logger.warning(f"Could not process the data for GSP {gsp.gsp_id}: {e}")
+            record_save_error(gsp_id=gsp.gsp_id, error=e)
+            failed_gsps.append(gsp)
+            continue
+
+        pulled_gsps.append(gsp)
+        if gsp_yield_columns is not None:
+            all_gsp_yield_columns.append(gsp_yield_columns)
+
+    return all_gsp_yield_columns, pulled_gsps, failed_gsps
+
+
+def process_gsp_yield_columns(
+    gsp_yield_columns: Dict[str, np.ndarray],
+    gsp: LocationSQL,
+    start: datetime,
+    end: datetime,
+    regime: str,
+    dead_gsps: Optional[Dict[int, dict]],
+    datetime_utc: datetime,
+) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Add night time zeros to the data of one gsp if it is empty, and update the dead gsp cache
+
+    :param gsp_yield_columns: numpy columns fetched from PVLive for the gsp
+    :param gsp: the gsp
+    :param start: start datetime
+    :param end: end datetime
+    :param regime: if its "in-day" or "day-after"
+    :param dead_gsps: optional dead gsp cache, updated with if the gsp had data in the daytime
+    :param datetime_utc: the datetime now, used for the dead gsp cache
+    :return: numpy columns, or None if there is no data for the gsp
+    """
+    n_gsp_yields = len(gsp_yield_columns["gsp_id"])
+    logger.debug(f"Got {n_gsp_yields} gsp yield for gsp id {gsp.gsp_id} before filtering")
+
+    if n_gsp_yields == 0:
+        logger.warning(
+            f"Did not find any data for {gsp.gsp_id} for {start} to {end}. "
+            f"Will try adding some nighttime zeros"
+        )
+
+        with stage_timer("night_time_zeros"):
+            gsp_yield_df = make_night_time_zeros(start, end, gsp, pd.DataFrame(), regime)
+        if len(gsp_yield_df) > 0:
+            gsp_yield_columns = columns_from_dataframe(gsp_yield_df, gsp_id=gsp.gsp_id)
+            n_gsp_yields = len(gsp_yield_df)
+            record_night_time_zeros(gsp_id=gsp.gsp_id, n_gsp_yields=n_gsp_yields)
+        elif dead_gsps is not None:
+            # there is no data in the daytime
+            record_pull(dead_gsps, gsp_id=gsp.gsp_id, has_data=False, datetime_utc=datetime_utc)
+    elif dead_gsps is not None:
+        record_pull(dead_gsps, gsp_id=gsp.gsp_id, has_data=True, datetime_utc=datetime_utc)
+
+    if n_gsp_yields == 0:
+        logger.warning(f"Did not find any data for {gsp.gsp_id} for {start} to {end}")
+        return None
+
+    return gsp_yield_columns
+
+
+def transform_and_save(
+    gsp_yield_columns: List[Dict[str, np.ndarray]],
+    gsps: List[LocationSQL],
+    session: Session,
+    start: datetime,
+    end: datetime,
+    regime: str,
+    archive_dir: Optional[str] = None,
+    update_capacity: bool = True,
+) -> Dict[int, int]:
+    """
+    Filter and reshape the data for all gsps in one go, and save the new values to the database
+
+    :param gsp_yield_columns: list of numpy columns, from 'pull_gsp_yield_columns'
+    :param gsps: list of gsps
+    :param session: database session
+    :param start: start datetime
+    :param end: end datetime
+    :param regime: if its "in-day" or "day-after"
+    :param archive_dir: optional folder to archive the raw PVLive data in, as parquet
+    :param update_capacity: update the installed capacity of the gsps from the data
+    :return: the number of gsp yields written for each gsp id. Gsps with none are not included
+    """
+    if len(gsp_yield_columns) == 0:
+        return {}
+
+    gsp_yield_df = concat_columns(gsp_yield_columns)
+
+    # the archive is only a copy, so it should never stop the data being saved
+    if archive_dir is not None:
+        with stage_timer("archive"):
+            try:
+                write_archive(archive_dir=archive_dir, gsp_yield_df=gsp_yield_df, regime=regime)
+            except Exception as e:
+                logger.warning(f"Could not archive the raw PVLive data to {archive_dir}: {e}")
+
+    return transform_gsp_yield_df_and_save(
+        gsp_yield_df=gsp_yield_df,
+        gsps=gsps,
+        session=session,
+        start=start,
+        end=end,
+        regime=regime,
+        update_capacity=update_capacity,
     )
 
-    # 6. Save to database - perhaps check no duplicate data. (for each GSP)
-    save_to_database(session=session, gsp_yields=extra_gsp_yields + all_gsps_yields_sql)
+
+def transform_gsp_yield_df_and_save(
+    gsp_yield_df: pd.DataFrame,
+    gsps: List[LocationSQL],
+    session: Session,
+    start: datetime,
+    end: datetime,
+    regime: str,
+    update_capacity: bool = True,
+) -> Dict[int, int]:
+    """
+    Transform raw PVLive data, and save the new and revised values to the database
+
+    :param gsp_yield_df: raw PVLive data, from 'concat_columns' or 'read_archive'
+    :param gsps: list of gsps
+    :param session: database session
+    :param start: start datetime
+    :param end: end datetime
+    :param regime: if its "in-day" or "day-after"
+    :param update_capacity: update the installed capacity of the gsps from the data.
+        This should be False for historical data, so the current capacity is kept
+    :return: the number of gsp yields written for each gsp id. Gsps with none are not included
+    """
+    with stage_timer("transform"):
+        gsp_yield_df = transform_gsp_yields(
+            gsp_yield_df=gsp_yield_df, start=start, end=end, regime=regime
+        )
+        record_counts(name="n_filtered", counts=gsp_yield_df["gsp_id"].value_counts().to_dict())
+
+        # only write gsp yields that are new, or have been revised by PVLive.
+        # This uses the main database, not a read replica, so nothing is written twice
+        existing_df = get_existing_gsp_yields(
+            session=session,
+            gsp_ids=[gsp.gsp_id for gsp in gsps],
+            start=start,
+            end=end,
+            regime=regime,
+        )
+        gsp_yield_df, counts = filter_unchanged_gsp_yields(
+            gsp_yield_df=gsp_yield_df, existing_df=existing_df
+        )
+        n_written = gsp_yield_df["gsp_id"].value_counts().to_dict()
+        record_counts(name="n_written", counts=n_written)
+        record_changes(counts=counts)
+    logger.info(
+        f"Found {counts['inserted']} new gsp yields, {counts['revised']} revised gsp yields "
+        f"and skipped {counts['skipped']} unchanged gsp yields"
+    )
+
+    with stage_timer("orm_build"):
+        gsp_yields_sql = make_gsp_yields_sql(
+            gsp_yield_df=gsp_yield_df, gsps=gsps, update_capacity=update_capacity
+        )
+
+    save_to_database(session=session, gsp_yields=gsp_yields_sql)
+
+    return n_written
 
 
 def save_to_database(session: Session, gsp_yields: List[GSPYieldSQL]):
@@ -292,8 +1132,22 @@ def save_to_database(session: Session, gsp_yields: List[GSPYieldSQL]):
     """
     logger.debug(f"Will be adding {len(gsp_yields)} gsp yield object to database")
 
-    session.add_all(gsp_yields)
-    session.commit()
+    # get the values for the metrics first, as committing expires the objects,
+    # and reading them afterwards would reload each one from the database
+    gsp_yield_values = [
+        (gsp_yield.regime, gsp_yield.datetime_utc, gsp_yield.pvlive_updated_utc)
+        for gsp_yield in gsp_yields
+    ]
+
+    with stage_timer("save_to_database"):
+        session.add_all(gsp_yields)
+        session.commit()
+    observe_freshness(
+        gsp_yield_values=gsp_yield_values, commit_datetime_utc=datetime.now(timezone.utc)
+    )
+
+    for regime, n_gsp_yields in Counter(regime for regime, _, _ in gsp_yield_values).items():
+        rows_written.labels(regime=regime).inc(n_gsp_yields)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+""" Archive of the raw PVLive data, as a parquet dataset
+
+Each batch of data pulled from PVLive is appended to the archive before it is transformed. This
+includes any night time zeros that were added when PVLive had no data. The dataset is partitioned
+by regime and the date of the data, like
+
+    <archive_dir>/regime=in-day/date=2025-04-21/<fetched time>-<id>-0.parquet
+
+so the data for a date range can be read back quickly, and replayed into the database without
+calling PVLive.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List
+from uuid import uuid4
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from pvliveconsumer.ingest import datetime_columns, float_columns
+
+logger = logging.getLogger(__name__)
+
+partitioning = ds.partitioning(
+    pa.schema([("regime", pa.string()), ("date", pa.string())]), flavor="hive"
+)
+
+
+def write_archive(
+    archive_dir: str, gsp_yield_df: pd.DataFrame, regime: str, fetched_utc: datetime = None
+):
+    """
+    Append raw PVLive data to the archive
+
+    :param archive_dir: the folder of the archive
+    :param gsp_yield_df: raw PVLive data, from 'concat_columns'
+    :param regime: if its "in-day" or "day-after"
+    :param fetched_utc: when the data was pulled, defaults to now
+    """
+    if len(gsp_yield_df) == 0:
+        return
+
+    if fetched_utc is None:
+        fetched_utc = datetime.now(timezone.utc)
+
+    archive_df = gsp_yield_df[["gsp_id"] + datetime_columns + float_columns].copy()
+    archive_df["fetched_utc"] = pd.Timestamp(fetched_utc)
+    archive_df["regime"] = regime
+    archive_df["date"] = archive_df["datetime_gmt"].dt.strftime("%Y-%m-%d")
+
+    table = pa.Table.from_pandas(archive_df, preserve_index=False)
+    pq.write_to_dataset(
+        table,
+        root_path=archive_dir,
+        partitioning=partitioning,
+        basename_template=f"{fetched_utc.strftime('%Y%m%dT%H%M%S')}-{uuid4().hex}-{{i}}.parquet",
+    )
+    logger.debug(f"Archived {len(archive_df)} raw gsp yields to {archive_dir}")
+
+
+def get_dates(start: datetime, end: datetime) -> List[str]:
+    """
+    Get the dates of the archive partitions that cover a time range
+
+    :param start: start datetime
+    :param end: end datetime
+    :return: list of dates, like '2025-04-21'
+    """
+    dates = []
+    date = start.date()
+    while date <= end.date():
+        dates.append(date.isoformat())
+        date += timedelta(days=1)
+    return dates
+
+
+def read_archive(archive_dir: str, regime: str, start: datetime, end: datetime) -> pd.DataFrame:
+    """
+    Read raw PVLive data from the archive
+
+    If a value was pulled several times, only the last one pulled is kept.
+
+    :param archive_dir: the folder of the archive
+    :param regime: if its "in-day" or "day-after"
+    :param start: start datetime, timezone aware
+    :param end: end datetime, timezone aware. Data before this is read
+    :return: dataframe like from 'concat_columns', ordered by gsp id and then latest first
+    """
+    columns = ["gsp_id"] + datetime_columns + float_columns
+
+    dataset = ds.dataset(archive_dir, format="parquet", partitioning=partitioning)
+    dates = get_dates(start=start, end=end)
+    table = dataset.to_table(
+        columns=columns + ["fetched_utc"],
+        filter=(ds.field("regime") == regime) & ds.field("date").isin(dates),
+    )
+    archive_df = table.to_pandas()
+
+    archive_df = archive_df[
+        (archive_df["datetime_gmt"] >= start) & (archive_df["datetime_gmt"] < end)
+    ]
+
+    # keep the last value pulled
+    archive_df = archive_df.sort_values("fetched_utc", kind="stable")
+    archive_df = archive_df.drop_duplicates(subset=["gsp_id", "datetime_gmt"], keep="last")
+
+    archive_df = archive_df.sort_values(["gsp_id", "datetime_gmt"], ascending=[True, False])
+    logger.debug(f"Read {len(archive_df)} raw gsp yields from {archive_dir} for {start} to {end}")
+
+    return archive_df[columns].reset_index(drop=True)
@@ -0,0 +1,270 @@
+""" Backfill historic gsp yields from PVLive
+
+The time range is split into chunks. For each chunk, all the gsps are pulled in parallel, and the
+next chunk is pulled while the current one is saved, so only two chunks are ever held in memory.
+After each chunk is saved it is recorded in a checkpoint journal. If the backfill is stopped, the
+same command resumes from the first chunk that was not saved.
+
+    python -m pvliveconsumer.backfill --regime=day-after --start=2024-01-01 --end=2025-01-01
+"""
+import logging
+import os
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import click
+from nowcasting_datamodel.connection import DatabaseConnection
+from nowcasting_datamodel.models.base import Base_Forecast
+from nowcasting_datamodel.models.gsp import LocationSQL
+from sqlalchemy.orm import Session
+
+from pvliveconsumer.app import ignore_gsp_ids, pvlive_domain_url, transform_and_save
+from pvliveconsumer.checkpoint import (
+    complete_journal,
+    load_journal,
+    record_chunk_committed,
+    start_journal,
+)
+from pvliveconsumer.gsps import get_gsps
+from pvliveconsumer.ingest import fetch_gsp_yield_columns
+
+logger = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option(
+    "--db-url",
+    default=None,
+    envvar="DB_URL",
+    help="The Database URL where gsp yields will be saved",
+    type=click.STRING,
+)
+@click.option(
+    "--regime",
+    default="day-after",
+    envvar="REGIME",
+    help="regime to backfill, either 'in-day' or 'day-after'",
+    type=click.STRING,
+)
+@click.option(
+    "--start",
+    help="Start of the backfill, in UTC",
+    type=click.DateTime(),
+    required=True,
+)
+@click.option(
+    "--end",
+    help="End of the backfill, in UTC. Data before this is pulled",
+    type=click.DateTime(),
+    required=True,
+)
+@click.option(
+    "--n-gsps",
+    default=342,
+    envvar="N_GSPS",
+    help="Number of gsps",
+    type=click.INT,
+)
+@click.option(
+    "--chunk-days",
+    default=7,
+    envvar="BACKFILL_CHUNK_DAYS",
+    help="Number of days pulled and saved in one go",
+    type=click.INT,
+)
+@click.option(
+    "--max-workers",
+    default=8,
+    envvar="BACKFILL_MAX_WORKERS",
+    help="Number of requests made to PVLive at the same time",
+    type=click.INT,
+)
+@click.option(
+    "--checkpoint-file",
+    default=None,
+    envvar="BACKFILL_CHECKPOINT_FILE",
+    help="Checkpoint journal of the chunks saved so far. "
+    "Defaults to a file for the regime in the temporary directory",
+    type=click.STRING,
+)
+@click.option(
+    "--archive-dir",
+    default=None,
+    envvar="ARCHIVE_DIR",
+    help="Optional folder to archive the raw PVLive data in, as parquet",
+    type=click.STRING,
+)
+def backfill(
+    db_url: str,
+    regime: str,
+    start: datetime,
+    end: datetime,
+    n_gsps: int = 342,
+    chunk_days: int = 7,
+    max_workers: int = 8,
+    checkpoint_file: Optional[str] = None,
+    archive_dir: Optional[str] = None,
+):
+    """
+    Backfill historic gsp yields from PVLive
+
+    :param db_url: the Database url to save the gsp yields to
+    :param regime: if its "in-day" or "day-after"
+    :param start: start of the backfill, in UTC
+    :param end: end of the backfill, in UTC
+    :param n_gsps: number of gsps, not including national
+    :param chunk_days: number of days pulled and saved in one go
+    :param max_workers: number of requests made to PVLive at the same time
+    :param checkpoint_file: checkpoint journal of the chunks saved so far
+    :param archive_dir: optional folder to archive the raw PVLive data in, as parquet
+    """
+    start = start.replace(tzinfo=timezone.utc)
+    end = end.replace(tzinfo=timezone.utc)
+
+    if checkpoint_file is None:
+        checkpoint_file = os.path.join(
+            tempfile.gettempdir(), f"pvliveconsumer-backfill-{regime}.jsonl"
+        )
+
+    connection = DatabaseConnection(url=db_url, base=Base_Forecast, echo=False)
+    with connection.get_session() as session:
+        gsps = get_gsps(session=session, n_gsps=n_gsps, regime=regime, include_national=True)
+        backfill_gsp_yields(
+            session=session,
+            gsps=gsps,
+            regime=regime,
+            start=start,
+            end=end,
+            chunk_days=chunk_days,
+            max_workers=max_workers,
+            checkpoint_file=checkpoint_file,
+            archive_dir=archive_dir,
+        )
+
+
+def make_chunks(start: datetime, end: datetime, chunk_days: int) -> List[Tuple[datetime, datetime]]:
+    """
+    Split a time range into chunks
+
+    :param start: start datetime
+    :param end: end datetime
+    :param chunk_days: number of days in each chunk
+    :return: list of (chunk start, chunk end)
+    """
+    chunks = []
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(end, chunk_start + timedelta(days=chunk_days))
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end
+    return chunks
+
+
+def submit_chunk(
+    executor: ThreadPoolExecutor,
+    gsps: List[LocationSQL],
+    chunk_start: datetime,
+    chunk_end: datetime,
+) -> List[Future]:
+    """
+    Start pulling a chunk for all gsps
+
+    :param executor: thread pool to pull the data with
+    :param gsps: list of gsps
+    :param chunk_start: start of the chunk
+    :param chunk_end: end of the chunk
+    :return: list of futures, one for each gsp, that give the numpy columns
+    """
+    return [
+        executor.submit(
+            fetch_gsp_yield_columns,
+            domain_url=pvlive_domain_url,
+            gsp_id=gsp.gsp_id,
+            start=chunk_start,
+            end=chunk_end,
+        )
+        for gsp in gsps
+        if gsp.gsp_id not in ignore_gsp_ids
+    ]
+
+
+def backfill_gsp_yields(
+    session: Session,
+    gsps: List[LocationSQL],
+    regime: str,
+    start: datetime,
+    end: datetime,
+    chunk_days: int = 7,
+    max_workers: int = 8,
+    checkpoint_file: Optional[str] = None,
+    archive_dir: Optional[str] = None,
+):
+    """
+    Pull gsp yields from PVLive for a time range, chunk by chunk, and save them to the database
+
+    :param session: database session
+    :param gsps: list of gsps
+    :param regime: if its "in-day" or "day-after"
+    :param start: start datetime, timezone aware
+    :param end: end datetime, timezone aware
+    :param chunk_days: number of days pulled and saved in one go
+    :param max_workers: number of requests made to PVLive at the same time
+    :param checkpoint_file: optional checkpoint journal, so that the backfill can be resumed
+    :param archive_dir: optional folder to archive the raw PVLive data in, as parquet
+    """
+    chunks = make_chunks(start=start, end=end, chunk_days=chunk_days)
+
+    if checkpoint_file is not None:
+        journal = load_journal(checkpoint_file=checkpoint_file, regime=regime, max_age=None)
+        if journal is not None and journal["start"] == start and journal["end"] == end:
+            chunks = [chunk for chunk in chunks if chunk[0] not in journal["chunk_starts"]]
+            logger.info(
+                f"Resuming the backfill from {start} to {end}, "
+                f"{len(journal['chunk_starts'])} chunks were already saved"
+            )
+        else:
+            start_journal(checkpoint_file=checkpoint_file, regime=regime, start=start, end=end)
+
+    logger.info(f"Backfilling {len(chunks)} chunks for {len(gsps)} GSPs from {start} to {end}")
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = submit_chunk(executor, gsps, *chunks[0]) if len(chunks) > 0 else []
+        for i, (chunk_start, chunk_end) in enumerate(chunks):
+            # pull the next chunk while this one is saved
+            next_futures = []
+            if i + 1 < len(chunks):
+                next_futures = submit_chunk(executor, gsps, *chunks[i + 1])
+
+            all_gsp_yield_columns = [future.result() for future in futures]
+            all_gsp_yield_columns = [
+                columns for columns in all_gsp_yield_columns if len(columns["gsp_id"]) > 0
+            ]
+            logger.info(f"Saving chunk {i + 1} of {len(chunks)}, from {chunk_start} to {chunk_end}")
+            transform_and_save(
+                gsp_yield_columns=all_gsp_yield_columns,
+                gsps=gsps,
+                session=session,
+                start=chunk_start,
+                end=chunk_end,
+                regime=regime,
+                archive_dir=archive_dir,
+                # the capacity of historical data is out of date
+                update_capacity=False,
+            )
+
+            if checkpoint_file is not None:
+                record_chunk_committed(checkpoint_file=checkpoint_file, chunk_start=chunk_start)
+
+            futures = next_futures
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if checkpoint_file is not None:
+        complete_journal(checkpoint_file=checkpoint_file)
+
+
+if __name__ == "__main__":
+    backfill()
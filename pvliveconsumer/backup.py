@@ -5,10 +5,14 @@ from datetime import datetime
 from typing import List, Optional
 
 from nowcasting_datamodel.models.gsp import GSPYieldSQL, LocationSQL
-from nowcasting_datamodel.read.read_gsp import get_gsp_yield
-from sqlalchemy import func
 from sqlalchemy.orm import Session
 
+from pvliveconsumer.queries import (
+    count_gsp_yields_in_regime_statement,
+    count_gsp_yields_statement,
+    gsp_yields_statement,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,22 +32,15 @@ def get_number_gsp_yields(
     :return: the number of gsp yields in that regime
     """
 
-    query = session.query(func.count(GSPYieldSQL.id))
-    query = query.join(LocationSQL)
-    query = query.where(LocationSQL.id == GSPYieldSQL.location_id)
-
-    # filter on regime
-    if regime is not None:
-        query = query.where(GSPYieldSQL.regime == regime)
-
-    # filter on time
-    query = query.where(GSPYieldSQL.datetime_utc >= start_datetime_utc)
-    query = query.where(GSPYieldSQL.datetime_utc <= end_datetime_utc)
+    parameters = {"start": start_datetime_utc, "end": end_datetime_utc}
+    if regime is None:
+        statement = count_gsp_yields_statement
+    else:
+        statement = count_gsp_yields_in_regime_statement
+        parameters["regime"] = regime
 
-    # dont include national
-    query = query.where(LocationSQL.gsp_id != 0)
-
-    n_gsp_yields_sql = query.all()[0][0]
+    # this doesnt include national
+    n_gsp_yields_sql = session.execute(statement, parameters).scalar_one()
 
     logger.debug(
         f"Found {n_gsp_yields_sql} GSP yields from "
@@ -83,9 +80,9 @@ def make_gsp_yields_from_national(
         return []
 
     # 2. load national results for the last hour
-    national_gsp_yields = get_gsp_yield(
-        session=session, gsp_ids=[0], start_datetime_utc=start, regime=regime, end_datetime_utc=end
-    )
+    national_gsp_yields = session.execute(
+        gsp_yields_statement, {"regime": regime, "start": start, "end": end, "gsp_ids": [0]}
+    ).scalars().all()
     logger.debug(
         f"Found {len(national_gsp_yields)} naional yields from {start} to {end} for {regime=}"
     )
@@ -0,0 +1,154 @@
+""" Circuit breaker for the requests to PVLive, so a PVLive outage does not take minutes
+
+The breaker starts off closed, and requests are made as normal. After 'n_failures_to_open'
+requests in a row have failed, it opens, and no more gsps are pulled in this run. The run goes
+straight on to making the gsp yields from national, as a backup.
+
+Once a request has failed, the next requests are made without retries, so the breaker opens
+after a few timeouts rather than a few rounds of retries.
+
+The state is kept in a json file, by default in the temporary directory. If the breaker was open
+at the end of the last run, the next run starts half open. The first request is then made without
+any retries. If it works the breaker is closed again, and if it fails the breaker opens again
+straight away.
+"""
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import Optional
+
+from pvliveconsumer.files import write_json_atomically
+
+logger = logging.getLogger(__name__)
+
+n_failures_to_open = int(os.getenv("CIRCUIT_BREAKER_FAILURES", 3))
+
+closed = "closed"
+open_ = "open"
+half_open = "half-open"
+
+
+def get_circuit_breaker_file() -> str:
+    """
+    Get the default circuit breaker state file
+
+    All regimes and shards share it, as they all make requests to the same PVLive.
+
+    :return: path of the state file
+    """
+    return os.path.join(tempfile.gettempdir(), "pvliveconsumer-circuit-breaker.json")
+
+
+def make_circuit_breaker() -> dict:
+    """
+    Make a closed circuit breaker
+
+    :return: circuit breaker state
+    """
+    return {"state": closed, "n_failures": 0, "opened_utc": None}
+
+
+def load_circuit_breaker(circuit_breaker_file: Optional[str]) -> dict:
+    """
+    Load the circuit breaker state from the last run
+
+    If the breaker was open, it is now half open.
+
+    :param circuit_breaker_file: optional path of the state file. If None, the breaker is closed
+    :return: circuit breaker state
+    """
+    circuit_breaker = make_circuit_breaker()
+    if circuit_breaker_file is None or not os.path.exists(circuit_breaker_file):
+        return circuit_breaker
+
+    try:
+        with open(circuit_breaker_file) as f:
+            circuit_breaker.update(json.load(f))
+    except Exception as e:
+        logger.warning(f"Could not read the circuit breaker state {circuit_breaker_file}: {e}")
+        return make_circuit_breaker()
+
+    if circuit_breaker["state"] != closed:
+        logger.info(
+            f"Circuit breaker was opened at {circuit_breaker['opened_utc']}, "
+            f"so will try one request to PVLive before pulling the GSPs"
+        )
+        circuit_breaker["state"] = half_open
+
+    return circuit_breaker
+
+
+def save_circuit_breaker(circuit_breaker_file: Optional[str], circuit_breaker: dict):
+    """
+    Save the circuit breaker state, for the next run
+
+    If it can not be saved, a warning is logged and the next run starts with a closed breaker.
+
+    :param circuit_breaker_file: optional path of the state file. If None, nothing is saved
+    :param circuit_breaker: circuit breaker state
+    """
+    if circuit_breaker_file is None:
+        return
+
+    try:
+        write_json_atomically(json_file=circuit_breaker_file, data=circuit_breaker)
+    except Exception as e:
+        logger.warning(f"Could not save the circuit breaker state {circuit_breaker_file}: {e}")
+
+
+def is_open(circuit_breaker: dict) -> bool:
+    """
+    Check if the circuit breaker is open, so no requests should be made
+
+    :param circuit_breaker: circuit breaker state
+    :return: if the breaker is open
+    """
+    return circuit_breaker["state"] == open_
+
+
+def get_retries(circuit_breaker: dict, retries: int = 3) -> int:
+    """
+    Get the number of retries for the next request
+
+    When the breaker is half open, or a request has already failed, there are no retries. So a
+    PVLive outage costs one request timeout per failure, until the breaker opens.
+
+    :param circuit_breaker: circuit breaker state
+    :param retries: number of retries when the breaker is closed
+    :return: number of retries
+    """
+    if circuit_breaker["state"] == half_open or circuit_breaker["n_failures"] > 0:
+        return 0
+
+    return retries
+
+
+def record_success(circuit_breaker: dict):
+    """
+    Record a request that worked, which closes the breaker
+
+    :param circuit_breaker: circuit breaker state
+    """
+    if circuit_breaker["state"] == half_open:
+        logger.info("Request to PVLive worked, so circuit breaker is closed again")
+
+    circuit_breaker.update(make_circuit_breaker())
+
+
+def record_failure(circuit_breaker: dict):
+    """
+    Record a request that failed, and open the breaker if too many have failed in a row
+
+    :param circuit_breaker: circuit breaker state
+    """
+    circuit_breaker["n_failures"] += 1
+
+    if circuit_breaker["state"] == half_open or circuit_breaker["n_failures"] >= n_failures_to_open:
+        logger.warning(
+            f"{circuit_breaker['n_failures']} requests to PVLive failed in a row, "
+            f"so circuit breaker is open and no more GSPs will be pulled"
+        )
+        circuit_breaker["state"] = open_
+        circuit_breaker["opened_utc"] = datetime.now(timezone.utc).isoformat()
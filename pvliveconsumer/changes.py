@@ -0,0 +1,111 @@
+""" Only write gsp yields that are new or have been revised by PVLive """
+import logging
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from pvliveconsumer.queries import existing_gsp_yields_statement
+
+logger = logging.getLogger(__name__)
+
+
+def get_existing_gsp_yields(
+    session: Session,
+    gsp_ids: List[int],
+    start: datetime,
+    end: datetime,
+    regime: str,
+) -> pd.DataFrame:
+    """
+    Get the gsp yields already in the database, in one query
+
+    If there are several values for one gsp and datetime, the most recently created is kept.
+
+    :param session: database session
+    :param gsp_ids: the gsp ids to get
+    :param start: start datetime
+    :param end: end datetime, not included
+    :param regime: if its "in-day" or "day-after"
+    :return: dataframe with columns 'gsp_id', 'datetime_utc', 'solar_generation_kw'
+        and 'pvlive_updated_utc'. The datetimes are in UTC
+    """
+
+    rows = session.execute(
+        existing_gsp_yields_statement,
+        {"regime": regime, "start": start, "end": end, "gsp_ids": gsp_ids},
+    ).all()
+    existing_df = pd.DataFrame(
+        rows,
+        columns=[
+            "gsp_id",
+            "datetime_utc",
+            "solar_generation_kw",
+            "pvlive_updated_utc",
+            "created_utc",
+        ],
+    )
+    logger.debug(f"Found {len(existing_df)} existing gsp yields from {start} to {end}")
+
+    # keep the latest value for each gsp and datetime
+    existing_df = existing_df.sort_values("created_utc")
+    existing_df = existing_df.drop_duplicates(subset=["gsp_id", "datetime_utc"], keep="last")
+
+    existing_df["datetime_utc"] = pd.to_datetime(existing_df["datetime_utc"], utc=True)
+    existing_df["pvlive_updated_utc"] = pd.to_datetime(
+        existing_df["pvlive_updated_utc"], utc=True
+    )
+    existing_df["solar_generation_kw"] = existing_df["solar_generation_kw"].astype(float)
+    existing_df["gsp_id"] = existing_df["gsp_id"].astype(np.int64)
+
+    return existing_df.drop(columns=["created_utc"])
+
+
+def filter_unchanged_gsp_yields(
+    gsp_yield_df: pd.DataFrame, existing_df: pd.DataFrame
+) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    Remove gsp yields that are already in the database with the same values
+
+    A gsp yield is
+    - 'inserted' if there is no value for that gsp and datetime yet
+    - 'revised' if the generation or 'pvlive_updated_utc' is different
+    - 'skipped' otherwise
+
+    :param gsp_yield_df: the new gsp yields, from 'transform_gsp_yields'
+    :param existing_df: the gsp yields in the database, from 'get_existing_gsp_yields'
+    :return: the new and revised gsp yields, and the number of inserted, revised and skipped
+    """
+
+    merged_df = gsp_yield_df.merge(
+        existing_df,
+        on=["gsp_id", "datetime_utc"],
+        how="left",
+        suffixes=("", "_existing"),
+        indicator=True,
+    )
+
+    is_new = (merged_df["_merge"] == "left_only").to_numpy()
+
+    generation = merged_df["solar_generation_kw"].to_numpy(dtype=np.float64)
+    existing_generation = merged_df["solar_generation_kw_existing"].to_numpy(dtype=np.float64)
+    same_generation = np.isclose(generation, existing_generation, equal_nan=True)
+
+    updated = merged_df["pvlive_updated_utc"]
+    existing_updated = merged_df["pvlive_updated_utc_existing"]
+    same_updated = (updated == existing_updated) | (updated.isnull() & existing_updated.isnull())
+    same_updated = same_updated.to_numpy()
+
+    is_revised = ~is_new & ~(same_generation & same_updated)
+
+    counts = {
+        "inserted": int(is_new.sum()),
+        "revised": int(is_revised.sum()),
+        "skipped": int((~is_new & ~is_revised).sum()),
+    }
+
+    gsp_yield_df = gsp_yield_df[is_new | is_revised]
+
+    return gsp_yield_df, counts
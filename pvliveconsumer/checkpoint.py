@@ -0,0 +1,175 @@
+""" Checkpoint journal, so that a failed run can be resumed
+
+The journal is a json lines file. The first line describes the run, and then one line is
+appended each time a batch of GSPs, or a chunk of a backfill, is committed to the database. When
+the run finishes the journal is removed, so a journal that is left behind belongs to a run that did
+not finish.
+"""
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# dont resume runs that were started longer ago than this, as the window has moved on since
+max_journal_ages = {"in-day": timedelta(minutes=30), "day-after": timedelta(days=1)}
+
+half_hour = timedelta(minutes=30)
+
+
+def get_checkpoint_file(regime: str, shard_index: int = 0) -> str:
+    """
+    Get the default checkpoint file for a regime
+
+    :param regime: if its "in-day" or "day-after"
+    :param shard_index: the shard of this consumer
+    :return: path of the checkpoint file
+    """
+    filename = f"pvliveconsumer-checkpoint-{regime}-{shard_index}.jsonl"
+    return os.path.join(tempfile.gettempdir(), filename)
+
+
+def _append_line(checkpoint_file: str, line: dict, mode: str = "a"):
+    """Append one line to the journal, and make sure it is on disk"""
+    with open(checkpoint_file, mode) as f:
+        f.write(json.dumps(line) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def start_journal(checkpoint_file: str, regime: str, start: datetime, end: datetime):
+    """
+    Start a new journal, removing any old one
+
+    :param checkpoint_file: path of the checkpoint file
+    :param regime: if its "in-day" or "day-after"
+    :param start: the start of the run window
+    :param end: the end of the run window
+    """
+    line = {
+        "regime": regime,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "started_utc": datetime.now(timezone.utc).isoformat(),
+    }
+    _append_line(checkpoint_file, line, mode="w")
+
+
+def record_committed(checkpoint_file: str, gsp_ids: List[int]):
+    """
+    Record that a batch of GSPs has been committed to the database
+
+    :param checkpoint_file: path of the checkpoint file
+    :param gsp_ids: the gsp ids that were committed
+    """
+    line = {"gsp_ids": gsp_ids, "committed_utc": datetime.now(timezone.utc).isoformat()}
+    _append_line(checkpoint_file, line)
+
+
+def record_chunk_committed(checkpoint_file: str, chunk_start: datetime):
+    """
+    Record that a chunk of a backfill has been committed to the database, for all GSPs
+
+    :param checkpoint_file: path of the checkpoint file
+    :param chunk_start: the start of the chunk
+    """
+    line = {
+        "chunk_start": chunk_start.isoformat(),
+        "committed_utc": datetime.now(timezone.utc).isoformat(),
+    }
+    _append_line(checkpoint_file, line)
+
+
+def complete_journal(checkpoint_file: str):
+    """
+    Mark the run as finished, by removing the journal
+
+    :param checkpoint_file: path of the checkpoint file
+    """
+    if os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+
+def load_journal(
+    checkpoint_file: str, regime: str, max_age: Optional[timedelta] = None
+) -> Optional[dict]:
+    """
+    Load the journal of a run that did not finish
+
+    :param checkpoint_file: path of the checkpoint file
+    :param regime: if its "in-day" or "day-after", only journals for this regime are used
+    :param max_age: optional, dont resume runs that were started longer ago than this
+    :return: None if there is nothing to resume, otherwise a dictionary with 'start', 'end',
+        and the 'gsp_ids' and backfill 'chunk_starts' that were committed
+    """
+    if not os.path.exists(checkpoint_file):
+        logger.debug(f"No checkpoint journal found at {checkpoint_file}")
+        return None
+
+    with open(checkpoint_file) as f:
+        # a half written last line is from a crash, so it is ignored
+        lines = []
+        for text in f:
+            try:
+                lines.append(json.loads(text))
+            except json.JSONDecodeError:
+                logger.warning(f"Ignoring a broken line in the checkpoint journal: {text}")
+
+    if len(lines) == 0 or lines[0].get("regime") != regime:
+        logger.debug(f"Checkpoint journal at {checkpoint_file} is not for {regime=}")
+        return None
+
+    started_utc = datetime.fromisoformat(lines[0]["started_utc"])
+    if max_age is not None and datetime.now(timezone.utc) - started_utc > max_age:
+        logger.info(f"Checkpoint journal was started at {started_utc}, so will not resume it")
+        return None
+
+    gsp_ids = set()
+    chunk_starts = set()
+    for line in lines[1:]:
+        gsp_ids.update(line.get("gsp_ids", []))
+        if "chunk_start" in line:
+            chunk_starts.add(datetime.fromisoformat(line["chunk_start"]))
+
+    return {
+        "start": datetime.fromisoformat(lines[0]["start"]),
+        "end": datetime.fromisoformat(lines[0]["end"]),
+        "gsp_ids": gsp_ids,
+        "chunk_starts": chunk_starts,
+    }
+
+
+
+def get_half_hours(start: datetime, end: datetime) -> Tuple[datetime, datetime]:
+    """
+    Get the first and last half hour in a window
+
+    :param start: the start of the window, timezone aware
+    :param end: the end of the window, timezone aware
+    :return: the first and last half hour
+    """
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    first_half_hour = start - (start - epoch) % half_hour
+    if first_half_hour < start:
+        first_half_hour += half_hour
+    last_half_hour = end - (end - epoch) % half_hour
+    return first_half_hour, last_half_hour
+
+
+def is_same_window(journal: dict, start: datetime, end: datetime) -> bool:
+    """
+    Check if the journal is for the same half hours as this run
+
+    If it is not, the gsps that were saved in the journal's run are missing some half hours of
+    this run, so they should be pulled again.
+
+    :param journal: the journal, from 'load_journal'
+    :param start: the start of this run's window, timezone aware
+    :param end: the end of this run's window, timezone aware
+    :return: if the windows have the same half hours
+    """
+    journal_half_hours = get_half_hours(start=journal["start"], end=journal["end"])
+    return journal_half_hours == get_half_hours(start=start, end=end)
@@ -0,0 +1,146 @@
+""" Cache of gsps that PVLive has no data for, so they are not pulled every run
+
+A gsp is marked as dead after it has had no data for 'n_empty_runs' daytime runs in a row.
+Runs where night time zeros were used instead do not count, as no data is expected at night.
+Dead gsps are skipped, apart from being probed again after 'first_probe_interval'. Each probe that
+still has no data doubles the interval, up to 'max_probe_interval'. As soon as a gsp has data
+again, it is pulled every run.
+
+The cache is a json file, so it is kept between runs. The gsps in 'ignore_gsp_ids' are added to
+it as dead, if they are not already in it.
+"""
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pvliveconsumer.files import write_json_atomically
+
+logger = logging.getLogger(__name__)
+
+n_empty_runs = int(os.getenv("DEAD_GSP_RUNS", 3))
+first_probe_interval = timedelta(hours=1)
+max_probe_interval = timedelta(days=7)
+
+
+def make_dead_entry(datetime_utc: datetime, n_probes: int = 0) -> dict:
+    """
+    Make the cache entry of a dead gsp
+
+    :param datetime_utc: the datetime now
+    :param n_probes: number of times the gsp has been probed since it was marked as dead
+    :return: cache entry
+    """
+    probe_interval = min(first_probe_interval * 2**n_probes, max_probe_interval)
+    return {
+        "n_empty_runs": n_empty_runs,
+        "dead": True,
+        "n_probes": n_probes,
+        "next_probe_utc": (datetime_utc + probe_interval).isoformat(),
+    }
+
+
+def load_dead_gsps(
+    dead_gsp_file: Optional[str], seed_gsp_ids: List[int], datetime_utc: Optional[datetime] = None
+) -> Dict[int, dict]:
+    """
+    Load the dead gsp cache, and add the seed gsps to it
+
+    :param dead_gsp_file: optional path of the cache file. If None, only the seed gsps are used
+    :param seed_gsp_ids: gsp ids that are marked as dead, if they are not in the cache
+    :param datetime_utc: the datetime now
+    :return: dictionary of gsp id to cache entry
+    """
+    if datetime_utc is None:
+        datetime_utc = datetime.now(timezone.utc)
+
+    dead_gsps = {}
+    if dead_gsp_file is not None and os.path.exists(dead_gsp_file):
+        try:
+            with open(dead_gsp_file) as f:
+                dead_gsps = {int(gsp_id): entry for gsp_id, entry in json.load(f).items()}
+        except Exception as e:
+            logger.warning(f"Could not read the dead gsp cache {dead_gsp_file}: {e}")
+
+    for gsp_id in seed_gsp_ids:
+        if gsp_id not in dead_gsps:
+            dead_gsps[gsp_id] = make_dead_entry(datetime_utc=datetime_utc)
+
+    return dead_gsps
+
+
+def save_dead_gsps(dead_gsp_file: Optional[str], dead_gsps: Dict[int, dict]):
+    """
+    Save the dead gsp cache
+
+    A failed save is only logged, as the worst case is the dead gsps are pulled again.
+
+    :param dead_gsp_file: optional path of the cache file. If None, nothing is saved
+    :param dead_gsps: dictionary of gsp id to cache entry
+    """
+    if dead_gsp_file is None:
+        return
+
+    try:
+        write_json_atomically(
+            json_file=dead_gsp_file,
+            data={str(gsp_id): entry for gsp_id, entry in dead_gsps.items()},
+        )
+    except Exception as e:
+        logger.warning(f"Could not save the dead gsp cache {dead_gsp_file}: {e}")
+
+
+def is_dead(dead_gsps: Dict[int, dict], gsp_id: int, datetime_utc: datetime) -> bool:
+    """
+    Check if a gsp should be skipped, as it is dead and is not due to be probed
+
+    :param dead_gsps: dictionary of gsp id to cache entry
+    :param gsp_id: the gsp id
+    :param datetime_utc: the datetime now
+    :return: if the gsp should be skipped
+    """
+    entry = dead_gsps.get(gsp_id)
+    if entry is None or not entry["dead"]:
+        return False
+
+    return datetime.fromisoformat(entry["next_probe_utc"]) > datetime_utc
+
+
+def record_pull(dead_gsps: Dict[int, dict], gsp_id: int, has_data: bool, datetime_utc: datetime):
+    """
+    Update the cache with the result of pulling a gsp in the daytime
+
+    :param dead_gsps: dictionary of gsp id to cache entry
+    :param gsp_id: the gsp id
+    :param has_data: if PVLive had any data for the gsp
+    :param datetime_utc: the datetime now
+    """
+    entry = dead_gsps.get(gsp_id)
+
+    if has_data:
+        if entry is not None:
+            if entry["dead"]:
+                logger.info(f"GSP {gsp_id} has data again, so will pull it every run")
+            dead_gsps[gsp_id] = {"n_empty_runs": 0, "dead": False}
+        return
+
+    if entry is not None and entry["dead"]:
+        dead_gsps[gsp_id] = make_dead_entry(
+            datetime_utc=datetime_utc, n_probes=entry.get("n_probes", 0) + 1
+        )
+        logger.debug(
+            f"GSP {gsp_id} still has no data, so will probe it again "
+            f"at {dead_gsps[gsp_id]['next_probe_utc']}"
+        )
+        return
+
+    n_empty = 1 if entry is None else entry["n_empty_runs"] + 1
+    if n_empty >= n_empty_runs:
+        logger.warning(
+            f"GSP {gsp_id} has had no data for {n_empty} runs, "
+            f"so will not pull it every run until it has data again"
+        )
+        dead_gsps[gsp_id] = make_dead_entry(datetime_utc=datetime_utc)
+    else:
+        dead_gsps[gsp_id] = {"n_empty_runs": n_empty, "dead": False}
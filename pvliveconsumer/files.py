@@ -0,0 +1,19 @@
+""" Write the json files that are kept between runs """
+import json
+import os
+
+
+def write_json_atomically(json_file: str, data):
+    """
+    Write data to a json file, so the file is never left half written
+
+    The data is written to a temporary file next to it first, which then replaces the file.
+    Errors are raised, it is up to the caller if a failed write should stop the run.
+
+    :param json_file: path of the json file
+    :param data: data that can be saved as json
+    """
+    temporary_file = f"{json_file}.tmp"
+    with open(temporary_file, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary_file, json_file)
@@ -1,38 +1,111 @@
 """ GSP functions """
 import logging
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from nowcasting_datamodel.models.gsp import LocationSQL
-from nowcasting_datamodel.read.read import get_all_locations, get_location
-from nowcasting_datamodel.read.read_gsp import get_latest_gsp_yield
+from nowcasting_datamodel.read.read import get_all_locations, get_location, national_gb_label
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from pvliveconsumer.queries import latest_gsp_yields_statement, publication_lags_statement
+from pvliveconsumer.snapshot import get_locations_from_snapshot
 
 logger = logging.getLogger(__name__)
 
+# how much history is used to learn the publication lag of each gsp
+publication_lag_history = timedelta(days=2)
+# the most a gsp will wait for, so a few late values never stop a gsp being pulled for long
+max_publication_lag = timedelta(hours=2)
+
 
 def get_gsps(
-    session: Session, n_gsps: int = 339, regime: str = "in-day", include_national: bool = True
+    session: Session,
+    n_gsps: int = 339,
+    regime: str = "in-day",
+    include_national: bool = True,
+    snapshot_file: Optional[str] = None,
+    read_session: Optional[Session] = None,
 ) -> List[LocationSQL]:
     """
     Get PV systems
 
-    1. Load from database
+    1. Load from the location snapshot, if there is a valid one
+    2. Otherwise load from database
     3. add any gsp not in database
 
+    If there is a read session, for example of a read replica, the locations and their latest gsp
+    yields are read with it. Missing gsps are still added with the main session, and the gsps are
+    merged into the main session, so gsp yields can be saved for them.
+    If the replica is behind, the latest gsp yields may be older than those in the main database.
+    Then more data is pulled than needed, but the values that are already saved are not written
+    again.
+
     :param session: database sessions
     :param n_gsps: number of gsps, 0 is national then 1 to 338 is the gsps
     :param regime: if its "in-day" or "day-after"
     :param include_national: optionl if to get national data or not
+    :param snapshot_file: optional location snapshot, used instead of loading the locations
+    :param read_session: optional database session that is only used for reading
     :return: list of gsps sqlalchemy objects
     """
+    if read_session is None:
+        read_session = session
+
     gsp_ids = list(range(1, n_gsps + 1))
     if include_national:
         gsp_ids = [0] + gsp_ids
     total_n_gsps = len(gsp_ids)
 
-    # load all pv systems in database
-    locations_sql_db: List[LocationSQL] = get_all_locations(session=session, gsp_ids=gsp_ids)
+    all_locations = None
+    if snapshot_file is not None:
+        all_locations = get_locations_from_snapshot(
+            session=read_session, snapshot_file=snapshot_file, gsp_ids=gsp_ids
+        )
+    if all_locations is None:
+        all_locations = get_locations(session=session, gsp_ids=gsp_ids, read_session=read_session)
+
+    # Only get data that is 1 week odd
+    datetime_utc = datetime.now(timezone.utc) - timedelta(days=7)
+
+    logger.debug("Get latest GSP yields")
+    all_locations = get_latest_gsp_yields(
+        session=read_session, gsps=all_locations, regime=regime, datetime_utc=datetime_utc
+    )
+
+    assert len(all_locations) == total_n_gsps, len(all_locations)
+
+    if read_session is not session:
+        all_locations = merge_gsps(session=session, gsps=all_locations)
+
+    return all_locations
+
+
+def get_locations(
+    session: Session, gsp_ids: List[int], read_session: Optional[Session] = None
+) -> List[LocationSQL]:
+    """
+    Load the locations from the database, and add any that are missing
+
+    :param session: database sessions, used to add the missing locations
+    :param gsp_ids: the gsp ids of the locations
+    :param read_session: optional database session used to load the locations
+    :return: list of location sqlalchemy objects
+    """
+    if read_session is None:
+        read_session = session
+
+    total_n_gsps = len(gsp_ids)
+
+    # load all pv systems in database. National is loaded separately, as 'get_all_locations'
+    # would add it with the read session if it was missing
+    locations_sql_db: List[LocationSQL] = get_all_locations(
+        session=read_session, gsp_ids=[gsp_id for gsp_id in gsp_ids if gsp_id != 0]
+    )
+    if 0 in gsp_ids:
+        query = read_session.query(LocationSQL).filter(LocationSQL.gsp_id == 0)
+        query = query.filter(LocationSQL.label == national_gb_label)
+        locations_sql_db = query.all() + locations_sql_db
 
     logger.debug(
         f"Found {len(locations_sql_db)} locations in the database, should be {total_n_gsps}"
@@ -47,7 +120,8 @@ def get_gsps(
 
         new_locations = []
         for gsp_id in missing_gsp_ids:
-            location = get_location(session=session, gsp_id=gsp_id)
+            label = national_gb_label if gsp_id == 0 else None
+            location = get_location(session=session, gsp_id=gsp_id, label=label)
             new_locations.append(location)
 
         all_locations = new_locations + locations_sql_db
@@ -70,39 +144,128 @@ def get_gsps(
         len(all_locations) == total_n_gsps
     ), f"Found {len(locations_sql_db)} locations in the database, should be {total_n_gsps}"
 
-    # Only get data that is 1 week odd
-    datetime_utc = datetime.now(timezone.utc) - timedelta(days=7)
+    return all_locations
 
-    logger.debug("Get latest GSP yields")
-    all_locations = get_latest_gsp_yield(
-        session=session,
-        append_to_gsps=True,
-        gsps=all_locations,
-        regime=regime,
-        datetime_utc=datetime_utc,
-    )
 
-    assert len(all_locations) == total_n_gsps, len(all_locations)
+def get_latest_gsp_yields(
+    session: Session, gsps: List[LocationSQL], regime: str, datetime_utc: datetime
+) -> List[LocationSQL]:
+    """
+    Get the latest gsp yield of each gsp, in one query
 
-    return all_locations
+    :param session: database session
+    :param gsps: list of gsps
+    :param regime: if its "in-day" or "day-after"
+    :param datetime_utc: only look at gsp yields after this datetime
+    :return: the gsps, with the latest gsp yield attached as 'last_gsp_yield',
+        or None if there is no gsp yield
+    """
+    rows = session.execute(
+        latest_gsp_yields_statement,
+        {"regime": regime, "start": datetime_utc, "gsp_ids": [gsp.gsp_id for gsp in gsps]},
+    ).all()
+    gsp_yields_by_id = {gsp_id: gsp_yield for gsp_id, gsp_yield in rows}
+    logger.debug(f"Found {len(gsp_yields_by_id)} latest gsp yields")
+
+    for gsp in gsps:
+        gsp_yield = gsp_yields_by_id.get(gsp.gsp_id)
+        if gsp_yield is not None:
+            # add utc timezone, without marking the gsp yield as changed
+            last_datetime_utc = gsp_yield.datetime_utc.replace(tzinfo=timezone.utc)
+            set_committed_value(gsp_yield, "datetime_utc", last_datetime_utc)
+        gsp.last_gsp_yield = gsp_yield
+
+    return gsps
+
+
+def merge_gsps(session: Session, gsps: List[LocationSQL]) -> List[LocationSQL]:
+    """
+    Merge gsps loaded with another session into this session, without loading them again
+
+    The last gsp yield of each gsp is kept.
+
+    :param session: database session to merge the gsps into
+    :param gsps: list of gsps, with 'last_gsp_yield' attached
+    :return: list of gsps in this session
+    """
+    merged_gsps = []
+    for gsp in gsps:
+        merged_gsp = session.merge(gsp, load=False)
+        merged_gsp.last_gsp_yield = gsp.last_gsp_yield
+        merged_gsps.append(merged_gsp)
+
+    return merged_gsps
+
+
+def get_publication_lags(
+    session: Session,
+    gsps: List[LocationSQL],
+    regime: str,
+    datetime_utc: Optional[datetime] = None,
+) -> Dict[int, timedelta]:
+    """
+    Learn how long PVLive takes to publish a value for each gsp, from the gsp yields saved
+
+    The publication lag of a gsp yield is the time from its datetime to when PVLive first
+    published it. For each gsp, the median over the last 'publication_lag_history' is used,
+    and it is at most 'max_publication_lag'.
+    The query only works on Postgres. If it fails, no publication lags are used, rather than
+    stopping the run, and the rest of the session's transaction is kept.
+
+    :param session: database session
+    :param gsps: list of gsps
+    :param regime: if its "in-day" or "day-after"
+    :param datetime_utc: the datetime now
+    :return: dictionary of gsp id to publication lag. Gsps with no history are not included
+    """
+    if datetime_utc is None:
+        datetime_utc = datetime.now(timezone.utc)
+
+    try:
+        with session.begin_nested():
+            rows = session.execute(
+                publication_lags_statement,
+                {
+                    "regime": regime,
+                    "start": datetime_utc - publication_lag_history,
+                    "gsp_ids": [gsp.gsp_id for gsp in gsps],
+                },
+            ).all()
+    except Exception as e:
+        logger.warning(f"Could not learn the publication lags, so will not use them: {e}")
+        return {}
+
+    publication_lags = {
+        gsp_id: min(timedelta(seconds=float(lag_seconds)), max_publication_lag)
+        for gsp_id, lag_seconds in rows
+        if lag_seconds is not None
+    }
+    logger.debug(f"Learnt the publication lag of {len(publication_lags)} GSPs")
+
+    return publication_lags
 
 
 def filter_gsps_which_have_new_data(
-    gsps: List[LocationSQL], datetime_utc: Optional[datetime] = None
+    gsps: List[LocationSQL],
+    datetime_utc: Optional[datetime] = None,
+    publication_lags: Optional[Dict[int, timedelta]] = None,
 ):
     """
     Filter gsps which have new data available
 
     This is done by looking at the datestamp of last data pulled,
-    add then by looking at the pv system refresh time, we can determine if new data is available
+    add then by looking at the pv system refresh time, and how long PVLive takes to publish
+    data for the gsp, we can determine if new data is available
 
     sudo code:
-        if last_datestamp + refresh_interval > datetime_now
+        if last_datestamp + refresh_interval + publication_lag < datetime_now
             keep = True
 
     Args:
         gsps: list of gsps
         datetime_utc: the datetime now
+        publication_lags: optional publication lag of each gsp, from 'get_publication_lags'.
+            Gsps that are not included have no lag
 
     Returns: list of pv systems that have new data.
 
@@ -113,6 +276,9 @@ def filter_gsps_which_have_new_data(
     if datetime_utc is None:
         datetime_utc = datetime.now(timezone.utc)
 
+    if publication_lags is None:
+        publication_lags = {}
+
     keep_gsps = []
     for i, gsp in enumerate(gsps):
         logger.debug(f"Looking at {i}th GSP, out of {len(gsps)} gsps")
@@ -126,12 +292,16 @@ def filter_gsps_which_have_new_data(
             )
             keep_gsps.append(gsp)
         else:
-            next_datetime_data_available = timedelta(minutes=30) + last_yield.datetime_utc
+            publication_lag = publication_lags.get(gsp.gsp_id, timedelta(0))
+            next_datetime_data_available = (
+                timedelta(minutes=30) + last_yield.datetime_utc + publication_lag
+            )
             if next_datetime_data_available < datetime_utc:
                 logger.debug(
                     f"For gsp {gsp.gsp_id} as "
                     f"last yield datetime is {last_yield.datetime_utc},"
                     f"refresh interval is 30 minutes, "
+                    f"and publication lag is {publication_lag}, "
                     f"so will be getting data"
                 )
                 keep_gsps.append(gsp)
@@ -139,7 +309,154 @@ def filter_gsps_which_have_new_data(
                 logger.debug(
                     f"Not keeping gsp {gsp.gsp_id} as "
                     f"last yield datetime is {last_yield.datetime_utc},"
-                    f"refresh interval is 30 minutes"
+                    f"refresh interval is 30 minutes, "
+                    f"and publication lag is {publication_lag}"
                 )
 
     return keep_gsps
+
+
+def get_shard_index(gsp_id: int, shard_count: int) -> int:
+    """
+    Get the shard that owns a gsp. National is always owned by the first shard.
+
+    :param gsp_id: the gsp id
+    :param shard_count: the number of shards
+    :return: the shard index
+    """
+    if gsp_id == 0:
+        return 0
+    return gsp_id % shard_count
+
+
+def get_takeover_shard_index(gsp_id: int, shard_count: int) -> int:
+    """
+    Get the shard that takes over a gsp, if the shard that owns it is not running
+
+    This is the next shard, so each gsp only has one shard taking it over.
+
+    :param gsp_id: the gsp id
+    :param shard_count: the number of shards
+    :return: the shard index
+    """
+    return (get_shard_index(gsp_id=gsp_id, shard_count=shard_count) + 1) % shard_count
+
+
+def shard_gsps(
+    gsps: List[LocationSQL],
+    shard_index: int = 0,
+    shard_count: int = 1,
+    takeover_after: Optional[timedelta] = None,
+    datetime_utc: Optional[datetime] = None,
+) -> List[LocationSQL]:
+    """
+    Get the gsps for this shard, so that several consumers can split the gsps between them
+
+    If a gsp belongs to another shard, but it has had no new data for 'takeover_after',
+    then the other consumer is probably not running, so the next shard takes the gsp as well.
+    A gsp with no recent data at all counts as having no new data. Only the next shard takes it
+    over, so at most two shards pull a gsp at the same time.
+
+    :param gsps: list of gsps
+    :param shard_index: the index of this shard, from 0 to shard_count - 1
+    :param shard_count: the number of shards
+    :param takeover_after: optional, take gsps from other shards that have had no data for this
+    :param datetime_utc: the datetime now
+    :return: list of gsps for this shard
+    """
+    if not 0 <= shard_index < shard_count:
+        raise Exception(f"Shard index {shard_index} should be between 0 and {shard_count - 1}")
+
+    if shard_count == 1:
+        return gsps
+
+    if datetime_utc is None:
+        datetime_utc = datetime.now(timezone.utc)
+
+    keep_gsps = []
+    for gsp in gsps:
+        if get_shard_index(gsp_id=gsp.gsp_id, shard_count=shard_count) == shard_index:
+            keep_gsps.append(gsp)
+        elif (
+            takeover_after is not None
+            and get_takeover_shard_index(gsp_id=gsp.gsp_id, shard_count=shard_count) == shard_index
+        ):
+            if gsp.last_gsp_yield is None:
+                last_datetime_utc = None
+            else:
+                last_datetime_utc = gsp.last_gsp_yield.datetime_utc.replace(tzinfo=timezone.utc)
+            if last_datetime_utc is None or last_datetime_utc + takeover_after < datetime_utc:
+                logger.warning(
+                    f"GSP {gsp.gsp_id} has had no new data since {last_datetime_utc}, "
+                    f"so shard {shard_index} is taking it over"
+                )
+                keep_gsps.append(gsp)
+
+    logger.info(f"Shard {shard_index} of {shard_count} has {len(keep_gsps)} GSPs")
+
+    return keep_gsps
+
+
+def order_gsps_by_priority(gsps: List[LocationSQL]) -> List[LocationSQL]:
+    """
+    Order the gsps so the most important ones are pulled first
+
+    The stalest gsps come first, gsps with no data at all being the stalest.
+    Gsps with the same last data are ordered by installed capacity, largest first.
+
+    :param gsps: list of gsps
+    :return: ordered list of gsps
+    """
+
+    def priority(gsp: LocationSQL):
+        if gsp.last_gsp_yield is None:
+            last_datetime_utc = datetime.min
+        else:
+            last_datetime_utc = gsp.last_gsp_yield.datetime_utc.replace(tzinfo=None)
+        installed_capacity_mw = gsp.installed_capacity_mw or 0
+        return last_datetime_utc, -installed_capacity_mw
+
+    return sorted(gsps, key=priority)
+
+
+def has_new_data(
+    gsps: List[LocationSQL],
+    latest_datetime_utc: Optional[datetime],
+    latest_updated_utc: Optional[datetime] = None,
+) -> bool:
+    """
+    Check if PVLive could have new data for any of the gsps
+
+    There is new data if a gsp's last gsp yield is before the latest datetime PVLive has
+    published, or if it is for the latest datetime but PVLive has updated it since.
+    Gsps with no gsp yields yet are not checked, as these are mostly gsps that PVLive has no data
+    for. Only if no gsp has any gsp yields, for example in a new database, is there new data.
+
+    :param gsps: list of gsps, with 'last_gsp_yield' attached
+    :param latest_datetime_utc: the latest datetime PVLive has published, timezone aware
+    :param latest_updated_utc: optional datetime the latest value was updated, timezone aware
+    :return: if any gsp could have new data
+    """
+    if latest_datetime_utc is None:
+        return False
+
+    gsp_yields = [gsp.last_gsp_yield for gsp in gsps if gsp.last_gsp_yield is not None]
+    if len(gsp_yields) == 0:
+        return len(gsps) > 0
+
+    for gsp_yield in gsp_yields:
+        last_datetime_utc = gsp_yield.datetime_utc
+        if last_datetime_utc.tzinfo is None:
+            last_datetime_utc = last_datetime_utc.replace(tzinfo=timezone.utc)
+        if last_datetime_utc < latest_datetime_utc:
+            return True
+
+        # PVLive has revised the latest value
+        last_updated_utc = gsp_yield.pvlive_updated_utc
+        if latest_updated_utc is not None and last_updated_utc is not None:
+            if last_updated_utc.tzinfo is None:
+                last_updated_utc = last_updated_utc.replace(tzinfo=timezone.utc)
+            if last_updated_utc < latest_updated_utc:
+                return True
+
+    return False
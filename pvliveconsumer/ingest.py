@@ -0,0 +1,249 @@
+""" Fetch PVLive data straight into numpy columns
+
+The 'pvlive_api' package turns every response into a pandas DataFrame. Here the json payload is
+parsed directly into typed numpy arrays, so that many GSPs can be joined together cheaply before
+being transformed.
+"""
+import json
+import logging
+from datetime import datetime, timedelta
+from time import sleep
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+from pvlive_api.pvlive import PVLiveException
+
+from pvliveconsumer.metrics import pvlive_bytes_downloaded, pvlive_request_duration_seconds
+from pvliveconsumer.report import record_retry
+
+logger = logging.getLogger(__name__)
+
+extra_fields = "installedcapacity_mwp,capacity_mwp,updated_gmt"
+datetime_columns = ["datetime_gmt", "updated_gmt"]
+float_columns = ["generation_mw", "installedcapacity_mwp", "capacity_mwp"]
+
+# the PVLive api can only return 30 days of regional data in one request
+max_request_range = timedelta(days=30)
+period_minutes = 30
+
+
+def nearest_interval(dt: datetime) -> datetime:
+    """
+    Round a datetime up to the nearest 30 minute interval, like PVLive does
+
+    :param dt: datetime
+    :return: rounded datetime
+    """
+    if not (dt.minute % period_minutes == 0 and dt.second == 0 and dt.microsecond == 0):
+        dt = (
+            dt
+            - timedelta(minutes=dt.minute % period_minutes, seconds=dt.second)
+            - timedelta(microseconds=dt.microsecond)
+            + timedelta(minutes=period_minutes)
+        )
+    return dt
+
+
+def make_url(domain_url: str, gsp_id: int, start: datetime, end: datetime) -> str:
+    """
+    Make the PVLive url for one gsp
+
+    :param domain_url: the PVLive domain, e.g 'api.pvlive.uk'
+    :param gsp_id: the gsp id
+    :param start: start datetime, timezone aware
+    :param end: end datetime, timezone aware
+    :return: url
+    """
+    params = {
+        "extra_fields": extra_fields,
+        "start": start.isoformat().replace("+00:00", "Z"),
+        "end": end.isoformat().replace("+00:00", "Z"),
+        "period": period_minutes,
+    }
+    query = "&".join([f"{key}={value}" for key, value in params.items()])
+    return f"https://{domain_url}/pvlive/api/v4/gsp/{gsp_id}?{query}"
+
+
+def make_latest_url(domain_url: str, gsp_id: int = 0, fields: str = "updated_gmt") -> str:
+    """
+    Make the PVLive url for the latest value of one gsp
+
+    :param domain_url: the PVLive domain, e.g 'api.pvlive.uk'
+    :param gsp_id: the gsp id, defaults to national
+    :param fields: the extra fields to get
+    :return: url
+    """
+    return f"https://{domain_url}/pvlive/api/v4/gsp/{gsp_id}?extra_fields={fields}"
+
+
+def make_all_gsps_url(domain_url: str, datetime_utc: datetime, fields: str) -> str:
+    """
+    Make the PVLive url for the values of all gsps at one datetime
+
+    :param domain_url: the PVLive domain, e.g 'api.pvlive.uk'
+    :param datetime_utc: the datetime, timezone aware
+    :param fields: the extra fields to get
+    :return: url
+    """
+    datetime_str = datetime_utc.isoformat().replace("+00:00", "Z")
+    query = f"extra_fields={fields}&start={datetime_str}&end={datetime_str}"
+    return f"https://{domain_url}/pvlive/api/v4/gsp?{query}"
+
+
+def make_gsp_list_url(domain_url: str) -> str:
+    """
+    Make the PVLive url for the list of gsps
+
+    :param domain_url: the PVLive domain, e.g 'api.pvlive.uk'
+    :return: url
+    """
+    return f"https://{domain_url}/pvlive/api/v4/gsp_list"
+
+
+def fetch_json(url: str, retries: int = 3, timeout: int = 30) -> dict:
+    """
+    Get the url and parse the json, retrying with exponential back off
+
+    :param url: the url
+    :param retries: number of retries, if the response is not ok
+    :param timeout: request timeout in seconds
+    :return: the parsed json response
+    """
+    delay = 1
+    for attempt in range(retries + 1):
+        try:
+            with pvlive_request_duration_seconds.time():
+                response = requests.get(url, timeout=timeout)
+            pvlive_bytes_downloaded.inc(len(response.content))
+            if response.status_code == 400:
+                raise PVLiveException(f"PV_Live API received Bad Request (400) for {url}")
+            response.raise_for_status()
+            return json.loads(response.content)
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"Request {attempt + 1} to {url} failed: {e}")
+            if attempt < retries:
+                record_retry()
+                sleep(delay)
+                delay *= 2
+
+    raise PVLiveException("Error communicating with the PV_Live API.")
+
+
+def fetch_latest_datetimes(
+    domain_url: str, gsp_id: int = 0, retries: int = 3
+) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    Get the datetime of the latest value PVLive has published for one gsp, and when it was updated
+
+    This is one small request, so it is a cheap way to check if there is any new data.
+
+    :param domain_url: the PVLive domain, e.g 'api.pvlive.uk'
+    :param gsp_id: the gsp id, defaults to national
+    :param retries: number of retries, if the response is not ok
+    :return: the latest datetime and its updated datetime, both timezone aware,
+        or None and None if there is no data
+    """
+    response = fetch_json(
+        url=make_latest_url(domain_url=domain_url, gsp_id=gsp_id), retries=retries
+    )
+    if len(response["data"]) == 0:
+        return None, None
+
+    datetime_index = response["meta"].index("datetime_gmt")
+    updated_index = response["meta"].index("updated_gmt")
+    latest = max(response["data"], key=lambda row: row[datetime_index])
+    latest_datetime_utc = pd.Timestamp(latest[datetime_index]).tz_convert("UTC").to_pydatetime()
+    latest_updated_utc = pd.Timestamp(latest[updated_index]).tz_convert("UTC").to_pydatetime()
+    return latest_datetime_utc, latest_updated_utc
+
+
+def parse_response(data: List[list], meta: List[str], gsp_id: int) -> Dict[str, np.ndarray]:
+    """
+    Parse PVLive rows into numpy columns
+
+    Datetimes are datetime64[s] in UTC (no timezone), and values are float64 with nans.
+
+    :param data: list of rows from PVLive
+    :param meta: the column names of the rows
+    :param gsp_id: the gsp id, this is added as a column
+    :return: dictionary of numpy arrays
+    """
+    values = dict(zip(meta, zip(*data))) if len(data) > 0 else {name: () for name in meta}
+
+    columns = {"gsp_id": np.full(len(data), gsp_id, dtype=np.int64)}
+    for name in datetime_columns:
+        column = [None if value is None else value.rstrip("Z") for value in values[name]]
+        columns[name] = np.array(column, dtype="datetime64[s]")
+    for name in float_columns:
+        columns[name] = np.array(values[name], dtype=np.float64)
+
+    return columns
+
+
+def fetch_gsp_yield_columns(
+    domain_url: str, gsp_id: int, start: datetime, end: datetime, retries: int = 3
+) -> Dict[str, np.ndarray]:
+    """
+    Get the gsp yields for one gsp from PVLive, as numpy columns
+
+    Long time ranges are split into several requests.
+
+    :param domain_url: the PVLive domain, e.g 'api.pvlive.uk'
+    :param gsp_id: the gsp id
+    :param start: start datetime, timezone aware
+    :param end: end datetime, timezone aware
+    :param retries: number of retries of each request, if the response is not ok
+    :return: dictionary of numpy arrays
+    """
+    start = nearest_interval(start)
+    end = nearest_interval(end)
+
+    data, meta = [], []
+    request_start = start
+    while request_start <= end:
+        request_end = min(end, request_start + max_request_range)
+        url = make_url(domain_url=domain_url, gsp_id=gsp_id, start=request_start, end=request_end)
+        response = fetch_json(url=url, retries=retries)
+        data += response["data"]
+        meta = response["meta"]
+        request_start += max_request_range + timedelta(minutes=period_minutes)
+
+    return parse_response(data=data, meta=meta, gsp_id=gsp_id)
+
+
+def columns_from_dataframe(gsp_yield_df: pd.DataFrame, gsp_id: int) -> Dict[str, np.ndarray]:
+    """
+    Change a dataframe, for example of nighttime zeros, into numpy columns
+
+    :param gsp_yield_df: dataframe with the PVLive columns
+    :param gsp_id: the gsp id, this is added as a column
+    :return: dictionary of numpy arrays
+    """
+    columns = {"gsp_id": np.full(len(gsp_yield_df), gsp_id, dtype=np.int64)}
+    for name in datetime_columns:
+        column = pd.to_datetime(gsp_yield_df[name], utc=True).dt.tz_localize(None)
+        columns[name] = column.to_numpy(dtype="datetime64[s]")
+    for name in float_columns:
+        columns[name] = gsp_yield_df[name].to_numpy(dtype=np.float64)
+
+    return columns
+
+
+def concat_columns(all_columns: List[Dict[str, np.ndarray]]) -> pd.DataFrame:
+    """
+    Join numpy columns from several gsps into one dataframe
+
+    The dataframe wraps the joined arrays without copying them,
+    and the datetime columns are set to UTC.
+
+    :param all_columns: list of dictionaries of numpy arrays
+    :return: dataframe
+    """
+    names = ["gsp_id"] + datetime_columns + float_columns
+    joined = {name: np.concatenate([columns[name] for columns in all_columns]) for name in names}
+    for name in datetime_columns:
+        joined[name] = pd.DatetimeIndex(joined[name]).tz_localize("UTC")
+
+    return pd.DataFrame(joined, copy=False)
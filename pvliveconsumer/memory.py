@@ -0,0 +1,113 @@
+""" Optional memory tracking for each stage of a run
+
+When tracking is started, each stage records
+- the peak memory allocated by python during the stage, from tracemalloc
+- the peak RSS of the process so far
+- the lines that allocated the most memory that was still held at the end of the stage
+
+Stages can run several times, e.g once per batch. The largest peaks are kept. If stages are
+nested, only the outer stage is tracked.
+"""
+import logging
+import resource
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# number of top allocations to keep for each stage
+n_top_allocations = 5
+
+_tracking = False
+_depth = 0
+_stages: Dict[str, dict] = {}
+
+
+def start_memory_tracking():
+    """Start tracking memory, this has some overhead so is only done if asked for"""
+    global _tracking
+    _tracking = True
+    _stages.clear()
+    tracemalloc.start()
+
+
+def stop_memory_tracking():
+    """Stop tracking memory"""
+    global _tracking
+    _tracking = False
+    tracemalloc.stop()
+
+
+def get_peak_rss_mb() -> float:
+    """Get the peak RSS of this process in MB"""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux gives kilobytes, mac gives bytes
+    if sys.platform == "darwin":
+        return peak_rss / 1024**2
+    return peak_rss / 1024
+
+
+@contextmanager
+def track_memory(stage: str):
+    """
+    Track the memory used by a stage, if memory tracking has been started
+
+    :param stage: name of the stage
+    """
+    global _depth
+    if not _tracking or _depth > 0:
+        yield
+        return
+
+    _depth += 1
+    snapshot_start = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        _depth -= 1
+        _, peak_traced = tracemalloc.get_traced_memory()
+        snapshot_end = tracemalloc.take_snapshot()
+        stats = snapshot_end.compare_to(snapshot_start, "lineno")
+        _record_stage(stage=stage, peak_traced=peak_traced, stats=stats)
+
+
+def _record_stage(stage: str, peak_traced: int, stats: list):
+    """Keep the stage results, if this is the largest peak for the stage so far"""
+    peak_traced_mb = peak_traced / 1024**2
+    previous = _stages.get(stage)
+    if previous is not None and previous["peak_traced_mb"] >= peak_traced_mb:
+        previous["peak_rss_mb"] = get_peak_rss_mb()
+        return
+
+    top_allocations = [
+        {"line": str(stat.traceback[0]), "size_mb": round(stat.size_diff / 1024**2, 3)}
+        for stat in stats[:n_top_allocations]
+    ]
+    _stages[stage] = {
+        "peak_traced_mb": round(peak_traced_mb, 3),
+        "peak_rss_mb": round(get_peak_rss_mb(), 3),
+        "top_allocations": top_allocations,
+    }
+
+
+def get_memory_report() -> Dict[str, dict]:
+    """
+    Get the memory results for each stage
+
+    :return: dictionary of stage name to results. This is empty if tracking was not started
+    """
+    return dict(_stages)
+
+
+def log_memory_report():
+    """Log the memory results for each stage"""
+    for stage, result in _stages.items():
+        logger.info(
+            f"Memory for stage {stage}: peak allocated {result['peak_traced_mb']:.1f} MB, "
+            f"peak RSS {result['peak_rss_mb']:.1f} MB"
+        )
+        for allocation in result["top_allocations"]:
+            logger.debug(f"    {allocation['size_mb']:.3f} MB at {allocation['line']}")
@@ -0,0 +1,196 @@
+""" Refresh the gsp names and installed capacities in the database from PVLive
+
+1. Get the gsp list from PVLive in one request, and the installed capacity of every gsp at the
+   latest datetime in another
+2. Load the locations from the database, just the columns that are needed
+3. Find the changes in memory
+4. Apply all the changes in one bulk update, unless it is a dry run
+
+    python -m pvliveconsumer.metadata --dry-run
+"""
+import logging
+from typing import Dict, List
+
+import click
+import pandas as pd
+from nowcasting_datamodel.connection import DatabaseConnection
+from nowcasting_datamodel.models.base import Base_Forecast
+from nowcasting_datamodel.models.gsp import LocationSQL
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from pvliveconsumer.app import pvlive_domain_url
+from pvliveconsumer.ingest import (
+    fetch_json,
+    fetch_latest_datetimes,
+    make_all_gsps_url,
+    make_gsp_list_url,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option(
+    "--db-url",
+    default=None,
+    envvar="DB_URL",
+    help="The Database URL of the gsp locations",
+    type=click.STRING,
+)
+@click.option(
+    "--dry-run",
+    default=False,
+    help="Only log the changes, dont update the database",
+    type=click.BOOL,
+    is_flag=True,
+)
+def refresh_metadata(db_url: str, dry_run: bool = False):
+    """
+    Refresh the gsp names and installed capacities in the database from PVLive
+
+    :param db_url: the Database url of the gsp locations
+    :param dry_run: only log the changes, dont update the database
+    """
+    pvlive_metadata_df = fetch_pvlive_metadata(domain_url=pvlive_domain_url)
+
+    connection = DatabaseConnection(url=db_url, base=Base_Forecast, echo=False)
+    with connection.get_session() as session:
+        location_df = get_location_metadata(session=session)
+        changes = find_metadata_changes(
+            location_df=location_df, pvlive_metadata_df=pvlive_metadata_df
+        )
+
+        if dry_run:
+            logger.info(f"Dry run, so will not make the {len(changes)} changes")
+        else:
+            update_locations(session=session, changes=changes)
+
+
+def fetch_installed_capacities(domain_url: str) -> Dict[int, float]:
+    """
+    Get the installed capacity of every gsp from PVLive, at the latest datetime, in one request
+
+    :param domain_url: the PVLive domain, e.g 'api.pvlive.uk'
+    :return: dictionary of gsp id to installed capacity in MW. Gsps with no data are not included
+    """
+    latest_datetime_utc, _ = fetch_latest_datetimes(domain_url=domain_url)
+    if latest_datetime_utc is None:
+        logger.warning("PVLive has no latest datetime, so can not get the installed capacities")
+        return {}
+
+    url = make_all_gsps_url(
+        domain_url=domain_url, datetime_utc=latest_datetime_utc, fields="installedcapacity_mwp"
+    )
+    response = fetch_json(url=url)
+
+    gsp_id_index = response["meta"].index("gsp_id")
+    capacity_index = response["meta"].index("installedcapacity_mwp")
+    return {int(row[gsp_id_index]): row[capacity_index] for row in response["data"]}
+
+
+def fetch_pvlive_metadata(domain_url: str) -> pd.DataFrame:
+    """
+    Get the name and installed capacity of every gsp from PVLive
+
+    :param domain_url: the PVLive domain, e.g 'api.pvlive.uk'
+    :return: dataframe with columns 'gsp_id', 'gsp_name' and 'installed_capacity_mw'
+    """
+    response = fetch_json(url=make_gsp_list_url(domain_url=domain_url))
+    gsp_list_df = pd.DataFrame(data=response["data"], columns=response["meta"])
+    gsp_ids = [int(gsp_id) for gsp_id in gsp_list_df["gsp_id"]]
+    logger.info(f"Found {len(gsp_ids)} gsps in PVLive, getting their installed capacities")
+
+    capacities = fetch_installed_capacities(domain_url=domain_url)
+    if len(capacities) < len(gsp_ids):
+        logger.info(f"PVLive has no installed capacity for {len(gsp_ids) - len(capacities)} gsps")
+
+    return pd.DataFrame(
+        {
+            "gsp_id": gsp_ids,
+            "gsp_name": gsp_list_df["gsp_name"].tolist(),
+            "installed_capacity_mw": [capacities.get(gsp_id) for gsp_id in gsp_ids],
+        }
+    )
+
+
+def get_location_metadata(session: Session) -> pd.DataFrame:
+    """
+    Load the metadata of all the gsp locations, without loading the ORM objects
+
+    :param session: database session
+    :return: dataframe with columns 'id', 'gsp_id', 'gsp_name', 'region_name'
+        and 'installed_capacity_mw'
+    """
+    query = select(
+        LocationSQL.id,
+        LocationSQL.gsp_id,
+        LocationSQL.gsp_name,
+        LocationSQL.region_name,
+        LocationSQL.installed_capacity_mw,
+    ).where(LocationSQL.gsp_id.is_not(None))
+    rows = session.execute(query).all()
+
+    return pd.DataFrame(
+        rows, columns=["id", "gsp_id", "gsp_name", "region_name", "installed_capacity_mw"]
+    )
+
+
+def find_metadata_changes(
+    location_df: pd.DataFrame, pvlive_metadata_df: pd.DataFrame
+) -> List[Dict]:
+    """
+    Find the changes to make to the locations
+
+    - the installed capacity is updated, if PVLive has one
+    - the gsp name is updated, apart from for national
+    - the region name is set to the gsp name, if there is no region name
+
+    :param location_df: from 'get_location_metadata'
+    :param pvlive_metadata_df: from 'fetch_pvlive_metadata'
+    :return: list of changes, each a dictionary with the location 'id' and the new values
+    """
+    merged_df = location_df.merge(
+        pvlive_metadata_df, on="gsp_id", how="inner", suffixes=("", "_pvlive")
+    )
+
+    changes = []
+    for row in merged_df.itertuples(index=False):
+        change = {}
+
+        new_capacity = row.installed_capacity_mw_pvlive
+        if pd.notna(new_capacity) and new_capacity != row.installed_capacity_mw:
+            change["installed_capacity_mw"] = float(new_capacity)
+
+        if row.gsp_id != 0 and pd.notna(row.gsp_name_pvlive):
+            if row.gsp_name != row.gsp_name_pvlive:
+                change["gsp_name"] = row.gsp_name_pvlive
+            if pd.isna(row.region_name):
+                change["region_name"] = row.gsp_name_pvlive
+
+        if len(change) > 0:
+            logger.info(f"GSP {row.gsp_id} will be updated with {change}")
+            changes.append({"id": int(row.id), **change})
+
+    logger.info(f"Found {len(changes)} gsp locations to update, out of {len(location_df)}")
+
+    return changes
+
+
+def update_locations(session: Session, changes: List[Dict]):
+    """
+    Apply the changes to the locations in one bulk update, by primary key
+
+    :param session: database session
+    :param changes: list of changes, from 'find_metadata_changes'
+    """
+    if len(changes) == 0:
+        return
+
+    session.execute(update(LocationSQL), changes)
+    session.commit()
+    logger.info(f"Updated {len(changes)} gsp locations")
+
+
+if __name__ == "__main__":
+    refresh_metadata()
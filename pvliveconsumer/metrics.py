@@ -0,0 +1,158 @@
+""" Metrics for each run, exported for Prometheus
+
+The metrics are written to a textfile, for the node exporter textfile collector, if
+METRICS_FILE is set, and pushed to a Prometheus push gateway if METRICS_PUSH_URL is set.
+"""
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.exposition import push_to_gateway, write_to_textfile
+
+from pvliveconsumer.memory import track_memory
+from pvliveconsumer.tracing import span
+
+logger = logging.getLogger(__name__)
+
+registry = CollectorRegistry()
+
+stage_duration_seconds = Histogram(
+    "pvliveconsumer_stage_duration_seconds",
+    "Time taken by each stage of a run",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+    registry=registry,
+)
+pvlive_request_duration_seconds = Histogram(
+    "pvliveconsumer_pvlive_request_duration_seconds",
+    "Time taken by each request to PVLive",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+    registry=registry,
+)
+pvlive_bytes_downloaded = Counter(
+    "pvliveconsumer_pvlive_bytes_downloaded",
+    "Bytes downloaded from PVLive",
+    registry=registry,
+)
+rows_written = Counter(
+    "pvliveconsumer_rows_written",
+    "Number of gsp yields written to the database",
+    ["regime"],
+    registry=registry,
+)
+wasted_requests = Counter(
+    "pvliveconsumer_wasted_requests",
+    "Number of gsps pulled from PVLive that had no new or revised gsp yields",
+    ["regime"],
+    registry=registry,
+)
+national_commit_latency_seconds = Gauge(
+    "pvliveconsumer_national_commit_latency_seconds",
+    "Time from the start of the run until national is saved to the database",
+    registry=registry,
+)
+circuit_breaker_open = Gauge(
+    "pvliveconsumer_circuit_breaker_open",
+    "If the circuit breaker for requests to PVLive was open at the end of the run",
+    registry=registry,
+)
+n_failed_gsps = Gauge(
+    "pvliveconsumer_failed_gsps",
+    "Number of gsps that could not be pulled and saved in the run, even after being tried again",
+    registry=registry,
+)
+publish_to_commit_seconds = Histogram(
+    "pvliveconsumer_publish_to_commit_seconds",
+    "Time from PVLive updating a value to it being saved to the database",
+    ["regime"],
+    buckets=(60, 300, 600, 900, 1800, 3600, 7200, 14400, 43200, 86400, 172800),
+    registry=registry,
+)
+data_to_commit_seconds = Histogram(
+    "pvliveconsumer_data_to_commit_seconds",
+    "Time from the datetime of a value to it being saved to the database",
+    ["regime"],
+    buckets=(600, 1200, 1800, 2700, 3600, 7200, 14400, 43200, 86400, 172800),
+    registry=registry,
+)
+
+
+def _as_utc(datetime_utc: Optional[datetime]) -> Optional[datetime]:
+    """Add UTC to a naive datetime, as the database gives naive datetimes in UTC"""
+    if datetime_utc is not None and datetime_utc.tzinfo is None:
+        return datetime_utc.replace(tzinfo=timezone.utc)
+    return datetime_utc
+
+
+def observe_freshness(
+    gsp_yield_values: List[Tuple[str, datetime, Optional[datetime]]],
+    commit_datetime_utc: datetime,
+):
+    """
+    Record how long after PVLive published each gsp yield it was saved to the database
+
+    :param gsp_yield_values: list of (regime, datetime_utc, pvlive_updated_utc)
+        for the gsp yields that were saved
+    :param commit_datetime_utc: when the gsp yields were saved, timezone aware
+    """
+    for regime, datetime_utc, pvlive_updated_utc in gsp_yield_values:
+        data_to_commit = commit_datetime_utc - _as_utc(datetime_utc)
+        data_to_commit_seconds.labels(regime=regime).observe(data_to_commit.total_seconds())
+
+        if pvlive_updated_utc is not None:
+            publish_to_commit = commit_datetime_utc - _as_utc(pvlive_updated_utc)
+            publish_to_commit_seconds.labels(regime=regime).observe(
+                publish_to_commit.total_seconds()
+            )
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Time a stage of the run
+
+    The stage is also traced in sentry if tracing is enabled,
+    and its memory is tracked if memory tracking has been started.
+
+    Use like 'with stage_timer("transform"):'
+
+    :param stage: name of the stage
+    """
+    with (
+        span(op=stage),
+        track_memory(stage=stage),
+        stage_duration_seconds.labels(stage=stage).time(),
+    ):
+        yield
+
+
+def export_metrics(regime: str = "in-day"):
+    """
+    Write the metrics to METRICS_FILE and push them to METRICS_PUSH_URL, if they are set
+
+    A metrics file or push gateway that is not available is logged as a warning.
+
+    :param regime: if its "in-day" or "day-after", used to group the pushed metrics
+    """
+    metrics_file = os.getenv("METRICS_FILE")
+    metrics_push_url = os.getenv("METRICS_PUSH_URL")
+
+    try:
+        if metrics_file is not None:
+            logger.debug(f"Writing metrics to {metrics_file}")
+            write_to_textfile(metrics_file, registry)
+
+        if metrics_push_url is not None:
+            logger.debug(f"Pushing metrics to {metrics_push_url}")
+            push_to_gateway(
+                metrics_push_url,
+                job="pvliveconsumer",
+                grouping_key={"regime": regime},
+                registry=registry,
+                timeout=5,
+            )
+    except Exception as e:
+        logger.warning(f"Could not export metrics: {e}")
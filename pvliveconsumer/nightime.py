@@ -41,6 +41,10 @@ def make_night_time_zeros(
     if regime != "in-day":
         return gsp_yield_df
 
+    if gsp.gsp_id not in gsp_locations.index:
+        logger.warning(f"No location for GSP {gsp.gsp_id}, so can not add night time zeros")
+        return pd.DataFrame()
+
     gsp_location = gsp_locations.loc[gsp.gsp_id]
     longitude = gsp_location["longitude"]
     latitude = gsp_location["latitude"]
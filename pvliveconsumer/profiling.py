@@ -0,0 +1,130 @@
+""" Sampling profiler, to find where a run spends its time
+
+A background thread samples the stack of the main thread every few milliseconds. The samples are
+written as folded stacks, one 'frame;frame;frame count' line per stack, which can be turned into a
+flamegraph by 'flamegraph.pl', 'inferno' or 'speedscope'. A summary of the hottest functions is
+also logged.
+"""
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def frame_label(frame) -> str:
+    """
+    Make a label for a stack frame, like 'function (file.py:10)'
+
+    :param frame: python frame
+    :return: label
+    """
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """Sample the stack of a thread at a regular interval"""
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        """
+        Set up the profiler
+
+        :param interval: seconds between samples
+        :param thread_id: the thread to sample, defaults to the thread that made the profiler
+        """
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        """Start sampling"""
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling"""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        """Take samples until stopped"""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+
+    @property
+    def n_samples(self) -> int:
+        """Total number of samples taken"""
+        return sum(self.stacks.values())
+
+    def write_folded(self, output_file: str):
+        """
+        Write the samples as folded stacks
+
+        :param output_file: the file to write to
+        """
+        with open(output_file, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top_functions(self, n: int = 20) -> List[Tuple[str, int, int]]:
+        """
+        Get the functions with the most samples
+
+        :param n: number of functions
+        :return: list of (function, self samples, total samples), ordered by self samples
+        """
+        self_counts = Counter()
+        total_counts = Counter()
+        for stack, count in self.stacks.items():
+            labels = stack.split(";")
+            self_counts[labels[-1]] += count
+            for label in set(labels):
+                total_counts[label] += count
+
+        return [(label, count, total_counts[label]) for label, count in self_counts.most_common(n)]
+
+
+@contextmanager
+def profile(output_file: Optional[str] = None, top_n: int = 20, interval: float = 0.005):
+    """
+    Profile the code in the 'with' block, if an output file is given
+
+    :param output_file: file to write the folded stacks to. If None, nothing is profiled
+    :param top_n: number of the hottest functions to log
+    :param interval: seconds between samples
+    """
+    if output_file is None:
+        yield
+        return
+
+    profiler = SamplingProfiler(interval=interval)
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        profiler.write_folded(output_file)
+
+        n_samples = max(profiler.n_samples, 1)
+        logger.info(f"Profile of {profiler.n_samples} samples written to {output_file}")
+        logger.info("Hottest functions (self %, total %):")
+        for label, self_count, total_count in profiler.top_functions(n=top_n):
+            logger.info(
+                f"{100 * self_count / n_samples:5.1f}% {100 * total_count / n_samples:5.1f}% "
+                f"{label}"
+            )
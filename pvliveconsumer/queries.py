@@ -0,0 +1,96 @@
+""" The queries that are run every time, built once
+
+The statements are made once, with bound parameters, rather than each time they are run.
+This means sqlalchemy does not have to build them and work out their cache key each run,
+and the compiled sql is reused from the engine's compiled cache.
+Lists of gsp ids use 'expanding' parameters, so the same statement is used for any number of gsps.
+The database still plans the queries each time, as psycopg2 does not support server side
+prepared statements.
+"""
+from nowcasting_datamodel.models.gsp import GSPYieldSQL, LocationSQL
+from sqlalchemy import bindparam, desc, func, select
+from sqlalchemy.dialects.postgresql import distinct_on
+from sqlalchemy.orm import contains_eager
+
+# the latest gsp yield for each gsp, since 'start'
+latest_gsp_yields_statement = (
+    select(LocationSQL.gsp_id, GSPYieldSQL)
+    .join(LocationSQL, LocationSQL.id == GSPYieldSQL.location_id)
+    .where(GSPYieldSQL.regime == bindparam("regime"))
+    .where(GSPYieldSQL.datetime_utc >= bindparam("start"))
+    .where(LocationSQL.gsp_id.in_(bindparam("gsp_ids", expanding=True)))
+    .ext(distinct_on(LocationSQL.gsp_id))
+    .order_by(LocationSQL.gsp_id, desc(GSPYieldSQL.datetime_utc), desc(GSPYieldSQL.created_utc))
+)
+
+# the gsp yield values in a window, from 'start' up to but not including 'end'
+existing_gsp_yields_statement = (
+    select(
+        LocationSQL.gsp_id,
+        GSPYieldSQL.datetime_utc,
+        GSPYieldSQL.solar_generation_kw,
+        GSPYieldSQL.pvlive_updated_utc,
+        GSPYieldSQL.created_utc,
+    )
+    .join(LocationSQL, LocationSQL.id == GSPYieldSQL.location_id)
+    .where(GSPYieldSQL.regime == bindparam("regime"))
+    .where(GSPYieldSQL.datetime_utc >= bindparam("start"))
+    .where(GSPYieldSQL.datetime_utc < bindparam("end"))
+    .where(LocationSQL.gsp_id.in_(bindparam("gsp_ids", expanding=True)))
+)
+
+# the number of gsp yields from 'start' to 'end', not including national
+count_gsp_yields_statement = (
+    select(func.count(GSPYieldSQL.id))
+    .join(LocationSQL, LocationSQL.id == GSPYieldSQL.location_id)
+    .where(GSPYieldSQL.datetime_utc >= bindparam("start"))
+    .where(GSPYieldSQL.datetime_utc <= bindparam("end"))
+    .where(LocationSQL.gsp_id != 0)
+)
+count_gsp_yields_in_regime_statement = count_gsp_yields_statement.where(
+    GSPYieldSQL.regime == bindparam("regime")
+)
+
+# the latest gsp yield for each gsp and datetime from 'start' to 'end', with their locations,
+# and not including nans (nan + 1 > nan is false)
+gsp_yields_statement = (
+    select(GSPYieldSQL)
+    .join(LocationSQL, LocationSQL.id == GSPYieldSQL.location_id)
+    .options(contains_eager(GSPYieldSQL.location))
+    .where(GSPYieldSQL.regime == bindparam("regime"))
+    .where(GSPYieldSQL.datetime_utc >= bindparam("start"))
+    .where(GSPYieldSQL.datetime_utc <= bindparam("end"))
+    .where(GSPYieldSQL.solar_generation_kw + 1 > GSPYieldSQL.solar_generation_kw)
+    .where(LocationSQL.gsp_id.in_(bindparam("gsp_ids", expanding=True)))
+    .ext(distinct_on(LocationSQL.gsp_id, GSPYieldSQL.datetime_utc))
+    .order_by(LocationSQL.gsp_id, desc(GSPYieldSQL.datetime_utc), desc(GSPYieldSQL.created_utc))
+)
+
+# when each gsp yield since 'start' was first published by PVLive
+first_published = (
+    select(
+        GSPYieldSQL.location_id,
+        GSPYieldSQL.datetime_utc,
+        func.min(GSPYieldSQL.pvlive_updated_utc).label("first_updated_utc"),
+    )
+    .where(GSPYieldSQL.regime == bindparam("regime"))
+    .where(GSPYieldSQL.datetime_utc >= bindparam("start"))
+    .where(GSPYieldSQL.pvlive_updated_utc.is_not(None))
+    .group_by(GSPYieldSQL.location_id, GSPYieldSQL.datetime_utc)
+    .subquery()
+)
+
+# the median time, in seconds, from the datetime of a gsp yield to PVLive first publishing it,
+# for each gsp. Night time zeros can have been published before their datetime, so are not used
+publication_lag = first_published.c.first_updated_utc - first_published.c.datetime_utc
+publication_lags_statement = (
+    select(
+        LocationSQL.gsp_id,
+        func.percentile_cont(0.5).within_group(func.extract("epoch", publication_lag)),
+    )
+    .join(LocationSQL, LocationSQL.id == first_published.c.location_id)
+    .where(first_published.c.first_updated_utc >= first_published.c.datetime_utc)
+    .where(LocationSQL.gsp_id.in_(bindparam("gsp_ids", expanding=True)))
+    .group_by(LocationSQL.gsp_id)
+)
+
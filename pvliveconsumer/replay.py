@@ -0,0 +1,148 @@
+""" Replay the raw PVLive archive into the database, without calling PVLive
+
+The archive is read one day at a time, and each day goes through the same transform and writer
+as the live app. Only new or revised gsp yields are written, so a replay can be run several times.
+
+    python -m pvliveconsumer.replay --archive-dir=archive --start=2025-04-01 --end=2025-04-08
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import click
+from nowcasting_datamodel.connection import DatabaseConnection
+from nowcasting_datamodel.models.base import Base_Forecast
+from nowcasting_datamodel.models.gsp import LocationSQL
+from sqlalchemy.orm import Session
+
+from pvliveconsumer.app import transform_gsp_yield_df_and_save
+from pvliveconsumer.archive import read_archive
+from pvliveconsumer.gsps import get_gsps
+
+logger = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option(
+    "--db-url",
+    default=None,
+    envvar="DB_URL",
+    help="The Database URL where gsp yields will be saved",
+    type=click.STRING,
+)
+@click.option(
+    "--archive-dir",
+    envvar="ARCHIVE_DIR",
+    help="The folder of the raw PVLive archive",
+    type=click.STRING,
+    required=True,
+)
+@click.option(
+    "--regime",
+    default="day-after",
+    envvar="REGIME",
+    help="regime to replay, either 'in-day' or 'day-after'",
+    type=click.STRING,
+)
+@click.option(
+    "--start",
+    help="Start of the data to replay, in UTC",
+    type=click.DateTime(),
+    required=True,
+)
+@click.option(
+    "--end",
+    help="End of the data to replay, in UTC. Data before this is replayed",
+    type=click.DateTime(),
+    required=True,
+)
+@click.option(
+    "--n-gsps",
+    default=342,
+    envvar="N_GSPS",
+    help="Number of gsps",
+    type=click.INT,
+)
+def replay(
+    db_url: str,
+    archive_dir: str,
+    regime: str,
+    start: datetime,
+    end: datetime,
+    n_gsps: int = 342,
+):
+    """
+    Replay the raw PVLive archive into the database
+
+    :param db_url: the Database url to save the gsp yields to
+    :param archive_dir: the folder of the raw PVLive archive
+    :param regime: if its "in-day" or "day-after"
+    :param start: start of the data to replay, in UTC
+    :param end: end of the data to replay, in UTC
+    :param n_gsps: number of gsps, not including national
+    """
+    start = start.replace(tzinfo=timezone.utc)
+    end = end.replace(tzinfo=timezone.utc)
+
+    connection = DatabaseConnection(url=db_url, base=Base_Forecast, echo=False)
+    with connection.get_session() as session:
+        gsps = get_gsps(session=session, n_gsps=n_gsps, regime=regime, include_national=True)
+        replay_archive(
+            session=session,
+            gsps=gsps,
+            archive_dir=archive_dir,
+            regime=regime,
+            start=start,
+            end=end,
+        )
+
+
+def replay_archive(
+    session: Session,
+    gsps: List[LocationSQL],
+    archive_dir: str,
+    regime: str,
+    start: datetime,
+    end: datetime,
+):
+    """
+    Replay the raw PVLive archive into the database, one day at a time
+
+    :param session: database session
+    :param gsps: list of gsps
+    :param archive_dir: the folder of the raw PVLive archive
+    :param regime: if its "in-day" or "day-after"
+    :param start: start datetime, timezone aware
+    :param end: end datetime, timezone aware
+    """
+    gsp_ids = [gsp.gsp_id for gsp in gsps]
+
+    day_start = start
+    while day_start < end:
+        day_end = min(
+            end, day_start.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        )
+
+        gsp_yield_df = read_archive(
+            archive_dir=archive_dir, regime=regime, start=day_start, end=day_end
+        )
+        gsp_yield_df = gsp_yield_df[gsp_yield_df["gsp_id"].isin(gsp_ids)]
+        logger.info(f"Replaying {len(gsp_yield_df)} raw gsp yields from {day_start} to {day_end}")
+
+        if len(gsp_yield_df) > 0:
+            transform_gsp_yield_df_and_save(
+                gsp_yield_df=gsp_yield_df,
+                gsps=gsps,
+                session=session,
+                start=day_start,
+                end=day_end,
+                regime=regime,
+                # the archived capacity may be out of date
+                update_capacity=False,
+            )
+
+        day_start = day_end
+
+
+if __name__ == "__main__":
+    replay()
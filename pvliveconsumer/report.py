@@ -0,0 +1,253 @@
+""" Summary report of a run, as json
+
+The report is built up while the app runs, and at the end it is logged on one line and
+optionally written to a file. It has, for each gsp,
+- fetch_seconds: time taken to fetch the data from PVLive
+- retries: number of retried requests to PVLive
+- n_received: number of gsp yields received from PVLive
+- fetch_error: the error, if the data could not be fetched from PVLive
+- save_error: the error, if the data could not be transformed and saved
+- night_time_zeros: number of night time zeros used, if there was no data
+- n_filtered: number of gsp yields left after transforming and filtering
+- n_written: number of new or revised gsp yields written to the database
+- capacity_update: the old and new installed capacity, if it was updated
+
+and for the whole run the regime, wall time, total retries, the total number of gsp yields
+inserted, revised and skipped as unchanged, number of backup gsp yields,
+the number of gsps pulled that had no new data, the result of probing PVLive for new data,
+the state of the circuit breaker at the end of the run, the gsps that failed, and the status of
+the run: 'success', 'partial' if some gsps failed or were not pulled as PVLive is down,
+or 'failed'.
+"""
+import json
+import logging
+from datetime import datetime, timezone
+from time import monotonic
+from typing import Dict, List, Optional
+
+from pvliveconsumer.memory import get_memory_report
+
+logger = logging.getLogger(__name__)
+
+_report: dict = {}
+_gsps: Dict[int, dict] = {}
+_started = monotonic()
+
+
+def start_report(regime: str):
+    """
+    Start a new report for a run
+
+    :param regime: if its "in-day" or "day-after"
+    """
+    global _started
+    _started = monotonic()
+    _gsps.clear()
+    _report.clear()
+    _report.update(
+        {
+            "regime": regime,
+            "started_utc": datetime.now(timezone.utc).isoformat(),
+            "retries": 0,
+            "n_inserted": 0,
+            "n_revised": 0,
+            "n_skipped": 0,
+            "n_backup_gsp_yields": 0,
+            "n_wasted_requests": 0,
+        }
+    )
+
+
+def get_gsp_report(gsp_id: int) -> dict:
+    """
+    Get the report entry of one gsp, making it if needed
+
+    :param gsp_id: the gsp id
+    :return: dictionary of results for the gsp
+    """
+    return _gsps.setdefault(int(gsp_id), {})
+
+
+def record_retry():
+    """Record that a request to PVLive was retried"""
+    _report["retries"] = _report.get("retries", 0) + 1
+
+
+def get_n_retries() -> int:
+    """Get the number of retries so far"""
+    return _report.get("retries", 0)
+
+
+def record_fetch(gsp_id: int, fetch_seconds: float, n_received: int, retries: int = 0):
+    """
+    Record fetching the data for one gsp from PVLive
+
+    :param gsp_id: the gsp id
+    :param fetch_seconds: time taken to fetch the data
+    :param n_received: number of gsp yields received
+    :param retries: number of retried requests
+    """
+    gsp_report = get_gsp_report(gsp_id)
+    gsp_report["fetch_seconds"] = round(fetch_seconds, 3)
+    gsp_report["retries"] = retries
+    gsp_report["n_received"] = n_received
+
+
+def record_fetch_error(gsp_id: int, error: Exception):
+    """
+    Record that the data for one gsp could not be fetched from PVLive
+
+    :param gsp_id: the gsp id
+    :param error: the error
+    """
+    get_gsp_report(gsp_id)["fetch_error"] = str(error)
+
+
+def record_save_error(gsp_id: int, error: Exception):
+    """
+    Record that the data for one gsp could not be transformed and saved
+
+    :param gsp_id: the gsp id
+    :param error: the error
+    """
+    get_gsp_report(gsp_id)["save_error"] = str(error)
+
+
+def record_night_time_zeros(gsp_id: int, n_gsp_yields: int):
+    """
+    Record that night time zeros were used for a gsp, as there was no data
+
+    :param gsp_id: the gsp id
+    :param n_gsp_yields: number of night time zeros
+    """
+    get_gsp_report(gsp_id)["night_time_zeros"] = n_gsp_yields
+
+
+def record_capacity_update(gsp_id: int, old_capacity: float, new_capacity: float):
+    """
+    Record that the installed capacity of a gsp was updated
+
+    :param gsp_id: the gsp id
+    :param old_capacity: the old installed capacity in MW
+    :param new_capacity: the new installed capacity in MW
+    """
+    get_gsp_report(gsp_id)["capacity_update"] = [old_capacity, new_capacity]
+
+
+def record_counts(name: str, counts: Dict[int, int]):
+    """
+    Record a count of gsp yields for several gsps
+
+    :param name: name of the count, e.g 'n_filtered' or 'n_written'
+    :param counts: dictionary of gsp id to count
+    """
+    for gsp_id, count in counts.items():
+        get_gsp_report(gsp_id)[name] = int(count)
+
+
+def record_changes(counts: Dict[str, int]):
+    """
+    Add the number of gsp yields inserted, revised and skipped as unchanged to the run totals
+
+    :param counts: dictionary with 'inserted', 'revised' and 'skipped',
+        from 'filter_unchanged_gsp_yields'
+    """
+    for name, count in counts.items():
+        _report[f"n_{name}"] = _report.get(f"n_{name}", 0) + int(count)
+
+
+def record_probe(latest_datetime_utc: Optional[datetime], skipped: bool):
+    """
+    Record the result of probing PVLive for new data
+
+    :param latest_datetime_utc: the latest datetime PVLive has published
+    :param skipped: if the pulls were skipped, as there was no new data
+    """
+    _report["probe_latest_datetime_utc"] = (
+        None if latest_datetime_utc is None else latest_datetime_utc.isoformat()
+    )
+    _report["probe_skipped"] = skipped
+
+
+def record_backup(n_gsp_yields: int):
+    """
+    Record the gsp yields made from national, as a backup
+
+    :param n_gsp_yields: number of gsp yields
+    """
+    _report["n_backup_gsp_yields"] = _report.get("n_backup_gsp_yields", 0) + n_gsp_yields
+
+
+def record_n_wasted_requests(n_wasted_requests: int):
+    """
+    Record the gsps that were pulled from PVLive, but had no new or revised gsp yields
+
+    :param n_wasted_requests: number of gsps
+    """
+    _report["n_wasted_requests"] = _report.get("n_wasted_requests", 0) + n_wasted_requests
+
+
+def record_circuit_breaker(state: str):
+    """
+    Record the state of the circuit breaker at the end of the run
+
+    :param state: 'closed', 'open' or 'half-open'
+    """
+    _report["circuit_breaker"] = state
+
+
+def record_failed_gsps(gsp_ids: List[int]):
+    """
+    Record the gsps that could not be pulled and saved, even after being tried again
+
+    :param gsp_ids: the gsp ids
+    """
+    _report["failed_gsp_ids"] = [int(gsp_id) for gsp_id in gsp_ids]
+
+
+def record_status(status: str):
+    """
+    Record the status of the run
+
+    :param status: 'success', 'partial' or 'failed'
+    """
+    _report["status"] = status
+
+
+def get_report() -> dict:
+    """
+    Get the report so far
+
+    :return: the report, as a json serializable dictionary
+    """
+    report = dict(_report)
+    report["wall_time_seconds"] = round(monotonic() - _started, 3)
+    report["n_gsps"] = len(_gsps)
+    report["gsps"] = {str(gsp_id): gsp_report for gsp_id, gsp_report in sorted(_gsps.items())}
+
+    memory_report = get_memory_report()
+    if len(memory_report) > 0:
+        report["memory"] = memory_report
+
+    return report
+
+
+def write_report(report_file: Optional[str] = None):
+    """
+    Log the report on one line, and write it to a file if one is given
+
+    The report is only for information, so if the file can not be written a warning is logged.
+
+    :param report_file: optional json file to write the report to
+    """
+    report = get_report()
+    logger.info(f"Run report: {json.dumps(report)}")
+
+    if report_file is None:
+        return
+
+    try:
+        with open(report_file, "w") as f:
+            json.dump(report, f, indent=2)
+    except Exception as e:
+        logger.warning(f"Could not write run report to {report_file}: {e}")
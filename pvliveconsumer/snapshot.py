@@ -0,0 +1,188 @@
+""" Local snapshot of the gsp locations, so they dont have to be loaded from the database each run
+
+The snapshot is a json file of the id, gsp id, label and installed capacity of each location.
+It also has a checksum of the locations, from one aggregate query. Each run the checksum is
+queried again, and if it matches the snapshot, the locations are made from the snapshot rather
+than loading the full rows. If it does not match, for example a location has been added or its
+installed capacity has changed, the snapshot is rebuilt.
+"""
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from nowcasting_datamodel.models.gsp import LocationSQL
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from pvliveconsumer.files import write_json_atomically
+
+logger = logging.getLogger(__name__)
+
+# change this if the contents of the snapshot change, so old snapshots are rebuilt
+snapshot_version = 1
+
+location_columns = ["id", "gsp_id", "label", "installed_capacity_mw"]
+
+
+def get_location_checksum(session: Session, gsp_ids: List[int]) -> Dict:
+    """
+    Get a checksum of the locations, in one aggregate query
+
+    :param session: database session
+    :param gsp_ids: the gsp ids of the locations
+    :return: dictionary of the number of locations, and sums of their columns
+    """
+    query = select(
+        func.count(LocationSQL.id),
+        func.sum(LocationSQL.id),
+        func.sum(LocationSQL.gsp_id),
+        func.sum(func.length(LocationSQL.label)),
+        func.sum(LocationSQL.installed_capacity_mw),
+    ).where(LocationSQL.gsp_id.in_(gsp_ids))
+    count, sum_id, sum_gsp_id, sum_label_length, sum_capacity = session.execute(query).one()
+
+    return {
+        "count": int(count),
+        "sum_id": int(sum_id or 0),
+        "sum_gsp_id": int(sum_gsp_id or 0),
+        "sum_label_length": int(sum_label_length or 0),
+        # rounded so it is the same after being saved as json
+        "sum_installed_capacity_mw": round(float(sum_capacity or 0), 3),
+    }
+
+
+def read_location_snapshot(
+    snapshot_file: str, gsp_ids: List[int], checksum: Dict
+) -> Optional[List[Dict]]:
+    """
+    Read the locations from the snapshot, if it is still valid
+
+    :param snapshot_file: path of the snapshot file
+    :param gsp_ids: the gsp ids of the locations
+    :param checksum: the checksum of the locations in the database
+    :return: list of locations, each a dictionary of 'location_columns',
+        or None if there is no valid snapshot
+    """
+    if not os.path.exists(snapshot_file):
+        return None
+
+    try:
+        with open(snapshot_file) as f:
+            snapshot = json.load(f)
+    except Exception as e:
+        logger.warning(f"Could not read the location snapshot {snapshot_file}: {e}")
+        return None
+
+    if snapshot.get("version") != snapshot_version:
+        logger.info(f"Location snapshot is version {snapshot.get('version')}, so rebuilding it")
+        return None
+
+    if snapshot.get("gsp_ids") != gsp_ids or snapshot.get("checksum") != checksum:
+        logger.info("Locations in the database have changed, so rebuilding the snapshot")
+        return None
+
+    return snapshot["locations"]
+
+
+def write_location_snapshot(
+    snapshot_file: str, gsp_ids: List[int], checksum: Dict, locations: List[Dict]
+):
+    """
+    Write the location snapshot
+
+    The file is written atomically, so a run never reads half a snapshot.
+
+    :param snapshot_file: path of the snapshot file
+    :param gsp_ids: the gsp ids of the locations
+    :param checksum: the checksum of the locations in the database
+    :param locations: list of locations, each a dictionary of 'location_columns'
+    """
+    snapshot = {
+        "version": snapshot_version,
+        "gsp_ids": gsp_ids,
+        "checksum": checksum,
+        "locations": locations,
+    }
+
+    write_json_atomically(json_file=snapshot_file, data=snapshot)
+
+    logger.info(f"Wrote location snapshot of {len(locations)} locations to {snapshot_file}")
+
+
+def load_locations(session: Session, gsp_ids: List[int]) -> List[Dict]:
+    """
+    Load just the columns of the locations that go in the snapshot
+
+    :param session: database session
+    :param gsp_ids: the gsp ids of the locations
+    :return: list of locations, each a dictionary of 'location_columns'
+    """
+    query = select(*[getattr(LocationSQL, column) for column in location_columns])
+    query = query.where(LocationSQL.gsp_id.in_(gsp_ids)).order_by(LocationSQL.gsp_id)
+    rows = session.execute(query).all()
+
+    return [dict(zip(location_columns, row)) for row in rows]
+
+
+def make_locations(session: Session, locations: List[Dict]) -> List[LocationSQL]:
+    """
+    Make location sqlalchemy objects, without loading them from the database
+
+    The objects are merged into the session as if they had been loaded, so gsp yields can be linked
+    to them and changes to their installed capacity are saved.
+    Any other columns are loaded from the database if they are used.
+
+    :param session: database session
+    :param locations: list of locations, each a dictionary of 'location_columns'
+    :return: list of location sqlalchemy objects
+    """
+    locations_sql = []
+    for location in locations:
+        location_sql = LocationSQL(**location)
+        make_transient_to_detached(location_sql)
+        locations_sql.append(session.merge(location_sql, load=False))
+
+    return locations_sql
+
+
+def get_locations_from_snapshot(
+    session: Session, snapshot_file: str, gsp_ids: List[int]
+) -> Optional[List[LocationSQL]]:
+    """
+    Get the locations from the snapshot, and rebuild the snapshot if it is not valid
+
+    :param session: database session
+    :param snapshot_file: path of the snapshot file
+    :param gsp_ids: the gsp ids of the locations
+    :return: list of location sqlalchemy objects, or None if not all the gsp ids
+        are in the database just once
+    """
+    checksum = get_location_checksum(session=session, gsp_ids=gsp_ids)
+
+    locations = read_location_snapshot(
+        snapshot_file=snapshot_file, gsp_ids=gsp_ids, checksum=checksum
+    )
+    if locations is None:
+        if checksum["count"] != len(gsp_ids):
+            logger.info(
+                f"Found {checksum['count']} locations in the database, should be {len(gsp_ids)}, "
+                "so not using the location snapshot"
+            )
+            return None
+
+        locations = load_locations(session=session, gsp_ids=gsp_ids)
+        if sorted(location["gsp_id"] for location in locations) != sorted(gsp_ids):
+            logger.info("Some gsp ids are in the database twice, so not using the snapshot")
+            return None
+
+        try:
+            write_location_snapshot(
+                snapshot_file=snapshot_file, gsp_ids=gsp_ids, checksum=checksum, locations=locations
+            )
+        except Exception as e:
+            logger.warning(f"Could not write the location snapshot {snapshot_file}: {e}")
+    else:
+        logger.debug(f"Using the location snapshot {snapshot_file}")
+
+    return make_locations(session=session, locations=locations)
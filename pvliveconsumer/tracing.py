@@ -0,0 +1,57 @@
+""" Sentry set up and performance tracing
+
+Tracing is off unless SENTRY_TRACING_ENABLED is true. When it is off, 'transaction' and 'span'
+return a context manager that does nothing, so there is no tracing overhead in the main loop.
+"""
+import logging
+import os
+from contextlib import nullcontext
+
+import sentry_sdk
+
+import pvliveconsumer
+
+logger = logging.getLogger(__name__)
+
+tracing_enabled = os.getenv("SENTRY_TRACING_ENABLED", "false").lower() == "true"
+traces_sample_rate = float(os.getenv("SENTRY_TRACES_SAMPLE_RATE", 1))
+
+_no_trace = nullcontext()
+
+
+def init_sentry():
+    """Set up sentry, with performance tracing if it is enabled"""
+    sentry_sdk.init(
+        dsn=os.getenv("SENTRY_DSN"),
+        environment=os.getenv("ENVIRONMENT", "local"),
+        traces_sample_rate=traces_sample_rate if tracing_enabled else None,
+    )
+
+    sentry_sdk.set_tag("app_name", "GSP_consumer")
+    sentry_sdk.set_tag("version", pvliveconsumer.__version__)
+
+
+def transaction(name: str, op: str):
+    """
+    Start a sentry transaction, if tracing is enabled
+
+    :param name: name of the transaction
+    :param op: the operation, e.g the regime
+    :return: context manager
+    """
+    if not tracing_enabled:
+        return _no_trace
+    return sentry_sdk.start_transaction(name=name, op=op)
+
+
+def span(op: str, description: str = None):
+    """
+    Start a sentry span in the current transaction, if tracing is enabled
+
+    :param op: the operation, e.g the stage of the run
+    :param description: optional description, e.g the gsp id
+    :return: context manager
+    """
+    if not tracing_enabled:
+        return _no_trace
+    return sentry_sdk.start_span(op=op, description=description)
@@ -0,0 +1,152 @@
+""" Transform PVLive data for all GSPs in one pass """
+import logging
+from datetime import datetime
+from typing import List
+
+import numpy as np
+import pandas as pd
+from nowcasting_datamodel.models.gsp import GSPYieldSQL, LocationSQL
+
+from pvliveconsumer.report import record_capacity_update
+
+logger = logging.getLogger(__name__)
+
+valid_regimes = {"in-day", "day-after"}
+
+
+def transform_gsp_yields(
+    gsp_yield_df: pd.DataFrame,
+    start: datetime,
+    end: datetime,
+    regime: str,
+) -> pd.DataFrame:
+    """
+    Filter and reshape the PVLive data for all gsps at once
+
+    1. filter on datetime
+    2. set generation to zero if the capacity is zero, for each gsp
+    3. drop nans in generation, unless all values are nans for that gsp
+    4. change units, set negative generation to zero and select columns
+
+    All the values in the window are kept, not just those after the last gsp yield, so that
+    values PVLive has revised are found by 'filter_unchanged_gsp_yields'.
+
+    :param gsp_yield_df: the PVLive data for all gsps, with a 'gsp_id' column.
+        Should also have columns 'datetime_gmt', 'generation_mw', 'installedcapacity_mwp',
+        'capacity_mwp' and 'updated_gmt'
+    :param start: the start datetime of the data we want
+    :param end: the end datetime of the data we want
+    :param regime: if its "in-day" or "day-after"
+    :return: dataframe with columns 'gsp_id', 'solar_generation_kw', 'datetime_utc',
+        'installedcapacity_mwp', 'capacity_mwp', 'pvlive_updated_utc' and 'regime'
+    """
+
+    n_gsps = gsp_yield_df["gsp_id"].nunique()
+    logger.debug(f"Transforming {len(gsp_yield_df)} gsp yields for {n_gsps} GSPs")
+
+    # filter by datetime
+    datetime_gmt = gsp_yield_df["datetime_gmt"]
+    gsp_yield_df = gsp_yield_df[(datetime_gmt >= start) & (datetime_gmt < end)]
+
+    # capacity is zero, set nans to 0
+    by_gsp = gsp_yield_df.groupby("gsp_id")
+    zero_capacity = by_gsp["capacity_mwp"].transform("sum") == 0
+    gsp_yield_df = gsp_yield_df.assign(
+        generation_mw=gsp_yield_df["generation_mw"].mask(zero_capacity, 0)
+    )
+
+    # drop nan value in generation_mw column if not all are nans
+    # this gets rid of last value if it is nan
+    generation_is_null = gsp_yield_df["generation_mw"].isnull()
+    all_generation_is_null = generation_is_null.groupby(gsp_yield_df["gsp_id"]).transform("all")
+    gsp_yield_df = gsp_yield_df[~generation_is_null | all_generation_is_null]
+
+    # need columns datetime_utc, solar_generation_kw
+    # change negative generation to 0, like the pydantic model does
+    gsp_yield_df = pd.DataFrame(
+        {
+            "gsp_id": gsp_yield_df["gsp_id"],
+            "solar_generation_kw": np.maximum(1000 * gsp_yield_df["generation_mw"], 0),
+            "datetime_utc": gsp_yield_df["datetime_gmt"],
+            "installedcapacity_mwp": gsp_yield_df["installedcapacity_mwp"],
+            "capacity_mwp": gsp_yield_df["capacity_mwp"],
+            "pvlive_updated_utc": pd.to_datetime(gsp_yield_df["updated_gmt"], utc=True),
+            "regime": regime,
+        }
+    )
+
+    n_gsps_with_data = gsp_yield_df["gsp_id"].nunique()
+    logger.debug(f"Found {len(gsp_yield_df)} gsp yields for {n_gsps_with_data} GSPs")
+
+    return gsp_yield_df
+
+
+def make_gsp_yields_sql(
+    gsp_yield_df: pd.DataFrame, gsps: List[LocationSQL], update_capacity: bool = True
+) -> List[GSPYieldSQL]:
+    """
+    Make sqlalchemy gsp yield objects, and update the installed capacity of the gsps
+
+    :param gsp_yield_df: transformed gsp yields, from 'transform_gsp_yields'
+    :param gsps: list of gsps
+    :param update_capacity: update the installed capacity of the gsps from the gsp yields.
+        This should be False for historical data, so the current capacity is kept
+    :return: list of gsp yield sqlalchemy objects
+    """
+
+    gsps_by_id = {gsp.gsp_id: gsp for gsp in gsps}
+
+    # update installed capacity, using the first value for each gsp
+    first_gsp_yields = gsp_yield_df.drop_duplicates(subset="gsp_id", keep="first")
+    if not update_capacity:
+        first_gsp_yields = first_gsp_yields.iloc[:0]
+    for gsp_id, new_installed_capacity in zip(
+        first_gsp_yields["gsp_id"], first_gsp_yields["installedcapacity_mwp"]
+    ):
+        gsp = gsps_by_id[gsp_id]
+        current_installed_capacity = gsp.installed_capacity_mw
+        new_installed_capacity = float(new_installed_capacity)
+        if current_installed_capacity != new_installed_capacity:
+            # dont update if new_installed_capacity is nan
+            if np.isnan(new_installed_capacity):
+                logger.debug("New installed capacity is nan, will not update the capacity")
+            else:
+                logger.debug(
+                    f"Going to update the capacity for GSP {gsp_id} from "
+                    f"{current_installed_capacity} to {new_installed_capacity}"
+                )
+                gsp.installed_capacity_mw = new_installed_capacity
+                record_capacity_update(
+                    gsp_id=gsp_id,
+                    old_capacity=current_installed_capacity,
+                    new_capacity=new_installed_capacity,
+                )
+
+    # check the regimes, like the pydantic model does
+    regimes = set(gsp_yield_df["regime"].unique())
+    if not regimes.issubset(valid_regimes):
+        raise Exception(f"Regime ({regimes}) not in {valid_regimes}")
+
+    # change to sqlalchemy objects straight from the columns, and add gsp systems
+    gsp_yields_sql = []
+    for gsp_id, datetime_utc, generation_kw, regime, capacity_mwp, updated_utc in zip(
+        gsp_yield_df["gsp_id"].tolist(),
+        list(gsp_yield_df["datetime_utc"].dt.to_pydatetime()),
+        gsp_yield_df["solar_generation_kw"].tolist(),
+        gsp_yield_df["regime"].tolist(),
+        gsp_yield_df["capacity_mwp"].tolist(),
+        list(gsp_yield_df["pvlive_updated_utc"].dt.to_pydatetime()),
+    ):
+        gsp_yield_sql = GSPYieldSQL(
+            datetime_utc=datetime_utc,
+            solar_generation_kw=generation_kw,
+            regime=regime,
+            capacity_mwp=capacity_mwp,
+            pvlive_updated_utc=None if pd.isnull(updated_utc) else updated_utc,
+        )
+        gsp_yield_sql.location = gsps_by_id[gsp_id]
+        gsp_yields_sql.append(gsp_yield_sql)
+
+    logger.debug(f"Made {len(gsp_yields_sql)} gsp yield objects")
+
+    return gsp_yields_sql
@@ -0,0 +1,91 @@
+"""
+Compare benchmark results to a baseline, and fail if any function has got slower
+
+Both files are json from 'pytest tests/benchmarks --benchmark-json=<file>'. For example
+
+    pytest tests/benchmarks --benchmark-only --benchmark-json=baseline.json
+    # make some changes
+    pytest tests/benchmarks --benchmark-only --benchmark-json=benchmarks.json
+    python scripts/compare_benchmarks.py baseline.json benchmarks.json --threshold 0.2
+"""
+import json
+import sys
+from typing import Dict
+
+import click
+
+
+def load_benchmarks(benchmark_file: str, stat: str) -> Dict[str, float]:
+    """
+    Load the results from a pytest-benchmark json file
+
+    :param benchmark_file: the json file
+    :param stat: the statistic to use, e.g 'median' or 'mean'
+    :return: dictionary of benchmark name to the statistic, in seconds
+    """
+    with open(benchmark_file) as f:
+        results = json.load(f)
+
+    return {benchmark["name"]: benchmark["stats"][stat] for benchmark in results["benchmarks"]}
+
+
+def compare_benchmarks(
+    baseline: Dict[str, float], current: Dict[str, float], threshold: float
+) -> Dict[str, float]:
+    """
+    Find the benchmarks that have got slower than the threshold
+
+    :param baseline: dictionary of benchmark name to time, from the baseline
+    :param current: dictionary of benchmark name to time, from this run
+    :param threshold: the allowed fractional slow down, e.g 0.2 is 20% slower
+    :return: dictionary of benchmark name to fractional slow down, for the regressions
+    """
+    regressions = {}
+    for name, current_time in sorted(current.items()):
+        if name not in baseline:
+            print(f"{name}: {current_time:.4f}s, not in the baseline")
+            continue
+
+        change = current_time / baseline[name] - 1
+        print(f"{name}: {baseline[name]:.4f}s -> {current_time:.4f}s ({100 * change:+.1f}%)")
+        if change > threshold:
+            regressions[name] = change
+
+    for name in sorted(set(baseline) - set(current)):
+        print(f"{name}: in the baseline, but was not run")
+
+    return regressions
+
+
+@click.command()
+@click.argument("baseline_file", type=click.Path(exists=True))
+@click.argument("benchmark_file", type=click.Path(exists=True))
+@click.option(
+    "--threshold",
+    default=0.2,
+    help="Allowed fractional slow down before failing, e.g 0.2 is 20% slower",
+    type=click.FLOAT,
+)
+@click.option(
+    "--stat",
+    default="median",
+    help="The statistic to compare, e.g 'median', 'mean' or 'min'",
+    type=click.STRING,
+)
+def main(baseline_file: str, benchmark_file: str, threshold: float, stat: str):
+    """Compare the benchmarks in BENCHMARK_FILE to BASELINE_FILE"""
+    baseline = load_benchmarks(baseline_file, stat=stat)
+    current = load_benchmarks(benchmark_file, stat=stat)
+
+    regressions = compare_benchmarks(baseline=baseline, current=current, threshold=threshold)
+    if len(regressions) > 0:
+        print(f"{len(regressions)} benchmarks are more than {100 * threshold:.0f}% slower:")
+        for name, change in regressions.items():
+            print(f"    {name}: {100 * change:+.1f}%")
+        sys.exit(1)
+
+    print("No benchmarks have regressed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+""" Benchmarks of the hot functions, on 340 gsps and 48 half hours of synthetic data
+
+Run with
+    pytest tests/benchmarks --benchmark-only --benchmark-json=benchmarks.json
+and compare to a baseline with
+    python scripts/compare_benchmarks.py baseline.json benchmarks.json
+"""
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from nowcasting_datamodel.models.gsp import GSPYield, GSPYieldSQL
+
+from pvliveconsumer.app import save_to_database
+from pvliveconsumer.backup import make_gsp_yields_from_national
+from pvliveconsumer.changes import get_existing_gsp_yields
+from pvliveconsumer.gsps import filter_gsps_which_have_new_data, get_latest_gsp_yields
+from pvliveconsumer.ingest import concat_columns
+from pvliveconsumer.nightime import gsp_locations, make_night_time_zeros
+from pvliveconsumer.transform import make_gsp_yields_sql, transform_gsp_yields
+
+n_gsps = 340
+n_periods = 48
+
+start = datetime(2022, 6, 1, tzinfo=timezone.utc)
+end = start + timedelta(minutes=30 * n_periods)
+datetime_utc = end + timedelta(hours=1)
+
+
+def add_last_gsp_yields(gsps):
+    for i, gsp in enumerate(gsps):
+        gsp.last_gsp_yield = GSPYieldSQL(
+            datetime_utc=start + timedelta(minutes=30 * (i % n_periods)),
+            capacity_mwp=100,
+            pvlive_updated_utc=start,
+        )
+    return gsps
+
+
+def make_gsp_yield_columns(gsps):
+    datetimes = np.array(
+        [start.replace(tzinfo=None) + timedelta(minutes=30 * i) for i in range(n_periods)],
+        dtype="datetime64[s]",
+    )
+    all_columns = []
+    for gsp in gsps:
+        all_columns.append(
+            {
+                "gsp_id": np.full(n_periods, gsp.gsp_id, dtype=np.int64),
+                "datetime_gmt": datetimes,
+                "updated_gmt": datetimes + np.timedelta64(1, "h"),
+                "generation_mw": np.linspace(0, 50, n_periods),
+                "installedcapacity_mwp": np.full(n_periods, 101.0),
+                "capacity_mwp": np.full(n_periods, 100.0),
+            }
+        )
+    return all_columns
+
+
+def transform(all_columns):
+    gsp_yield_df = concat_columns(all_columns)
+    return transform_gsp_yields(gsp_yield_df=gsp_yield_df, start=start, end=end, regime="in-day")
+
+
+def test_make_night_time_zeros(benchmark, make_gsps):
+    # only gsps with a known location, repeated to make up the numbers
+    gsp_ids = [gsp_locations.index[i % len(gsp_locations)] for i in range(n_gsps)]
+    gsps = make_gsps(gsp_ids=gsp_ids, installed_capacity_mw=100)
+
+    def make_all_night_time_zeros():
+        return [make_night_time_zeros(start, end, gsp, pd.DataFrame(), "in-day") for gsp in gsps]
+
+    results = benchmark.pedantic(make_all_night_time_zeros, rounds=3)
+    assert len(results) == n_gsps
+
+
+def test_filter_gsps_which_have_new_data(benchmark, make_gsps):
+    gsps = add_last_gsp_yields(make_gsps(gsp_ids=range(n_gsps), installed_capacity_mw=100))
+
+    results = benchmark(filter_gsps_which_have_new_data, gsps=gsps, datetime_utc=datetime_utc)
+    assert len(results) == n_gsps
+
+
+def test_transform_gsp_yields(benchmark, make_gsps):
+    gsps = make_gsps(gsp_ids=range(n_gsps), installed_capacity_mw=100)
+    all_columns = make_gsp_yield_columns(gsps)
+
+    gsp_yield_df = benchmark(transform, all_columns)
+    assert len(gsp_yield_df) == n_gsps * n_periods
+
+
+def test_make_gsp_yields_sql(benchmark, make_gsps):
+    gsps = make_gsps(gsp_ids=range(n_gsps), installed_capacity_mw=100)
+    gsp_yield_df = transform(make_gsp_yield_columns(gsps))
+
+    gsp_yields = benchmark.pedantic(
+        make_gsp_yields_sql, kwargs=dict(gsp_yield_df=gsp_yield_df, gsps=gsps), rounds=3
+    )
+    assert len(gsp_yields) == n_gsps * n_periods
+
+
+def test_make_gsp_yields_from_national(benchmark, db_session, make_gsps):
+    gsps = make_gsps(gsp_ids=range(n_gsps), installed_capacity_mw=100)
+    for i in range(n_periods):
+        datetime_utc_i = start + timedelta(minutes=30 * i)
+        gsp_yield = GSPYield(
+            datetime_utc=datetime_utc_i, solar_generation_kw=1000, regime="in-day"
+        ).to_orm()
+        gsp_yield.location = gsps[0]
+        db_session.add(gsp_yield)
+    db_session.add_all(gsps)
+    db_session.commit()
+
+    def setup():
+        # the gsp yields made in the last round are added to the session through their location,
+        # so remove them, otherwise they are flushed and there is no need for a backup
+        for gsp_yield in list(db_session.new):
+            db_session.expunge(gsp_yield)
+        kwargs = dict(session=db_session, start=start, end=end, regime="in-day", locations=gsps)
+        return (), kwargs
+
+    gsp_yields = benchmark.pedantic(make_gsp_yields_from_national, setup=setup, rounds=3)
+    assert len(gsp_yields) == (n_gsps - 1) * n_periods
+    setup()
+
+
+def test_save_to_database(benchmark, db_session, make_gsps):
+    gsps = make_gsps(gsp_ids=range(n_gsps), installed_capacity_mw=100)
+    db_session.add_all(gsps)
+    db_session.commit()
+    gsp_yield_df = transform(make_gsp_yield_columns(gsps))
+
+    def setup():
+        gsp_yields = make_gsp_yields_sql(gsp_yield_df=gsp_yield_df, gsps=gsps)
+        return (), dict(session=db_session, gsp_yields=gsp_yields)
+
+    benchmark.pedantic(save_to_database, setup=setup, rounds=3)
+    # with '--benchmark-disable' there is only one round
+    assert db_session.query(GSPYieldSQL).count() % (n_gsps * n_periods) == 0
+
+
+def add_gsp_yields(db_session, make_gsps):
+    gsps = make_gsps(gsp_ids=range(n_gsps), installed_capacity_mw=100)
+    db_session.add_all(gsps)
+    db_session.commit()
+    gsp_yield_df = transform(make_gsp_yield_columns(gsps))
+    save_to_database(session=db_session, gsp_yields=make_gsp_yields_sql(gsp_yield_df, gsps))
+    return gsps
+
+
+def test_get_latest_gsp_yields(benchmark, db_session, make_gsps):
+    gsps = add_gsp_yields(db_session, make_gsps)
+
+    gsps = benchmark(
+        get_latest_gsp_yields, session=db_session, gsps=gsps, regime="in-day", datetime_utc=start
+    )
+    assert all(gsp.last_gsp_yield is not None for gsp in gsps)
+
+
+def test_get_existing_gsp_yields(benchmark, db_session, make_gsps):
+    add_gsp_yields(db_session, make_gsps)
+
+    existing_df = benchmark(
+        get_existing_gsp_yields,
+        session=db_session,
+        gsp_ids=list(range(n_gsps)),
+        start=start,
+        end=end,
+        regime="in-day",
+    )
+    assert len(existing_df) == n_gsps * n_periods
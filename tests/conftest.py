@@ -1,10 +1,14 @@
 import os
 from datetime import datetime
+from urllib.parse import parse_qs, urlparse
 
+import pandas as pd
 import pytest
 from nowcasting_datamodel.connection import DatabaseConnection
 from nowcasting_datamodel.models.base import Base_Forecast
+from nowcasting_datamodel.models.gsp import Location
 from nowcasting_datamodel.models.models import InputDataLastUpdatedSQL
+from pvlive_api.pvlive import PVLiveException
 
 
 @pytest.fixture
@@ -29,6 +33,14 @@ def db_session(db_connection):
         s.rollback()
 
 
+@pytest.fixture(autouse=True)
+def circuit_breaker_file(tmp_path, monkeypatch):
+    """Keep the circuit breaker state of each test apart, rather than in the temporary directory"""
+    circuit_breaker_file = str(tmp_path / "circuit_breaker.json")
+    monkeypatch.setenv("CIRCUIT_BREAKER_FILE", circuit_breaker_file)
+    return circuit_breaker_file
+
+
 @pytest.fixture
 def input_data_last_updated_sql(db_session):
     now = datetime.utcnow()
@@ -39,3 +51,82 @@ def input_data_last_updated_sql(db_session):
     db_session.commit()
 
     return i
+
+
+class FakePVLive:
+    """Make PVLive like responses for the requested gsp and times
+
+    All requests fail after 'fail_after' requests, and requests for the gsp ids in 'n_failures'
+    fail that many times. The gsp ids in 'empty_gsp_ids' have no data. The generation and updated time of every value can be changed,
+    for example to make PVLive revise its values.
+    """
+
+    def __init__(self):
+        self.urls = []
+        self.fail_after = None
+        self.n_failures = {}
+        self.empty_gsp_ids = []
+        self.generation_mw = 1.0
+        self.updated_gmt = "2022-02-01T00:00:00Z"
+
+    def fetch_json(self, url, retries=3, timeout=30):
+        self.urls.append(url)
+        gsp_id = int(urlparse(url).path.split("/")[-1])
+        if self.fail_after is not None and len(self.urls) > self.fail_after:
+            raise PVLiveException("PVLive is down")
+        if self.n_failures.get(gsp_id, 0) > 0:
+            self.n_failures[gsp_id] -= 1
+            raise PVLiveException("PVLive is down")
+
+        query = parse_qs(urlparse(url).query)
+        datetimes = pd.date_range(query["start"][0], query["end"][0], freq="30min")
+        if gsp_id in self.empty_gsp_ids:
+            datetimes = []
+        data = [
+            [
+                gsp_id,
+                dt.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                self.generation_mw,
+                10.0,
+                10.0,
+                self.updated_gmt,
+            ]
+            for dt in datetimes
+        ]
+        meta = [
+            "gsp_id",
+            "datetime_gmt",
+            "generation_mw",
+            "installedcapacity_mwp",
+            "capacity_mwp",
+            "updated_gmt",
+        ]
+        return {"data": data, "meta": meta}
+
+
+@pytest.fixture
+def pvlive(monkeypatch):
+    """Fake PVLive, that answers all the requests for gsp data"""
+    pvlive = FakePVLive()
+    monkeypatch.setattr("pvliveconsumer.ingest.fetch_json", pvlive.fetch_json)
+    return pvlive
+
+
+@pytest.fixture
+def make_gsps():
+    """Factory of gsp locations, with no last gsp yield"""
+
+    def make_gsps(gsp_ids=range(3), installed_capacity_mw=10):
+        gsps = [
+            Location(
+                gsp_id=int(gsp_id),
+                label=f"GSP_{gsp_id}",
+                installed_capacity_mw=installed_capacity_mw,
+            ).to_orm()
+            for gsp_id in gsp_ids
+        ]
+        for gsp in gsps:
+            gsp.last_gsp_yield = None
+        return gsps
+
+    return make_gsps
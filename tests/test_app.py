@@ -1,9 +1,23 @@
+import json
 from click.testing import CliRunner
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
 from nowcasting_datamodel.models.gsp import GSPYieldSQL, Location, LocationSQL
 from nowcasting_datamodel.models.models import national_gb_label
 
-from pvliveconsumer.app import app, pull_data_and_save
+from pvliveconsumer.app import (
+    app,
+    make_batches,
+    partial_success_exit_code,
+    probe_for_new_data,
+    pull_data_and_save,
+    record_wasted_requests,
+)
+from pvliveconsumer.breaker import is_open, make_circuit_breaker, n_failures_to_open
+from pvliveconsumer.deadgsps import first_probe_interval, is_dead, load_dead_gsps, save_dead_gsps
+from pvliveconsumer.metrics import registry
+from pvliveconsumer.report import get_report, start_report
+from pvliveconsumer.transform import transform_gsp_yields
 
 from freezegun import freeze_time
 
@@ -17,6 +31,11 @@ def make_national(db_connection):
         session.commit()
 
 
+def get_saved_gsp_ids(session):
+    gsp_yields = session.query(GSPYieldSQL).all()
+    return sorted({gsp_yield.location.gsp_id for gsp_yield in gsp_yields})
+
+
 def test_pull_data(db_session, input_data_last_updated_sql):
     gsps = [
         Location(gsp_id=0, label="GSP_0", installed_capacity_mw=10).to_orm(),
@@ -175,3 +194,252 @@ def test_app_day_after_gsp_only_after_national(db_connection, input_data_last_up
         gsp_yields = session.query(GSPYieldSQL).all()
         assert len(gsp_yields) == 5 * 49
         # national + 4 gsps with 48 half hour settlement periods + midnight
+
+
+def test_make_batches():
+    gsps = [Location(gsp_id=i, label=f"GSP_{i}").to_orm() for i in [3, 0, 1, 2, 4]]
+
+    batches = make_batches(gsps=gsps, batch_size=2)
+
+    # national is on its own in the first batch
+    assert [[gsp.gsp_id for gsp in batch] for batch in batches] == [[0], [3, 1], [2, 4]]
+
+
+def test_make_batches_no_national():
+    gsps = [Location(gsp_id=i, label=f"GSP_{i}").to_orm() for i in [1, 2, 3]]
+
+    batches = make_batches(gsps=gsps, batch_size=2)
+
+    assert [[gsp.gsp_id for gsp in batch] for batch in batches] == [[1, 2], [3]]
+
+
+def test_record_wasted_requests():
+    gsps = [Location(gsp_id=i, label=f"GSP_{i}").to_orm() for i in [1, 2, 3]]
+    labels = {"regime": "in-day"}
+    before = registry.get_sample_value("pvliveconsumer_wasted_requests_total", labels) or 0
+
+    # gsps 2 and 3 had no new data
+    record_wasted_requests(gsps=gsps, n_written={1: 3}, regime="in-day")
+
+    after = registry.get_sample_value("pvliveconsumer_wasted_requests_total", labels)
+    assert after - before == 2
+
+
+def test_probe_for_new_data(make_gsps, monkeypatch):
+    latest_datetime_utc = datetime(2022, 1, 1, 12, tzinfo=timezone.utc)
+    latest_updated_utc = datetime(2022, 1, 1, 12, 45, tzinfo=timezone.utc)
+
+    def fake_fetch_latest_datetimes(domain_url, retries=3):
+        return latest_datetime_utc, latest_updated_utc
+
+    monkeypatch.setattr("pvliveconsumer.app.fetch_latest_datetimes", fake_fetch_latest_datetimes)
+
+    # gsp 1 is up to date, gsp 5 is dead and last had data a while ago, gsp 7 has never had data
+    gsps = make_gsps(gsp_ids=[1, 5, 7])
+    gsps[0].last_gsp_yield = GSPYieldSQL(
+        datetime_utc=latest_datetime_utc, pvlive_updated_utc=latest_updated_utc
+    )
+    gsps[1].last_gsp_yield = GSPYieldSQL(
+        datetime_utc=latest_datetime_utc - timedelta(days=2), pvlive_updated_utc=latest_updated_utc
+    )
+    dead_gsps = load_dead_gsps(dead_gsp_file=None, seed_gsp_ids=[5])
+    assert not probe_for_new_data(gsps=gsps, dead_gsps=dead_gsps)
+
+    # PVLive has revised the latest value, without publishing a new half hour
+    latest_updated_utc = datetime(2022, 1, 1, 13, tzinfo=timezone.utc)
+    assert probe_for_new_data(gsps=gsps, dead_gsps=dead_gsps)
+
+
+def test_pull_data_resume(db_session, pvlive, make_gsps, tmp_path):
+    checkpoint_file = str(tmp_path / "checkpoint.jsonl")
+    gsps = make_gsps(gsp_ids=range(1, 4))
+
+    # gsp 2 fails, even when it is tried again, so the run does not finish
+    pvlive.n_failures = {2: 2}
+    datetime_utc = datetime(2022, 1, 1, 12, 5, tzinfo=timezone.utc)
+    pull_data_and_save(
+        gsps=gsps, session=db_session, datetime_utc=datetime_utc, checkpoint_file=checkpoint_file
+    )
+
+    # in the same half hours, only gsp 2 is pulled
+    pvlive.urls.clear()
+    pull_data_and_save(
+        gsps=gsps,
+        session=db_session,
+        datetime_utc=datetime_utc + timedelta(minutes=10),
+        checkpoint_file=checkpoint_file,
+        resume=True,
+    )
+    assert [url.split("?")[0].split("/")[-1] for url in pvlive.urls] == ["2"]
+
+    # after the window has moved on, all the gsps are pulled for the new window
+    pvlive.n_failures = {2: 2}
+    pvlive.urls.clear()
+    pull_data_and_save(
+        gsps=gsps, session=db_session, datetime_utc=datetime_utc, checkpoint_file=checkpoint_file
+    )
+    old_window_url = pvlive.urls[0]
+    pvlive.urls.clear()
+    pull_data_and_save(
+        gsps=gsps,
+        session=db_session,
+        datetime_utc=datetime_utc + timedelta(minutes=30),
+        checkpoint_file=checkpoint_file,
+        resume=True,
+    )
+    assert len(pvlive.urls) == 3
+    assert pvlive.urls[0] != old_window_url
+
+
+def test_pull_data_circuit_breaker(db_session, pvlive, make_gsps):
+    pvlive.fail_after = 0
+    gsps = make_gsps(gsp_ids=range(1, 11))
+
+    # no more gsps are pulled after the circuit breaker opens
+    circuit_breaker = make_circuit_breaker()
+    pull_data_and_save(gsps=gsps, session=db_session, circuit_breaker=circuit_breaker)
+    assert len(pvlive.urls) == n_failures_to_open
+    assert is_open(circuit_breaker)
+
+    # when half open, only one request is tried
+    pvlive.urls.clear()
+    circuit_breaker["state"] = "half-open"
+    pull_data_and_save(gsps=gsps, session=db_session, circuit_breaker=circuit_breaker)
+    assert len(pvlive.urls) == 1
+    assert is_open(circuit_breaker)
+
+
+def test_pull_data_retry(db_session, pvlive, make_gsps):
+    pvlive.n_failures = {2: 1}
+
+    # gsp 2 fails, but works when it is tried again at the end
+    failed_gsp_ids = pull_data_and_save(
+        gsps=make_gsps(gsp_ids=range(1, 4)),
+        session=db_session,
+        datetime_utc=datetime(2022, 1, 1, 12, tzinfo=timezone.utc),
+    )
+    assert failed_gsp_ids == []
+    assert get_saved_gsp_ids(db_session) == [1, 2, 3]
+
+
+def test_pull_data_save_error(db_session, pvlive, make_gsps, monkeypatch):
+    def fake_transform_gsp_yields(gsp_yield_df, **kwargs):
+        if 2 in gsp_yield_df["gsp_id"].values:
+            raise Exception("Bad data for gsp 2")
+        return transform_gsp_yields(gsp_yield_df=gsp_yield_df, **kwargs)
+
+    monkeypatch.setattr("pvliveconsumer.app.transform_gsp_yields", fake_transform_gsp_yields)
+
+    # the other gsps are still saved
+    failed_gsp_ids = pull_data_and_save(
+        gsps=make_gsps(gsp_ids=range(1, 4)),
+        session=db_session,
+        datetime_utc=datetime(2022, 1, 1, 12, tzinfo=timezone.utc),
+    )
+    assert failed_gsp_ids == [2]
+    assert get_saved_gsp_ids(db_session) == [1, 3]
+
+
+def test_pull_data_process_error(db_session, pvlive, make_gsps, monkeypatch):
+    pvlive.empty_gsp_ids = [2]
+
+    def fake_make_night_time_zeros(start, end, gsp, gsp_yield_df, regime):
+        raise Exception("Bad location for gsp 2")
+
+    monkeypatch.setattr("pvliveconsumer.app.make_night_time_zeros", fake_make_night_time_zeros)
+
+    # the other gsps are still saved, and PVLive is not blamed for the error
+    start_report(regime="in-day")
+    circuit_breaker = make_circuit_breaker()
+    failed_gsp_ids = pull_data_and_save(
+        gsps=make_gsps(gsp_ids=range(1, 4)),
+        session=db_session,
+        datetime_utc=datetime(2022, 1, 1, 12, tzinfo=timezone.utc),
+        circuit_breaker=circuit_breaker,
+    )
+    assert failed_gsp_ids == [2]
+    assert get_saved_gsp_ids(db_session) == [1, 3]
+    assert "save_error" in get_report()["gsps"]["2"]
+    assert circuit_breaker["n_failures"] == 0
+
+
+def test_pull_data_probe_seeded_dead_gsp(db_session, pvlive, make_gsps, tmp_path):
+    datetime_utc = datetime(2022, 1, 1, 12, tzinfo=timezone.utc)
+    dead_gsp_file = str(tmp_path / "dead_gsps.json")
+    pvlive.empty_gsp_ids = [5]
+
+    # gsp 5 is seeded as dead, and is due to be probed. It has no location for night time zeros
+    dead_gsps = load_dead_gsps(
+        dead_gsp_file=None, seed_gsp_ids=[5], datetime_utc=datetime_utc - first_probe_interval
+    )
+    save_dead_gsps(dead_gsp_file=dead_gsp_file, dead_gsps=dead_gsps)
+
+    failed_gsp_ids = pull_data_and_save(
+        gsps=make_gsps(gsp_ids=[1, 5]),
+        session=db_session,
+        datetime_utc=datetime_utc,
+        dead_gsp_file=dead_gsp_file,
+    )
+    assert failed_gsp_ids == []
+    assert get_saved_gsp_ids(db_session) == [1]
+
+    # the probe had no data, so gsp 5 is not probed again for a while
+    dead_gsps = load_dead_gsps(dead_gsp_file=dead_gsp_file, seed_gsp_ids=[])
+    assert dead_gsps[5]["n_probes"] == 1
+    assert is_dead(dead_gsps=dead_gsps, gsp_id=5, datetime_utc=datetime_utc + first_probe_interval)
+
+
+@freeze_time("2022-01-02 12:00:00")
+def test_app_partial_success(db_connection, pvlive, tmp_path):
+    pvlive.n_failures = {2: 2}
+    report_file = str(tmp_path / "report.json")
+
+    runner = CliRunner()
+    response = runner.invoke(
+        app,
+        ["--db-url", db_connection.url, "--n-gsps", 3, "--regime", "day-after"]
+        + ["--report-file", report_file],
+    )
+    assert response.exit_code == partial_success_exit_code
+
+    with open(report_file) as f:
+        report = json.load(f)
+    assert report["status"] == "partial"
+    assert report["failed_gsp_ids"] == [2]
+    assert "fetch_error" in report["gsps"]["2"]
+
+    with db_connection.get_session() as session:
+        assert get_saved_gsp_ids(session) == [0, 1, 3]
+
+
+def test_pull_data_revised(db_session, pvlive, make_gsps):
+    datetime_utc = datetime(2022, 1, 1, 12, tzinfo=timezone.utc)
+    gsps = make_gsps(gsp_ids=[1, 2])
+    pull_data_and_save(gsps=gsps, session=db_session, datetime_utc=datetime_utc)
+    n_gsp_yields = db_session.query(GSPYieldSQL).count()
+
+    # like 'get_gsps', attach the latest gsp yield to each gsp
+    for gsp in gsps:
+        gsp.last_gsp_yield = (
+            db_session.query(GSPYieldSQL)
+            .filter(GSPYieldSQL.location_id == gsp.id)
+            .order_by(GSPYieldSQL.datetime_utc.desc())
+            .first()
+        )
+
+    # PVLive revises all its values, and they are written
+    start_report(regime="in-day")
+    pvlive.generation_mw = 2.0
+    pvlive.updated_gmt = "2022-02-02T00:00:00Z"
+    pull_data_and_save(gsps=gsps, session=db_session, datetime_utc=datetime_utc)
+
+    revised = db_session.query(GSPYieldSQL).filter(GSPYieldSQL.solar_generation_kw == 2000)
+    assert revised.count() == n_gsp_yields
+    assert get_report()["n_revised"] == n_gsp_yields
+    assert get_report()["n_inserted"] == 0
+
+    # nothing has changed, so nothing is written
+    start_report(regime="in-day")
+    pull_data_and_save(gsps=gsps, session=db_session, datetime_utc=datetime_utc)
+    assert db_session.query(GSPYieldSQL).count() == 2 * n_gsp_yields
+    assert get_report()["n_skipped"] == n_gsp_yields
@@ -0,0 +1,67 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+from pvliveconsumer.archive import get_dates, read_archive, write_archive
+from pvliveconsumer.ingest import concat_columns
+
+
+def make_gsp_yield_df(gsp_id: int, generation_mw: float):
+    datetimes = np.array(
+        ["2022-01-01T23:00", "2022-01-01T23:30", "2022-01-02T00:00"], dtype="datetime64[s]"
+    )
+    columns = {
+        "gsp_id": np.full(3, gsp_id, dtype=np.int64),
+        "datetime_gmt": datetimes,
+        "updated_gmt": datetimes,
+        "generation_mw": np.full(3, generation_mw),
+        "installedcapacity_mwp": np.full(3, 10.0),
+        "capacity_mwp": np.full(3, 10.0),
+    }
+    return concat_columns([columns])
+
+
+def test_get_dates():
+    dates = get_dates(
+        start=datetime(2022, 1, 1, 23, tzinfo=timezone.utc),
+        end=datetime(2022, 1, 3, 1, tzinfo=timezone.utc),
+    )
+    assert dates == ["2022-01-01", "2022-01-02", "2022-01-03"]
+
+
+def test_write_and_read_archive(tmp_path):
+    archive_dir = str(tmp_path)
+    write_archive(
+        archive_dir=archive_dir,
+        gsp_yield_df=make_gsp_yield_df(gsp_id=1, generation_mw=1.0),
+        regime="in-day",
+        fetched_utc=datetime(2022, 1, 2, 1, tzinfo=timezone.utc),
+    )
+    # the same data pulled again later, with revised values
+    write_archive(
+        archive_dir=archive_dir,
+        gsp_yield_df=make_gsp_yield_df(gsp_id=1, generation_mw=2.0),
+        regime="in-day",
+        fetched_utc=datetime(2022, 1, 2, 2, tzinfo=timezone.utc),
+    )
+    write_archive(
+        archive_dir=archive_dir,
+        gsp_yield_df=make_gsp_yield_df(gsp_id=2, generation_mw=3.0),
+        regime="day-after",
+    )
+
+    # partitioned by regime and date
+    assert (tmp_path / "regime=in-day" / "date=2022-01-01").is_dir()
+    assert (tmp_path / "regime=in-day" / "date=2022-01-02").is_dir()
+
+    archive_df = read_archive(
+        archive_dir=archive_dir,
+        regime="in-day",
+        start=datetime(2022, 1, 1, 23, 30, tzinfo=timezone.utc),
+        end=datetime(2022, 1, 3, tzinfo=timezone.utc),
+    )
+
+    assert list(archive_df["gsp_id"]) == [1, 1]
+    assert list(archive_df["generation_mw"]) == [2.0, 2.0]
+    # latest first, like PVLive
+    assert archive_df["datetime_gmt"].iloc[0] == datetime(2022, 1, 2, tzinfo=timezone.utc)
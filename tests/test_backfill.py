@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+
+import pytest
+from nowcasting_datamodel.models.gsp import GSPYieldSQL
+
+from pvliveconsumer.backfill import backfill_gsp_yields, make_chunks
+from pvliveconsumer.checkpoint import record_chunk_committed, start_journal
+
+start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+end = datetime(2022, 1, 4, tzinfo=timezone.utc)
+
+
+def test_make_chunks():
+    chunks = make_chunks(start=start, end=end, chunk_days=2)
+    middle = datetime(2022, 1, 3, tzinfo=timezone.utc)
+    assert chunks == [(start, middle), (middle, end)]
+
+
+def test_backfill_gsp_yields(db_session, pvlive, make_gsps, tmp_path):
+    checkpoint_file = str(tmp_path / "backfill.jsonl")
+    gsps = make_gsps(installed_capacity_mw=20)
+
+    backfill_gsp_yields(
+        session=db_session,
+        gsps=gsps,
+        regime="day-after",
+        start=start,
+        end=end,
+        chunk_days=1,
+        max_workers=2,
+        checkpoint_file=checkpoint_file,
+    )
+
+    # 3 days of half hours, for 3 gsps, with no duplicates at the chunk boundaries
+    assert db_session.query(GSPYieldSQL).count() == 3 * 48 * 3
+    assert len(pvlive.urls) == 3 * 3
+    assert not (tmp_path / "backfill.jsonl").exists()
+
+    # the historical capacity of 10 does not replace the current capacity
+    assert [gsp.installed_capacity_mw for gsp in gsps] == [20, 20, 20]
+
+
+def test_backfill_gsp_yields_resume(db_session, pvlive, make_gsps, tmp_path):
+    checkpoint_file = str(tmp_path / "backfill.jsonl")
+    gsps = make_gsps()
+
+    # the first 2 chunks are saved, and then PVLive fails
+    pvlive.fail_after = 6
+    with pytest.raises(Exception):
+        backfill_gsp_yields(
+            session=db_session,
+            gsps=gsps,
+            regime="day-after",
+            start=start,
+            end=end,
+            chunk_days=1,
+            max_workers=1,
+            checkpoint_file=checkpoint_file,
+        )
+    assert db_session.query(GSPYieldSQL).count() == 2 * 48 * 3
+
+    # resuming only pulls the last chunk
+    pvlive.fail_after = None
+    pvlive.urls.clear()
+    backfill_gsp_yields(
+        session=db_session,
+        gsps=gsps,
+        regime="day-after",
+        start=start,
+        end=end,
+        chunk_days=1,
+        checkpoint_file=checkpoint_file,
+    )
+    assert len(pvlive.urls) == 3
+    assert db_session.query(GSPYieldSQL).count() == 3 * 48 * 3
+
+
+def test_backfill_gsp_yields_different_range(db_session, pvlive, make_gsps, tmp_path):
+    checkpoint_file = str(tmp_path / "backfill.jsonl")
+    # journal from a backfill of a different range
+    start_journal(checkpoint_file=checkpoint_file, regime="day-after", start=start, end=start)
+    record_chunk_committed(checkpoint_file=checkpoint_file, chunk_start=start)
+
+    backfill_gsp_yields(
+        session=db_session,
+        gsps=make_gsps(),
+        regime="day-after",
+        start=start,
+        end=end,
+        chunk_days=1,
+        checkpoint_file=checkpoint_file,
+    )
+    assert len(pvlive.urls) == 3 * 3
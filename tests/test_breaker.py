@@ -0,0 +1,54 @@
+from pvliveconsumer.breaker import (
+    get_retries,
+    is_open,
+    load_circuit_breaker,
+    make_circuit_breaker,
+    n_failures_to_open,
+    record_failure,
+    record_success,
+    save_circuit_breaker,
+)
+
+
+def test_circuit_breaker_opens():
+    circuit_breaker = make_circuit_breaker()
+
+    for _ in range(n_failures_to_open - 1):
+        record_failure(circuit_breaker)
+    assert not is_open(circuit_breaker)
+
+    # a request that works resets the count
+    record_success(circuit_breaker)
+    assert get_retries(circuit_breaker) == 3
+    for _ in range(n_failures_to_open - 1):
+        record_failure(circuit_breaker)
+    assert not is_open(circuit_breaker)
+
+    # once a request has failed, the others are not retried
+    assert get_retries(circuit_breaker) == 0
+    record_failure(circuit_breaker)
+    assert is_open(circuit_breaker)
+
+
+def test_circuit_breaker_half_open(tmp_path):
+    circuit_breaker_file = str(tmp_path / "circuit_breaker.json")
+    assert load_circuit_breaker(circuit_breaker_file=circuit_breaker_file)["state"] == "closed"
+
+    circuit_breaker = make_circuit_breaker()
+    for _ in range(n_failures_to_open):
+        record_failure(circuit_breaker)
+    save_circuit_breaker(circuit_breaker_file=circuit_breaker_file, circuit_breaker=circuit_breaker)
+
+    # the next run tries one request, with no retries, and opens again if it fails
+    circuit_breaker = load_circuit_breaker(circuit_breaker_file=circuit_breaker_file)
+    assert circuit_breaker["state"] == "half-open"
+    assert not is_open(circuit_breaker)
+    assert get_retries(circuit_breaker) == 0
+    record_failure(circuit_breaker)
+    assert is_open(circuit_breaker)
+
+    # or is closed if it works
+    circuit_breaker = load_circuit_breaker(circuit_breaker_file=circuit_breaker_file)
+    record_success(circuit_breaker)
+    assert circuit_breaker["state"] == "closed"
+    assert get_retries(circuit_breaker) == 3
@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+from nowcasting_datamodel.models.gsp import GSPYield, Location
+
+from pvliveconsumer.changes import filter_unchanged_gsp_yields, get_existing_gsp_yields
+
+start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+end = datetime(2022, 1, 2, tzinfo=timezone.utc)
+updated = datetime(2022, 1, 1, 3, tzinfo=timezone.utc)
+
+
+def add_gsp_yields(db_session):
+    location = Location(gsp_id=1, label="GSP_1").to_orm()
+    gsp_yields = []
+    for hour, solar_generation_kw in [(0, 1), (1, 2)]:
+        gsp_yield = GSPYield(
+            datetime_utc=datetime(2022, 1, 1, hour),
+            solar_generation_kw=solar_generation_kw,
+            pvlive_updated_utc=updated,
+        ).to_orm()
+        gsp_yield.location = location
+        gsp_yields.append(gsp_yield)
+
+    db_session.add_all(gsp_yields)
+    db_session.commit()
+
+
+def test_get_existing_gsp_yields(db_session):
+    add_gsp_yields(db_session)
+
+    existing_df = get_existing_gsp_yields(
+        session=db_session, gsp_ids=[1, 2], start=start, end=end, regime="in-day"
+    )
+
+    assert len(existing_df) == 2
+    assert existing_df["datetime_utc"].iloc[0] == pd.Timestamp(datetime(2022, 1, 1), tz="UTC")
+
+    existing_df = get_existing_gsp_yields(
+        session=db_session, gsp_ids=[1], start=start, end=end, regime="day-after"
+    )
+    assert len(existing_df) == 0
+
+
+def test_filter_unchanged_gsp_yields(db_session):
+    add_gsp_yields(db_session)
+    existing_df = get_existing_gsp_yields(
+        session=db_session, gsp_ids=[1], start=start, end=end, regime="in-day"
+    )
+
+    gsp_yield_df = pd.DataFrame(
+        {
+            "gsp_id": [1, 1, 1, 2],
+            "datetime_utc": pd.to_datetime(
+                ["2022-01-01 00:00", "2022-01-01 01:00", "2022-01-01 02:00", "2022-01-01 00:00"],
+                utc=True,
+            ),
+            "solar_generation_kw": [1.0, 2.5, 3.0, 1.0],
+            "pvlive_updated_utc": pd.Timestamp(updated),
+            "regime": "in-day",
+        }
+    )
+
+    gsp_yield_df, counts = filter_unchanged_gsp_yields(
+        gsp_yield_df=gsp_yield_df, existing_df=existing_df
+    )
+
+    assert counts == {"inserted": 2, "revised": 1, "skipped": 1}
+    assert len(gsp_yield_df) == 3
+    assert list(gsp_yield_df["solar_generation_kw"]) == [2.5, 3.0, 1.0]
+
+
+def test_filter_unchanged_gsp_yields_no_existing(db_session):
+    existing_df = get_existing_gsp_yields(
+        session=db_session, gsp_ids=[1], start=start, end=end, regime="in-day"
+    )
+    gsp_yield_df = pd.DataFrame(
+        {
+            "gsp_id": [1],
+            "datetime_utc": pd.to_datetime(["2022-01-01 00:00"], utc=True),
+            "solar_generation_kw": [1.0],
+            "pvlive_updated_utc": pd.Timestamp(updated),
+            "regime": "in-day",
+        }
+    )
+
+    gsp_yield_df, counts = filter_unchanged_gsp_yields(
+        gsp_yield_df=gsp_yield_df, existing_df=existing_df
+    )
+
+    assert counts == {"inserted": 1, "revised": 0, "skipped": 0}
+    assert len(gsp_yield_df) == 1
@@ -0,0 +1,92 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from pvliveconsumer.checkpoint import (
+    complete_journal,
+    is_same_window,
+    load_journal,
+    max_journal_ages,
+    record_chunk_committed,
+    record_committed,
+    start_journal,
+)
+
+start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+end = datetime(2022, 1, 2, tzinfo=timezone.utc)
+
+
+def test_journal(tmp_path):
+    checkpoint_file = str(tmp_path / "checkpoint.jsonl")
+
+    start_journal(checkpoint_file=checkpoint_file, regime="day-after", start=start, end=end)
+    record_committed(checkpoint_file=checkpoint_file, gsp_ids=[0, 1, 2])
+    record_committed(checkpoint_file=checkpoint_file, gsp_ids=[3])
+
+    journal = load_journal(checkpoint_file=checkpoint_file, regime="day-after")
+    assert journal["start"] == start
+    assert journal["end"] == end
+    assert journal["gsp_ids"] == {0, 1, 2, 3}
+
+    # different regime
+    assert load_journal(checkpoint_file=checkpoint_file, regime="in-day") is None
+
+    complete_journal(checkpoint_file=checkpoint_file)
+    assert load_journal(checkpoint_file=checkpoint_file, regime="day-after") is None
+
+
+def test_journal_broken_last_line(tmp_path):
+    checkpoint_file = str(tmp_path / "checkpoint.jsonl")
+
+    start_journal(checkpoint_file=checkpoint_file, regime="in-day", start=start, end=end)
+    record_committed(checkpoint_file=checkpoint_file, gsp_ids=[1])
+    with open(checkpoint_file, "a") as f:
+        f.write('{"gsp_ids": [2, ')
+
+    journal = load_journal(checkpoint_file=checkpoint_file, regime="in-day")
+    assert journal["gsp_ids"] == {1}
+
+
+def test_journal_too_old(tmp_path):
+    checkpoint_file = str(tmp_path / "checkpoint.jsonl")
+    started_utc = datetime.now(timezone.utc) - timedelta(days=1)
+    line = {
+        "regime": "in-day",
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "started_utc": started_utc.isoformat(),
+    }
+    with open(checkpoint_file, "w") as f:
+        f.write(json.dumps(line) + "\n")
+
+    max_age = max_journal_ages["in-day"]
+    assert load_journal(checkpoint_file=checkpoint_file, regime="in-day", max_age=max_age) is None
+    # backfills are resumed however old they are
+    assert load_journal(checkpoint_file=checkpoint_file, regime="in-day") is not None
+
+
+def test_journal_chunks(tmp_path):
+    checkpoint_file = str(tmp_path / "checkpoint.jsonl")
+
+    start_journal(checkpoint_file=checkpoint_file, regime="day-after", start=start, end=end)
+    record_chunk_committed(checkpoint_file=checkpoint_file, chunk_start=start)
+
+    journal = load_journal(checkpoint_file=checkpoint_file, regime="day-after")
+    assert journal["chunk_starts"] == {start}
+    assert journal["gsp_ids"] == set()
+
+
+def test_is_same_window():
+    journal = {
+        "start": datetime(2022, 1, 1, 10, 5, tzinfo=timezone.utc),
+        "end": datetime(2022, 1, 1, 12, 35, tzinfo=timezone.utc),
+    }
+
+    # both windows are the half hours from 10:30 to 12:30
+    start = datetime(2022, 1, 1, 10, 20, tzinfo=timezone.utc)
+    end = datetime(2022, 1, 1, 12, 50, tzinfo=timezone.utc)
+    assert is_same_window(journal=journal, start=start, end=end)
+
+    # there is a new half hour
+    start = datetime(2022, 1, 1, 10, 35, tzinfo=timezone.utc)
+    end = datetime(2022, 1, 1, 13, 5, tzinfo=timezone.utc)
+    assert not is_same_window(journal=journal, start=start, end=end)
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta, timezone
+
+from pvliveconsumer.deadgsps import (
+    first_probe_interval,
+    is_dead,
+    load_dead_gsps,
+    n_empty_runs,
+    record_pull,
+    save_dead_gsps,
+)
+
+datetime_utc = datetime(2025, 4, 21, 12, tzinfo=timezone.utc)
+
+
+def test_load_dead_gsps_seed(tmp_path):
+    dead_gsp_file = str(tmp_path / "dead_gsps.json")
+
+    dead_gsps = load_dead_gsps(
+        dead_gsp_file=dead_gsp_file, seed_gsp_ids=[5, 17], datetime_utc=datetime_utc
+    )
+    assert is_dead(dead_gsps=dead_gsps, gsp_id=5, datetime_utc=datetime_utc)
+    assert not is_dead(dead_gsps=dead_gsps, gsp_id=1, datetime_utc=datetime_utc)
+
+    # gsp 5 has data again, which is remembered, so it is not seeded as dead again
+    record_pull(dead_gsps=dead_gsps, gsp_id=5, has_data=True, datetime_utc=datetime_utc)
+    save_dead_gsps(dead_gsp_file=dead_gsp_file, dead_gsps=dead_gsps)
+    dead_gsps = load_dead_gsps(
+        dead_gsp_file=dead_gsp_file, seed_gsp_ids=[5, 17], datetime_utc=datetime_utc
+    )
+    assert not is_dead(dead_gsps=dead_gsps, gsp_id=5, datetime_utc=datetime_utc)
+    assert is_dead(dead_gsps=dead_gsps, gsp_id=17, datetime_utc=datetime_utc)
+
+
+def test_record_pull():
+    dead_gsps = {}
+
+    # dead after n empty runs in a row
+    for i in range(n_empty_runs):
+        assert not is_dead(dead_gsps=dead_gsps, gsp_id=1, datetime_utc=datetime_utc)
+        record_pull(dead_gsps=dead_gsps, gsp_id=1, has_data=False, datetime_utc=datetime_utc)
+    assert is_dead(dead_gsps=dead_gsps, gsp_id=1, datetime_utc=datetime_utc)
+
+    # probed again after the first interval, and then after double the interval
+    probe_utc = datetime_utc + first_probe_interval
+    assert not is_dead(dead_gsps=dead_gsps, gsp_id=1, datetime_utc=probe_utc)
+    record_pull(dead_gsps=dead_gsps, gsp_id=1, has_data=False, datetime_utc=probe_utc)
+    assert is_dead(dead_gsps=dead_gsps, gsp_id=1, datetime_utc=probe_utc + first_probe_interval)
+    next_probe_utc = probe_utc + 2 * first_probe_interval
+    assert not is_dead(dead_gsps=dead_gsps, gsp_id=1, datetime_utc=next_probe_utc)
+
+    # pulled every run as soon as it has data
+    record_pull(dead_gsps=dead_gsps, gsp_id=1, has_data=True, datetime_utc=next_probe_utc)
+    assert not is_dead(dead_gsps=dead_gsps, gsp_id=1, datetime_utc=next_probe_utc)
+    record_pull(dead_gsps=dead_gsps, gsp_id=1, has_data=False, datetime_utc=next_probe_utc)
+    assert not is_dead(
+        dead_gsps=dead_gsps, gsp_id=1, datetime_utc=next_probe_utc + timedelta(minutes=5)
+    )
+
+
+def test_record_pull_not_in_a_row():
+    dead_gsps = {}
+
+    for has_data in [False] * (n_empty_runs - 1) + [True] + [False] * (n_empty_runs - 1):
+        record_pull(dead_gsps=dead_gsps, gsp_id=1, has_data=has_data, datetime_utc=datetime_utc)
+
+    assert not is_dead(dead_gsps=dead_gsps, gsp_id=1, datetime_utc=datetime_utc)
@@ -0,0 +1,15 @@
+import json
+import os
+
+from pvliveconsumer.files import write_json_atomically
+
+
+def test_write_json_atomically(tmp_path):
+    json_file = str(tmp_path / "state.json")
+
+    write_json_atomically(json_file=json_file, data={"a": 1})
+    write_json_atomically(json_file=json_file, data={"a": 2})
+
+    with open(json_file) as f:
+        assert json.load(f) == {"a": 2}
+    assert os.listdir(tmp_path) == ["state.json"]
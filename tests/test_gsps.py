@@ -1,11 +1,21 @@
 import os
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from typing import List
 
+import pytest
+
 from nowcasting_datamodel.models.gsp import GSPYield, Location, LocationSQL
 from nowcasting_datamodel.read.read_gsp import get_latest_gsp_yield
+from sqlalchemy import text
 
-from pvliveconsumer.gsps import filter_gsps_which_have_new_data, get_gsps
+from pvliveconsumer.gsps import (
+    filter_gsps_which_have_new_data,
+    get_gsps,
+    get_publication_lags,
+    has_new_data,
+    order_gsps_by_priority,
+    shard_gsps,
+)
 
 
 def test_get_gsps(db_session):
@@ -53,3 +63,227 @@ def test_filter_pv_systems_which_have_new_data(db_session):
 
     assert len(gsps_keep) == 1
     assert gsps_keep[0].id == 1
+
+
+def make_gsps_with_last_yield(n_gsps: int, last_datetime_utc: datetime) -> List[LocationSQL]:
+    gsps = []
+    for gsp_id in range(n_gsps + 1):
+        gsp = Location(gsp_id=gsp_id, label=f"GSP_{gsp_id}").to_orm()
+        gsp.last_gsp_yield = GSPYield(
+            datetime_utc=last_datetime_utc, solar_generation_kw=1
+        ).to_orm()
+        gsps.append(gsp)
+    return gsps
+
+
+def test_shard_gsps():
+    datetime_utc = datetime(2022, 1, 1, 12, tzinfo=timezone.utc)
+    gsps = make_gsps_with_last_yield(n_gsps=10, last_datetime_utc=datetime(2022, 1, 1, 11, 30))
+
+    all_gsp_ids = []
+    for shard_index in range(3):
+        shard = shard_gsps(
+            gsps=gsps, shard_index=shard_index, shard_count=3, datetime_utc=datetime_utc
+        )
+        all_gsp_ids += [gsp.gsp_id for gsp in shard]
+
+    # every gsp is in exactly one shard, and national is in the first shard
+    assert sorted(all_gsp_ids) == list(range(11))
+    assert all_gsp_ids.count(0) == 1
+    assert 0 in [gsp.gsp_id for gsp in shard_gsps(gsps=gsps, shard_index=0, shard_count=3)]
+
+
+def test_shard_gsps_takeover():
+    datetime_utc = datetime(2022, 1, 1, 12, tzinfo=timezone.utc)
+    gsps = make_gsps_with_last_yield(n_gsps=4, last_datetime_utc=datetime(2022, 1, 1, 9))
+    gsps[3].last_gsp_yield.datetime_utc = datetime(2022, 1, 1, 11, 30)
+
+    shard = shard_gsps(
+        gsps=gsps,
+        shard_index=0,
+        shard_count=2,
+        takeover_after=timedelta(hours=1),
+        datetime_utc=datetime_utc,
+    )
+
+    # gsp 3 is owned by the other shard and is up to date, so it is not taken over
+    assert [gsp.gsp_id for gsp in shard] == [0, 1, 2, 4]
+
+
+def test_shard_gsps_takeover_one_shard():
+    datetime_utc = datetime(2022, 1, 1, 12, tzinfo=timezone.utc)
+    gsps = make_gsps_with_last_yield(n_gsps=6, last_datetime_utc=datetime(2022, 1, 1, 9))
+    # gsp 4 has had no data for longer than the gsp yields are loaded for
+    gsps[4].last_gsp_yield = None
+
+    all_gsp_ids = []
+    for shard_index in range(3):
+        shard = shard_gsps(
+            gsps=gsps,
+            shard_index=shard_index,
+            shard_count=3,
+            takeover_after=timedelta(hours=1),
+            datetime_utc=datetime_utc,
+        )
+        all_gsp_ids += [gsp.gsp_id for gsp in shard]
+
+    # every gsp is stale, and is pulled by its own shard and only the next shard
+    assert sorted(all_gsp_ids) == sorted(2 * list(range(7)))
+    shard_1 = shard_gsps(
+        gsps=gsps,
+        shard_index=1,
+        shard_count=3,
+        takeover_after=timedelta(hours=1),
+        datetime_utc=datetime_utc,
+    )
+    assert [gsp.gsp_id for gsp in shard_1] == [0, 1, 3, 4, 6]
+
+
+def test_shard_gsps_wrong_index():
+    with pytest.raises(Exception):
+        shard_gsps(gsps=[], shard_index=2, shard_count=2)
+
+
+def test_order_gsps_by_priority():
+    gsps = make_gsps_with_last_yield(n_gsps=3, last_datetime_utc=datetime(2022, 1, 1, 12))
+    gsps[0].installed_capacity_mw = 1000
+    gsps[1].installed_capacity_mw = 10
+    gsps[2].installed_capacity_mw = 20
+    gsps[3].last_gsp_yield = None
+    gsps[1].last_gsp_yield.datetime_utc = datetime(2022, 1, 1, 11, tzinfo=timezone.utc)
+
+    gsps = order_gsps_by_priority(gsps=gsps)
+
+    # no data, then stalest, then by installed capacity
+    assert [gsp.gsp_id for gsp in gsps] == [3, 1, 0, 2]
+
+
+def test_has_new_data():
+    latest_datetime_utc = datetime(2022, 1, 1, 12, tzinfo=timezone.utc)
+    gsps = make_gsps_with_last_yield(n_gsps=3, last_datetime_utc=datetime(2022, 1, 1, 12))
+    assert not has_new_data(gsps=gsps, latest_datetime_utc=latest_datetime_utc)
+    assert not has_new_data(gsps=gsps, latest_datetime_utc=None)
+
+    # one gsp is behind
+    gsps[2].last_gsp_yield.datetime_utc = datetime(2022, 1, 1, 11, 30)
+    assert has_new_data(gsps=gsps, latest_datetime_utc=latest_datetime_utc)
+
+    # one gsp has no data, which PVLive probably has no data for either
+    gsps = make_gsps_with_last_yield(n_gsps=3, last_datetime_utc=datetime(2022, 1, 1, 12))
+    gsps[1].last_gsp_yield = None
+    assert not has_new_data(gsps=gsps, latest_datetime_utc=latest_datetime_utc)
+
+    # no gsp has data yet
+    for gsp in gsps:
+        gsp.last_gsp_yield = None
+    assert has_new_data(gsps=gsps, latest_datetime_utc=latest_datetime_utc)
+
+
+def test_has_new_data_revised():
+    latest_datetime_utc = datetime(2022, 1, 1, 12, tzinfo=timezone.utc)
+    latest_updated_utc = datetime(2022, 1, 1, 12, 45, tzinfo=timezone.utc)
+    gsps = make_gsps_with_last_yield(n_gsps=3, last_datetime_utc=datetime(2022, 1, 1, 12))
+    for gsp in gsps:
+        gsp.last_gsp_yield.pvlive_updated_utc = latest_updated_utc
+    assert not has_new_data(
+        gsps=gsps, latest_datetime_utc=latest_datetime_utc, latest_updated_utc=latest_updated_utc
+    )
+
+    # PVLive has revised the latest value since it was pulled
+    gsps[0].last_gsp_yield.pvlive_updated_utc = datetime(2022, 1, 1, 12, 15)
+    assert has_new_data(
+        gsps=gsps, latest_datetime_utc=latest_datetime_utc, latest_updated_utc=latest_updated_utc
+    )
+
+
+def test_get_gsps_read_session(db_connection, db_session):
+    gsps = get_gsps(session=db_session, n_gsps=2, regime="in-day")
+    gsp_yield = GSPYield(datetime_utc=datetime.now(timezone.utc), solar_generation_kw=1).to_orm()
+    gsp_yield.location = gsps[1]
+    db_session.add(gsp_yield)
+    db_session.commit()
+
+    with db_connection.get_session() as read_session:
+        gsps = get_gsps(session=db_session, n_gsps=2, regime="in-day", read_session=read_session)
+
+        # the gsps are in the main session, with the latest gsp yields from the read session
+        assert len(gsps) == 3
+        assert all(gsp in db_session for gsp in gsps)
+        assert not any(gsp in read_session for gsp in gsps)
+        last_gsp_yields = {gsp.gsp_id: gsp.last_gsp_yield for gsp in gsps}
+        assert last_gsp_yields[gsp_yield.location.gsp_id] is not None
+        assert sum(last_gsp_yield is None for last_gsp_yield in last_gsp_yields.values()) == 2
+
+        # and gsp yields can be saved for them with the main session
+        new_gsp_yield = GSPYield(datetime_utc=datetime(2022, 1, 2), solar_generation_kw=2).to_orm()
+        new_gsp_yield.location = gsps[0]
+        db_session.add(new_gsp_yield)
+        db_session.commit()
+
+
+def test_get_gsps_read_session_missing_national(db_connection, db_session):
+    with db_connection.get_session() as read_session:
+        # like a read replica
+        read_session.execute(text("SET TRANSACTION READ ONLY"))
+
+        # the missing gsps, including national, are added with the main session
+        gsps = get_gsps(session=db_session, n_gsps=2, regime="in-day", read_session=read_session)
+        db_session.commit()
+        assert sorted(gsp.gsp_id for gsp in gsps) == [0, 1, 2]
+        assert db_session.query(LocationSQL).count() == 3
+
+
+def test_get_publication_lags(db_session):
+    gsps = [Location(gsp_id=gsp_id, label=f"GSP_{gsp_id}").to_orm() for gsp_id in [1, 2, 3]]
+    datetime_utc = datetime(2022, 1, 2, tzinfo=timezone.utc)
+    for i in range(4):
+        # gsp 1 is published after 10 minutes, and gsp 2 after 40 minutes, apart from one value
+        # that was revised after 2 hours, which is ignored as it was first published earlier
+        gsp_datetime_utc = datetime_utc - timedelta(hours=i + 1)
+        for gsp, lag_minutes in [(gsps[0], 10), (gsps[1], 40)] + [(gsps[1], 120)] * (i == 0):
+            gsp_yield = GSPYield(
+                datetime_utc=gsp_datetime_utc,
+                solar_generation_kw=1,
+                pvlive_updated_utc=gsp_datetime_utc + timedelta(minutes=lag_minutes),
+            ).to_orm()
+            gsp_yield.location = gsp
+            db_session.add(gsp_yield)
+    db_session.add_all(gsps)
+    db_session.commit()
+
+    publication_lags = get_publication_lags(
+        session=db_session, gsps=gsps, regime="in-day", datetime_utc=datetime_utc
+    )
+
+    # gsp 3 has no history
+    assert publication_lags == {1: timedelta(minutes=10), 2: timedelta(minutes=40)}
+
+
+def test_get_publication_lags_error(db_session, monkeypatch):
+    gsps = [Location(gsp_id=1, label="GSP_1").to_orm()]
+    db_session.add_all(gsps)
+    db_session.commit()
+
+    broken_statement = text("select no_such_function(:regime)")
+    monkeypatch.setattr("pvliveconsumer.gsps.publication_lags_statement", broken_statement)
+
+    # the lags are not used, and the session can still be used
+    publication_lags = get_publication_lags(session=db_session, gsps=gsps, regime="in-day")
+    assert publication_lags == {}
+    assert db_session.query(LocationSQL).count() == 1
+
+
+def test_filter_gsps_which_have_new_data_publication_lags():
+    gsps = [Location(gsp_id=gsp_id, label=f"GSP_{gsp_id}").to_orm() for gsp_id in [1, 2]]
+    for gsp in gsps:
+        gsp.last_gsp_yield = GSPYield(
+            datetime_utc=datetime(2022, 1, 1, tzinfo=timezone.utc), solar_generation_kw=1
+        ).to_orm()
+
+    # the next value is for 00:30, gsp 1 publishes 10 minutes after, and gsp 2 40 minutes after
+    gsps_keep = filter_gsps_which_have_new_data(
+        gsps=gsps,
+        datetime_utc=datetime(2022, 1, 1, 0, 45, tzinfo=timezone.utc),
+        publication_lags={1: timedelta(minutes=10), 2: timedelta(minutes=40)},
+    )
+    assert [gsp.gsp_id for gsp in gsps_keep] == [1]
@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from pvliveconsumer.ingest import (
+    columns_from_dataframe,
+    concat_columns,
+    fetch_latest_datetimes,
+    make_latest_url,
+    make_url,
+    nearest_interval,
+    parse_response,
+)
+
+meta = [
+    "gsp_id",
+    "datetime_gmt",
+    "generation_mw",
+    "installedcapacity_mwp",
+    "capacity_mwp",
+    "updated_gmt",
+]
+
+
+def test_nearest_interval():
+    dt = datetime(2022, 1, 1, 10, 5, 3, tzinfo=timezone.utc)
+    assert nearest_interval(dt) == datetime(2022, 1, 1, 10, 30, tzinfo=timezone.utc)
+
+    dt = datetime(2022, 1, 1, 10, 30, tzinfo=timezone.utc)
+    assert nearest_interval(dt) == dt
+
+
+def test_make_url():
+    url = make_url(
+        domain_url="api.pvlive.uk",
+        gsp_id=3,
+        start=datetime(2022, 1, 1, tzinfo=timezone.utc),
+        end=datetime(2022, 1, 2, tzinfo=timezone.utc),
+    )
+    assert url.startswith("https://api.pvlive.uk/pvlive/api/v4/gsp/3?")
+    assert "start=2022-01-01T00:00:00Z" in url
+    assert "end=2022-01-02T00:00:00Z" in url
+
+
+def test_parse_response():
+    data = [
+        [1, "2022-01-01T00:30:00Z", 1.5, 10.0, 9.0, "2022-01-01T01:00:00Z"],
+        [1, "2022-01-01T00:00:00Z", None, 10.0, 9.0, None],
+    ]
+
+    columns = parse_response(data=data, meta=meta, gsp_id=1)
+
+    assert columns["datetime_gmt"].dtype == np.dtype("datetime64[s]")
+    assert columns["datetime_gmt"][0] == np.datetime64("2022-01-01T00:30:00")
+    assert columns["generation_mw"].dtype == np.float64
+    assert np.isnan(columns["generation_mw"][1])
+    assert np.isnat(columns["updated_gmt"][1])
+    assert list(columns["gsp_id"]) == [1, 1]
+
+
+def test_parse_response_empty():
+    columns = parse_response(data=[], meta=meta, gsp_id=1)
+
+    assert len(columns["gsp_id"]) == 0
+    assert len(columns["datetime_gmt"]) == 0
+
+
+def test_concat_columns():
+    data = [[1, "2022-01-01T00:30:00Z", 1.5, 10.0, 9.0, "2022-01-01T01:00:00Z"]]
+    columns_1 = parse_response(data=data, meta=meta, gsp_id=1)
+
+    night_time_df = pd.DataFrame(
+        {
+            "generation_mw": 0,
+            "datetime_gmt": pd.date_range("2022-01-01", periods=2, freq="30min", tz="UTC"),
+            "installedcapacity_mwp": 1.0,
+            "capacity_mwp": 1.0,
+            "updated_gmt": datetime(2022, 1, 1),
+        }
+    )
+    columns_2 = columns_from_dataframe(night_time_df, gsp_id=2)
+
+    gsp_yield_df = concat_columns([columns_1, columns_2])
+
+    assert len(gsp_yield_df) == 3
+    assert list(gsp_yield_df["gsp_id"]) == [1, 2, 2]
+    assert str(gsp_yield_df["datetime_gmt"].dt.tz) == "UTC"
+    assert gsp_yield_df["datetime_gmt"].iloc[1] == pd.Timestamp("2022-01-01", tz="UTC")
+
+
+def test_fetch_latest_datetimes(monkeypatch):
+    def fake_fetch_json(url, retries=3, timeout=30):
+        assert url == make_latest_url(domain_url="api.pvlive.uk")
+        return {
+            "data": [[0, "2022-01-01T11:30:00Z", 1000.0, "2022-01-01T11:45:00Z"]],
+            "meta": ["gsp_id", "datetime_gmt", "generation_mw", "updated_gmt"],
+        }
+
+    monkeypatch.setattr("pvliveconsumer.ingest.fetch_json", fake_fetch_json)
+
+    latest_datetime_utc, latest_updated_utc = fetch_latest_datetimes(domain_url="api.pvlive.uk")
+    assert latest_datetime_utc == datetime(2022, 1, 1, 11, 30, tzinfo=timezone.utc)
+    assert latest_updated_utc == datetime(2022, 1, 1, 11, 45, tzinfo=timezone.utc)
@@ -0,0 +1,46 @@
+from pvliveconsumer.memory import (
+    get_memory_report,
+    start_memory_tracking,
+    stop_memory_tracking,
+    track_memory,
+)
+
+
+def test_track_memory_not_started():
+    with track_memory(stage="transform"):
+        _ = [0] * 1000
+
+    assert get_memory_report() == {}
+
+
+def test_track_memory():
+    start_memory_tracking()
+    try:
+        with track_memory(stage="transform"):
+            data = [bytearray(1024) for _ in range(2048)]
+        # nested stages are only tracked by the outer stage
+        with track_memory(stage="save_to_database"):
+            with track_memory(stage="inner"):
+                _ = [0] * 1000
+    finally:
+        stop_memory_tracking()
+
+    report = get_memory_report()
+    assert set(report.keys()) == {"transform", "save_to_database"}
+    assert report["transform"]["peak_traced_mb"] >= 2
+    assert report["transform"]["peak_rss_mb"] > 0
+    assert "test_memory.py" in report["transform"]["top_allocations"][0]["line"]
+    assert len(data) == 2048
+
+
+def test_track_memory_keeps_largest_peak():
+    start_memory_tracking()
+    try:
+        with track_memory(stage="fetch"):
+            _ = bytearray(4 * 1024**2)
+        with track_memory(stage="fetch"):
+            _ = bytearray(1024)
+    finally:
+        stop_memory_tracking()
+
+    assert get_memory_report()["fetch"]["peak_traced_mb"] >= 4
@@ -0,0 +1,96 @@
+from datetime import datetime, timezone
+
+from nowcasting_datamodel.models.gsp import Location, LocationSQL
+
+from pvliveconsumer.ingest import make_all_gsps_url, make_latest_url
+from pvliveconsumer.metadata import (
+    fetch_pvlive_metadata,
+    find_metadata_changes,
+    get_location_metadata,
+    update_locations,
+)
+
+
+def fake_fetch_json(url, retries=3, timeout=30):
+    if url.endswith("gsp_list"):
+        return {
+            "data": [[0, "NATIONAL", 0], [1, "ABHA1", 10], [2, "ABNE_P", 11], [3, "ALNE_P", 12]],
+            "meta": ["gsp_id", "gsp_name", "pes_id"],
+        }
+
+    if url == make_latest_url(domain_url="api.pvlive.uk"):
+        return {
+            "data": [[0, "2022-01-01T12:00:00Z", 1000.0, "2022-01-01T12:15:00Z"]],
+            "meta": ["gsp_id", "datetime_gmt", "generation_mw", "updated_gmt"],
+        }
+
+    # all the gsps in one request, apart from gsp 3 which has no data
+    datetime_utc = datetime(2022, 1, 1, 12, tzinfo=timezone.utc)
+    fields = "installedcapacity_mwp"
+    assert url == make_all_gsps_url(
+        domain_url="api.pvlive.uk", datetime_utc=datetime_utc, fields=fields
+    )
+    return {
+        "data": [[gsp_id, "2022-01-01T12:00:00Z", 1.0, 100.0 + gsp_id] for gsp_id in range(3)],
+        "meta": ["gsp_id", "datetime_gmt", "generation_mw", "installedcapacity_mwp"],
+    }
+
+
+def add_locations(db_session):
+    locations = [
+        Location(gsp_id=0, label="national", installed_capacity_mw=100).to_orm(),
+        Location(gsp_id=1, label="GSP_1", gsp_name="ABHA1", installed_capacity_mw=1).to_orm(),
+        Location(gsp_id=2, label="GSP_2", installed_capacity_mw=102).to_orm(),
+        Location(gsp_id=3, label="GSP_3", gsp_name="ALNE_P", region_name="North").to_orm(),
+    ]
+    for location in locations:
+        if location.gsp_id != 2:
+            location.region_name = location.region_name or "region"
+    db_session.add_all(locations)
+    db_session.commit()
+
+
+def test_fetch_pvlive_metadata(monkeypatch):
+    urls = []
+
+    def counting_fetch_json(url, retries=3, timeout=30):
+        urls.append(url)
+        return fake_fetch_json(url)
+
+    monkeypatch.setattr("pvliveconsumer.metadata.fetch_json", counting_fetch_json)
+    monkeypatch.setattr("pvliveconsumer.ingest.fetch_json", counting_fetch_json)
+
+    # the gsp list, the latest datetime, and the capacities of all gsps
+    metadata_df = fetch_pvlive_metadata(domain_url="api.pvlive.uk")
+    assert len(urls) == 3
+    assert list(metadata_df["gsp_id"]) == [0, 1, 2, 3]
+    assert list(metadata_df["installed_capacity_mw"])[:3] == [100.0, 101.0, 102.0]
+    assert metadata_df["installed_capacity_mw"].isna().iloc[3]
+
+
+def test_refresh_metadata(db_session, monkeypatch):
+    monkeypatch.setattr("pvliveconsumer.metadata.fetch_json", fake_fetch_json)
+    monkeypatch.setattr("pvliveconsumer.ingest.fetch_json", fake_fetch_json)
+    add_locations(db_session)
+
+    location_df = get_location_metadata(session=db_session)
+    metadata_df = fetch_pvlive_metadata(domain_url="api.pvlive.uk")
+    changes = find_metadata_changes(location_df=location_df, pvlive_metadata_df=metadata_df)
+
+    # national is unchanged, gsp 1 has a new capacity, gsp 2 has a new name and region,
+    # and gsp 3 has no capacity in PVLive
+    changes_by_gsp_id = {
+        location_df.set_index("id").loc[change["id"], "gsp_id"]: change for change in changes
+    }
+    assert set(changes_by_gsp_id.keys()) == {1, 2}
+    assert changes_by_gsp_id[1]["installed_capacity_mw"] == 101
+    assert changes_by_gsp_id[2]["gsp_name"] == "ABNE_P"
+    assert changes_by_gsp_id[2]["region_name"] == "ABNE_P"
+
+    update_locations(session=db_session, changes=changes)
+
+    locations = {location.gsp_id: location for location in db_session.query(LocationSQL).all()}
+    assert locations[1].installed_capacity_mw == 101
+    assert locations[2].gsp_name == "ABNE_P"
+    assert locations[2].installed_capacity_mw == 102
+    assert locations[3].region_name == "North"
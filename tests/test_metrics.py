@@ -0,0 +1,61 @@
+from datetime import datetime, timezone
+
+from pvliveconsumer.metrics import (
+    export_metrics,
+    observe_freshness,
+    registry,
+    rows_written,
+    stage_timer,
+)
+
+
+def test_stage_timer():
+    with stage_timer("test_stage"):
+        pass
+
+    count = registry.get_sample_value(
+        "pvliveconsumer_stage_duration_seconds_count", {"stage": "test_stage"}
+    )
+    assert count == 1
+
+
+def test_export_metrics(tmp_path, monkeypatch):
+    metrics_file = str(tmp_path / "pvliveconsumer.prom")
+    monkeypatch.setenv("METRICS_FILE", metrics_file)
+
+    rows_written.labels(regime="in-day").inc(10)
+    export_metrics()
+
+    with open(metrics_file) as f:
+        text = f.read()
+    assert "pvliveconsumer_rows_written_total" in text
+    assert "pvliveconsumer_stage_duration_seconds_bucket" in text
+
+
+def test_export_metrics_error(monkeypatch):
+    monkeypatch.setenv("METRICS_FILE", "/this/folder/does/not/exist/metrics.prom")
+
+    # errors are logged, not raised
+    export_metrics()
+
+
+def test_observe_freshness():
+    commit_datetime_utc = datetime(2022, 1, 1, 12, tzinfo=timezone.utc)
+    gsp_yield_values = [
+        ("day-after", datetime(2022, 1, 1, 11), datetime(2022, 1, 1, 11, 50)),
+        ("day-after", datetime(2022, 1, 1, 11, 30, tzinfo=timezone.utc), None),
+    ]
+
+    before = registry.get_sample_value(
+        "pvliveconsumer_data_to_commit_seconds_sum", {"regime": "day-after"}
+    )
+    observe_freshness(gsp_yield_values=gsp_yield_values, commit_datetime_utc=commit_datetime_utc)
+
+    data_to_commit = registry.get_sample_value(
+        "pvliveconsumer_data_to_commit_seconds_sum", {"regime": "day-after"}
+    )
+    assert data_to_commit - (before or 0) == 3600 + 1800
+    publish_to_commit_count = registry.get_sample_value(
+        "pvliveconsumer_publish_to_commit_seconds_count", {"regime": "day-after"}
+    )
+    assert publish_to_commit_count >= 1
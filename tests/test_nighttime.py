@@ -50,3 +50,13 @@ def test_make_night_time_zeros_with_last_gsp_yield(db_session):
     assert len(result) == 36
     assert result["generation_mw"].sum() == 0
     assert result["capacity_mwp"][0] == 1.1
+
+
+def test_make_night_time_zeros_no_location():
+    start = datetime(2021, 1, 1)
+    end = datetime(2021, 1, 2)
+    gsp = LocationSQL(gsp_id=5)
+
+    result = make_night_time_zeros(start, end, gsp, pd.DataFrame(), "in-day")
+
+    assert len(result) == 0
@@ -0,0 +1,43 @@
+import time
+
+from pvliveconsumer.profiling import SamplingProfiler, profile
+
+
+def busy_function(seconds: float):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += 1
+    return total
+
+
+def test_sampling_profiler():
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    busy_function(0.2)
+    profiler.stop()
+
+    assert profiler.n_samples > 10
+    top_functions = profiler.top_functions(n=5)
+    assert "busy_function" in top_functions[0][0]
+    # total samples are always at least the self samples
+    assert all(total >= self for _, self, total in top_functions)
+
+
+def test_profile(tmp_path):
+    output_file = str(tmp_path / "profile.folded")
+
+    with profile(output_file=output_file, interval=0.001):
+        busy_function(0.1)
+
+    with open(output_file) as f:
+        lines = f.readlines()
+    assert len(lines) > 0
+    stack, count = lines[0].rsplit(" ", 1)
+    assert "busy_function" in stack
+    assert int(count) > 0
+
+
+def test_profile_off():
+    with profile(output_file=None):
+        busy_function(0.01)
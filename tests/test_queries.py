@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+
+from nowcasting_datamodel.models.gsp import GSPYield, Location
+
+from pvliveconsumer.queries import (
+    gsp_yields_statement,
+    latest_gsp_yields_statement,
+)
+
+
+def add_gsp_yields(db_session):
+    for gsp_id in range(3):
+        location = Location(gsp_id=gsp_id, label=f"GSP_{gsp_id}").to_orm()
+        for hour in range(2):
+            gsp_yield = GSPYield(
+                datetime_utc=datetime(2022, 1, 1, hour, tzinfo=timezone.utc),
+                solar_generation_kw=hour,
+                regime="in-day",
+            ).to_orm()
+            gsp_yield.location = location
+            db_session.add(gsp_yield)
+    db_session.commit()
+
+
+def test_latest_gsp_yields_statement(db_session):
+    add_gsp_yields(db_session)
+    start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+    # the same statement is used for any number of gsps
+    for gsp_ids in [[0], [0, 1, 2]]:
+        rows = db_session.execute(
+            latest_gsp_yields_statement, {"regime": "in-day", "start": start, "gsp_ids": gsp_ids}
+        ).all()
+        assert [gsp_id for gsp_id, _ in rows] == gsp_ids
+        assert all(gsp_yield.solar_generation_kw == 1 for _, gsp_yield in rows)
+
+
+def test_gsp_yields_statement(db_session):
+    add_gsp_yields(db_session)
+
+    gsp_yields = (
+        db_session.execute(
+            gsp_yields_statement,
+            {
+                "regime": "in-day",
+                "start": datetime(2022, 1, 1, tzinfo=timezone.utc),
+                "end": datetime(2022, 1, 2, tzinfo=timezone.utc),
+                "gsp_ids": [0],
+            },
+        )
+        .scalars()
+        .all()
+    )
+    assert len(gsp_yields) == 2
+    assert gsp_yields[0].location.gsp_id == 0
+
@@ -0,0 +1,84 @@
+from datetime import datetime, timezone
+
+import numpy as np
+from click.testing import CliRunner
+from nowcasting_datamodel.models.gsp import GSPYieldSQL, Location
+
+from pvliveconsumer.archive import write_archive
+from pvliveconsumer.ingest import concat_columns
+from pvliveconsumer.replay import replay, replay_archive
+
+
+def add_archive(archive_dir: str):
+    datetimes = np.array(
+        ["2022-01-01T23:00", "2022-01-01T23:30", "2022-01-02T00:00"], dtype="datetime64[s]"
+    )
+    all_columns = []
+    for gsp_id in [0, 1, 2]:
+        all_columns.append(
+            {
+                "gsp_id": np.full(3, gsp_id, dtype=np.int64),
+                "datetime_gmt": datetimes,
+                "updated_gmt": datetimes,
+                "generation_mw": np.array([3.0, 2.0, 1.0]),
+                "installedcapacity_mwp": np.full(3, 10.0),
+                "capacity_mwp": np.full(3, 10.0),
+            }
+        )
+    write_archive(
+        archive_dir=archive_dir, gsp_yield_df=concat_columns(all_columns), regime="day-after"
+    )
+
+
+def test_replay_archive(db_session, tmp_path):
+    archive_dir = str(tmp_path)
+    add_archive(archive_dir)
+
+    gsps = [
+        Location(gsp_id=gsp_id, label=f"GSP_{gsp_id}", installed_capacity_mw=1).to_orm()
+        for gsp_id in [0, 1]
+    ]
+
+    for _ in range(2):
+        replay_archive(
+            session=db_session,
+            gsps=gsps,
+            archive_dir=archive_dir,
+            regime="day-after",
+            start=datetime(2022, 1, 1, tzinfo=timezone.utc),
+            end=datetime(2022, 1, 3, tzinfo=timezone.utc),
+        )
+
+    # gsp 2 is not in the gsps, and replaying twice does not add the values again
+    gsp_yields = db_session.query(GSPYieldSQL).all()
+    assert len(gsp_yields) == 2 * 3
+    assert {gsp_yield.regime for gsp_yield in gsp_yields} == {"day-after"}
+
+    # the archived capacity does not replace the current capacity
+    assert gsps[1].installed_capacity_mw == 1
+
+
+def test_replay(db_connection, tmp_path):
+    archive_dir = str(tmp_path)
+    add_archive(archive_dir)
+
+    response = CliRunner().invoke(
+        replay,
+        [
+            "--db-url",
+            db_connection.url,
+            "--archive-dir",
+            archive_dir,
+            "--n-gsps",
+            "2",
+            "--start",
+            "2022-01-01",
+            "--end",
+            "2022-01-02",
+        ],
+    )
+    assert response.exit_code == 0, response.exception
+
+    with db_connection.get_session() as session:
+        # two values before the end, for national and 2 gsps
+        assert session.query(GSPYieldSQL).count() == 2 * 3
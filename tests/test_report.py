@@ -0,0 +1,65 @@
+import json
+
+from pvliveconsumer.report import (
+    get_report,
+    record_backup,
+    record_capacity_update,
+    record_changes,
+    record_counts,
+    record_fetch,
+    record_n_wasted_requests,
+    record_night_time_zeros,
+    record_retry,
+    start_report,
+    write_report,
+)
+
+
+def test_report(tmp_path):
+    start_report(regime="in-day")
+    record_retry()
+    record_fetch(gsp_id=1, fetch_seconds=0.5, n_received=10, retries=1)
+    record_fetch(gsp_id=2, fetch_seconds=0.25, n_received=0)
+    record_night_time_zeros(gsp_id=2, n_gsp_yields=4)
+    record_capacity_update(gsp_id=1, old_capacity=10.0, new_capacity=12.0)
+    record_counts(name="n_filtered", counts={1: 8, 2: 4})
+    record_counts(name="n_written", counts={1: 3})
+    record_backup(n_gsp_yields=5)
+    record_n_wasted_requests(n_wasted_requests=1)
+    record_changes(counts={"inserted": 2, "revised": 1, "skipped": 5})
+    record_changes(counts={"inserted": 1, "revised": 0, "skipped": 3})
+
+    report = get_report()
+    assert report["regime"] == "in-day"
+    assert report["retries"] == 1
+    assert report["n_backup_gsp_yields"] == 5
+    assert report["n_wasted_requests"] == 1
+    assert (report["n_inserted"], report["n_revised"], report["n_skipped"]) == (3, 1, 8)
+    assert report["n_gsps"] == 2
+    assert report["wall_time_seconds"] >= 0
+    assert report["gsps"]["1"] == {
+        "fetch_seconds": 0.5,
+        "retries": 1,
+        "n_received": 10,
+        "capacity_update": [10.0, 12.0],
+        "n_filtered": 8,
+        "n_written": 3,
+    }
+    assert report["gsps"]["2"]["night_time_zeros"] == 4
+
+    report_file = str(tmp_path / "report.json")
+    write_report(report_file=report_file)
+    with open(report_file) as f:
+        assert json.load(f)["gsps"]["2"]["n_filtered"] == 4
+
+
+def test_start_report_resets():
+    start_report(regime="in-day")
+    record_retry()
+    record_fetch(gsp_id=1, fetch_seconds=0.5, n_received=10)
+
+    start_report(regime="day-after")
+    report = get_report()
+    assert report["regime"] == "day-after"
+    assert report["retries"] == 0
+    assert report["gsps"] == {}
@@ -0,0 +1,75 @@
+import json
+from datetime import datetime, timezone
+
+from nowcasting_datamodel.models.gsp import GSPYield, LocationSQL
+
+from pvliveconsumer.gsps import get_gsps
+from pvliveconsumer.snapshot import get_location_checksum, get_locations_from_snapshot
+
+gsp_ids = [0, 1, 2]
+
+
+def test_get_gsps_with_snapshot(db_session, tmp_path):
+    snapshot_file = str(tmp_path / "locations.json")
+
+    # the locations are not in the database yet, so no snapshot is made
+    gsps = get_gsps(session=db_session, n_gsps=2, snapshot_file=snapshot_file)
+    assert len(gsps) == 3
+    assert not (tmp_path / "locations.json").exists()
+
+    # the snapshot is made from the locations in the database
+    gsps = get_gsps(session=db_session, n_gsps=2, snapshot_file=snapshot_file)
+    assert sorted(gsp.gsp_id for gsp in gsps) == gsp_ids
+    with open(snapshot_file) as f:
+        snapshot = json.load(f)
+    assert [location["gsp_id"] for location in snapshot["locations"]] == gsp_ids
+
+    # and then used
+    gsps = get_gsps(session=db_session, n_gsps=2, snapshot_file=snapshot_file)
+    assert sorted(gsp.gsp_id for gsp in gsps) == gsp_ids
+
+
+def test_get_locations_from_snapshot(db_session, tmp_path):
+    snapshot_file = str(tmp_path / "locations.json")
+    get_gsps(session=db_session, n_gsps=2)
+    db_session.commit()
+
+    locations = get_locations_from_snapshot(
+        session=db_session, snapshot_file=snapshot_file, gsp_ids=gsp_ids
+    )
+    ids = {location.gsp_id: location.id for location in locations}
+
+    # locations made from the snapshot can have gsp yields added, and capacity updated
+    location = locations[1]
+    location.installed_capacity_mw = 10
+    gsp_yield = GSPYield(
+        datetime_utc=datetime(2022, 1, 1, tzinfo=timezone.utc), solar_generation_kw=1
+    ).to_orm()
+    gsp_yield.location = location
+    db_session.add(gsp_yield)
+    db_session.commit()
+
+    location_sql = db_session.query(LocationSQL).filter(LocationSQL.id == ids[1]).one()
+    assert location_sql.installed_capacity_mw == 10
+    assert location_sql.label is not None
+    assert len(location_sql.gsp_yields) == 1
+
+    # the capacity has changed, so the snapshot is rebuilt
+    checksum = get_location_checksum(session=db_session, gsp_ids=gsp_ids)
+    locations = get_locations_from_snapshot(
+        session=db_session, snapshot_file=snapshot_file, gsp_ids=gsp_ids
+    )
+    with open(snapshot_file) as f:
+        snapshot = json.load(f)
+    assert snapshot["checksum"] == checksum
+    assert {location.gsp_id: location.id for location in locations} == ids
+
+
+def test_get_locations_from_snapshot_missing(db_session, tmp_path):
+    snapshot_file = str(tmp_path / "locations.json")
+    get_gsps(session=db_session, n_gsps=1)
+
+    locations = get_locations_from_snapshot(
+        session=db_session, snapshot_file=snapshot_file, gsp_ids=gsp_ids
+    )
+    assert locations is None
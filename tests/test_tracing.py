@@ -0,0 +1,21 @@
+from contextlib import nullcontext
+
+import pvliveconsumer.tracing
+from pvliveconsumer.tracing import span, transaction
+
+
+def test_tracing_disabled():
+    assert isinstance(transaction(name="test", op="in-day"), nullcontext)
+    assert isinstance(span(op="test"), nullcontext)
+
+
+def test_tracing_enabled(monkeypatch):
+    monkeypatch.setattr(pvliveconsumer.tracing, "tracing_enabled", True)
+
+    with transaction(name="test", op="in-day") as t:
+        with span(op="test", description="GSP 1") as s:
+            pass
+
+    assert t.op == "in-day"
+    assert s.op == "test"
+    assert s.description == "GSP 1"
@@ -0,0 +1,87 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from pvliveconsumer.transform import make_gsp_yields_sql, transform_gsp_yields
+
+start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+end = datetime(2022, 1, 1, 2, tzinfo=timezone.utc)
+
+
+def make_pvlive_df(gsp_id: int, generation_mw, capacity_mwp=1.0) -> pd.DataFrame:
+    n = len(generation_mw)
+    return pd.DataFrame(
+        {
+            "gsp_id": gsp_id,
+            "datetime_gmt": pd.date_range(start, periods=n, freq="30min"),
+            "generation_mw": generation_mw,
+            "installedcapacity_mwp": 2.0,
+            "capacity_mwp": capacity_mwp,
+            "updated_gmt": "2022-01-01T03:00:00Z",
+        }
+    )
+
+
+def test_transform_gsp_yields():
+    gsp_yield_df = pd.concat(
+        [
+            make_pvlive_df(gsp_id=1, generation_mw=[1.0, 2.0, 3.0, np.nan, 5.0]),
+            make_pvlive_df(gsp_id=2, generation_mw=[1.0, 2.0, 3.0, 4.0]),
+            make_pvlive_df(gsp_id=3, generation_mw=[np.nan, np.nan], capacity_mwp=0),
+        ],
+        ignore_index=True,
+    )
+
+    result = transform_gsp_yields(gsp_yield_df=gsp_yield_df, start=start, end=end, regime="in-day")
+
+    # gsp 1: 02:00 is filtered by the end datetime, and the nan is dropped
+    gsp_1 = result[result["gsp_id"] == 1]
+    assert list(gsp_1["solar_generation_kw"]) == [1000, 2000, 3000]
+
+    # gsp 2: all the data in the window is kept, so revised values can be found
+    gsp_2 = result[result["gsp_id"] == 2]
+    assert list(gsp_2["solar_generation_kw"]) == [1000, 2000, 3000, 4000]
+
+    # gsp 3: capacity is zero, so generation is set to zero
+    gsp_3 = result[result["gsp_id"] == 3]
+    assert list(gsp_3["solar_generation_kw"]) == [0, 0]
+
+    assert (result["regime"] == "in-day").all()
+    assert result["pvlive_updated_utc"].iloc[0] == datetime(2022, 1, 1, 3, tzinfo=timezone.utc)
+
+
+def test_transform_gsp_yields_all_nans():
+    gsp_yield_df = make_pvlive_df(gsp_id=1, generation_mw=[np.nan, np.nan])
+
+    result = transform_gsp_yields(gsp_yield_df=gsp_yield_df, start=start, end=end, regime="in-day")
+
+    # all values are nan, so they are kept
+    assert len(result) == 2
+
+
+def test_make_gsp_yields_sql(make_gsps):
+    gsps = make_gsps(gsp_ids=[1, 2, 3], installed_capacity_mw=1)
+    gsp_yield_df = pd.concat(
+        [
+            make_pvlive_df(gsp_id=1, generation_mw=[1.0, 2.0]),
+            make_pvlive_df(gsp_id=3, generation_mw=[1.0]),
+        ],
+        ignore_index=True,
+    )
+    gsp_yield_df = transform_gsp_yields(
+        gsp_yield_df=gsp_yield_df, start=start, end=end, regime="in-day"
+    )
+
+    gsp_yields_sql = make_gsp_yields_sql(gsp_yield_df=gsp_yield_df, gsps=gsps)
+
+    assert len(gsp_yields_sql) == 3
+    assert gsp_yields_sql[0].location.gsp_id == 1
+    assert gsp_yields_sql[2].location.gsp_id == 3
+    assert gsps[0].installed_capacity_mw == 2.0
+    assert gsps[1].installed_capacity_mw == 1
+
+    # historical data does not change the capacity
+    gsps = make_gsps(gsp_ids=[1, 2, 3], installed_capacity_mw=1)
+    make_gsp_yields_sql(gsp_yield_df=gsp_yield_df, gsps=gsps, update_capacity=False)
+    assert gsps[0].installed_capacity_mw == 1